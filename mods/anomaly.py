@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Residual-based anomaly scoring
+
+The residuals of the forecasts (actual - predicted) are scored per feature
+against their exponentially weighted moving mean and variance:
+
+    score = (r - mean) / max(std, min_std)
+    mean  = alpha * r + (1 - alpha) * mean
+    var   = (1 - alpha) * (alpha * (r - mean_before) ** 2 + var)
+
+The score of a window uses the statistics before the window is added. The
+state is O(features), so the scorer runs over arbitrarily long streams; a
+batch of windows is scored by linear filters giving the same scores as
+the window by window updates:
+
+    scorer = ResidualScorer(features)
+    result = scorer.update(actual, predicted)     # one window or a batch
+
+A window is anomalous in a feature when |score| exceeds the threshold; the
+onsets mark the crossings of the threshold from below. No window is scored
+until the statistics have seen the warmup windows.
+
+@author: stefan dlugolinsky
+"""
+
+import numpy as np
+
+import mods.config as cfg
+
+
+class ResidualScorer:
+
+    def __init__(self, features, alpha=None, threshold=None, warmup=None, min_std=None):
+        """
+        Parameters
+        ----------
+        features : int
+            Number of features
+        alpha : float
+            Smoothing factor of the moving mean and variance; cfg.anomaly_alpha by default
+        threshold : float
+            Anomaly threshold of |score|; cfg.anomaly_threshold by default
+        warmup : int
+            Windows seen before scoring; cfg.anomaly_warmup by default
+        min_std : float
+            Floor of the standard deviation; cfg.anomaly_min_std by default
+        """
+        self.features = features
+        self.alpha = cfg.anomaly_alpha if alpha is None else alpha
+        self.threshold = cfg.anomaly_threshold if threshold is None else threshold
+        self.warmup = cfg.anomaly_warmup if warmup is None else warmup
+        self.min_std = cfg.anomaly_min_std if min_std is None else min_std
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = np.zeros(self.features)
+        self.var = np.zeros(self.features)
+        self.above = np.zeros(self.features, dtype=bool)
+
+    def update(self, actual, predicted):
+        """
+        Scores the windows and adds their residuals to the statistics
+
+        Parameters
+        ----------
+        actual, predicted : array-like
+            (features,) or (windows, features); windows with a missing value are not scored
+            and do not change the statistics
+
+        Returns
+        -------
+        dict
+            scores (windows, features), score (windows,) - the max |score| of a window,
+            anomalous (windows, features) and onsets (windows, features); a single window
+            is returned without the windows dimension
+        """
+        actual = np.asarray(actual, dtype=np.float64)
+        single = actual.ndim == 1
+        residuals = np.atleast_2d(actual - np.asarray(predicted, dtype=np.float64))
+
+        scores = np.full(residuals.shape, np.nan)
+        known = ~np.isnan(residuals).any(axis=1)
+        if known.all():
+            scores = self.__score(residuals, scores)
+        elif known.any():
+            scores[known] = self.__score(residuals[known], scores[known])
+
+        anomalous = np.abs(np.nan_to_num(scores)) > self.threshold
+        # crossings of the threshold from below, continuing from the previous update
+        previous = np.vstack([self.above, anomalous[:-1]])
+        onsets = anomalous & ~previous
+        self.above = anomalous[-1]
+
+        with np.errstate(invalid='ignore'):
+            score = np.max(np.abs(scores), axis=1)
+        result = {
+            'scores': scores,
+            'score': score,
+            'anomalous': anomalous,
+            'onsets': onsets
+        }
+        if single:
+            result = {name: value[0] for name, value in result.items()}
+        return result
+
+    def __score(self, residuals, scores):
+        alpha = self.alpha
+        beg = 0
+        if self.count == 0:
+            # the first residual initializes the mean
+            self.mean = residuals[0].copy()
+            beg = 1
+        r = residuals[beg:]
+        n = len(r)
+        if n == 1:
+            mean_before = self.mean[np.newaxis]
+            var_before = self.var[np.newaxis]
+            diff = r - mean_before
+            self.mean = alpha * r[0] + (1 - alpha) * self.mean
+            self.var = (1 - alpha) * alpha * np.square(diff[0]) + (1 - alpha) * self.var
+        elif n > 1:
+            from scipy.signal import lfilter
+
+            coef = [1, alpha - 1]
+            mean = lfilter([alpha], coef, r, axis=0, zi=((1 - alpha) * self.mean)[np.newaxis])[0]
+            mean_before = np.vstack([self.mean, mean[:-1]])
+            diff = r - mean_before
+            var = lfilter([1], coef, (1 - alpha) * alpha * np.square(diff), axis=0,
+                          zi=((1 - alpha) * self.var)[np.newaxis])[0]
+            var_before = np.vstack([self.var, var[:-1]])
+            self.mean = mean[-1]
+            self.var = var[-1]
+
+        if n > 0:
+            # the windows seen before the warmup ends are not scored
+            seen = self.count + beg + np.arange(n)
+            # the floor keeps the score of a change of a so far constant residual finite (valid in json)
+            score = diff / np.maximum(np.sqrt(var_before), self.min_std)
+            score[seen < self.warmup] = np.nan
+            scores[beg:] = score
+        self.count += len(residuals)
+        return scores
+
+
+def score_predictions(model, df, predictions, scorer=None):
+    """
+    Scores the predictions of mods_model.predict against the known values of
+    the data; the (first) horizon forecasts are scored
+
+    Returns
+    -------
+    dict
+        scores and score of every prediction (None if its actual value is not known),
+        threshold and the onsets of anomalies; a list of {'window', 'features'}
+    """
+    targets = model.get_horizon_targets(df)
+    predictions = np.asarray(predictions)
+    if model.is_multi_horizon():
+        actual, predicted = targets[:, 0], predictions[:, 0]
+    else:
+        actual, predicted = targets[:, -1], predictions
+
+    if scorer is None:
+        scorer = ResidualScorer(actual.shape[1])
+    result = scorer.update(actual, predicted)
+
+    columns = [str(c) for c in df.columns] if hasattr(df, 'columns') else list(range(actual.shape[1]))
+    onsets = [
+        {'window': int(i), 'features': [columns[j] for j in np.flatnonzero(result['onsets'][i])]}
+        for i in np.flatnonzero(result['onsets'].any(axis=1))
+    ]
+    return {
+        'threshold': scorer.threshold,
+        'scores': [None if np.isnan(s).all() else s.tolist() for s in result['scores']],
+        'score': [None if np.isnan(s) else float(s) for s in result['score']],
+        'anomalies': onsets
+    }
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Throughput of the residual anomaly scoring in windows per second
+
+Scores random residuals with injected spikes in batches (batch predict)
+and window by window (streaming), checks that both give the same scores
+and reports the detected spikes; e.g.,
+
+    python -m mods.benchmarks.bench_anomaly --windows 525600 --features 8
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from mods.anomaly import ResidualScorer
+
+
+def data(windows, features, spikes):
+    rnd = np.random.RandomState(0)
+    actual = np.cumsum(rnd.randn(windows, features), axis=0) + 1000
+    predicted = actual + rnd.randn(windows, features)
+    positions = rnd.choice(np.arange(windows // 10, windows), size=spikes, replace=False)
+    actual[positions, rnd.randint(0, features, size=spikes)] += 50
+    return actual, predicted, np.sort(positions)
+
+
+def main():
+    actual, predicted, spikes = data(args.windows, args.features, args.spikes)
+
+    batch = ResidualScorer(args.features)
+    start = time.time()
+    scores = []
+    for beg in range(0, args.windows, args.batch):
+        scores.append(batch.update(actual[beg:beg + args.batch], predicted[beg:beg + args.batch])['onsets'])
+    batch_time = time.time() - start
+    onsets = np.vstack(scores)
+
+    streaming = ResidualScorer(args.features)
+    windows = min(args.windows, args.streaming_windows)
+    streaming_scores = np.empty((windows, args.features))
+    start = time.time()
+    for i in range(windows):
+        streaming_scores[i] = streaming.update(actual[i], predicted[i])['scores']
+    streaming_time = time.time() - start
+
+    batch_scores = ResidualScorer(args.features).update(actual[:windows], predicted[:windows])['scores']
+    same = np.allclose(streaming_scores, batch_scores, equal_nan=True)
+
+    detected = np.flatnonzero(onsets.any(axis=1))
+    print('batch:     %10.0f windows/s (%d windows, %d features, batch %d)' % (
+        args.windows / batch_time, args.windows, args.features, args.batch))
+    print('streaming: %10.0f windows/s (%d windows)' % (windows / streaming_time, windows))
+    print('streaming scores == batch scores: %s' % same)
+    print('spikes: %d injected, %d detected, %d onsets in total' % (
+        len(spikes), len(np.intersect1d(spikes, detected)), len(detected)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Anomaly scoring benchmark')
+    parser.add_argument('--windows', type=int, default=525600, help='e.g., a year of minute windows')
+    parser.add_argument('--features', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=100000, help='windows scored at once')
+    parser.add_argument('--streaming_windows', type=int, default=100000)
+    parser.add_argument('--spikes', type=int, default=20)
+    args = parser.parse_args()
+    main()
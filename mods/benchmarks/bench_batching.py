@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Load test of the micro-batching of concurrent predictions
+
+Client threads predict the last forecasts of random data by the same
+model (forecast_only requests of 1..--max_forecasts windows) for
+--duration seconds, without and with the PredictBatcher; throughput and
+latency percentiles are reported and the predictions of both runs are
+compared; e.g.,
+
+    python -m mods.benchmarks.bench_batching --clients 16 --duration 10
+    python -m mods.benchmarks.bench_batching --model_file models/_default_/model.zip --engine keras
+
+Without --model_file, a random LSTM model is run by the numpy engine.
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import mods.config as cfg
+from mods.models.batcher import PredictBatcher
+from mods.tests.helpers import random_model
+
+
+def data(features):
+    rnd = np.random.RandomState(0)
+    return pd.DataFrame(np.cumsum(rnd.randn(args.rows, features), axis=0) + 1000,
+                        columns=['feature_%d' % i for i in range(features)])
+
+
+def load():
+    if args.model_file:
+        import os
+        from mods.models.api_v2 import load_model
+        model = load_model(os.path.basename(args.model_file), os.path.dirname(args.model_file), engine=args.engine)
+        return model, data(model.get_multivariate())
+    df = data(args.features)
+    return random_model(np.random.RandomState(0), df, delta=True, horizons=1, sequence_len=args.sequence_len,
+                        units=12), df
+
+
+def run(model, df, batcher):
+    model.batcher = batcher
+    requests = []
+    lock = threading.Lock()
+    stop = time.time() + args.duration
+
+    def client(seed):
+        rnd = np.random.RandomState(seed)
+        done = []
+        while time.time() < stop:
+            forecasts = rnd.randint(1, args.max_forecasts + 1)
+            end = rnd.randint(model.get_history_len(forecasts), len(df) + 1)
+            start = time.time()
+            model.predict(df.iloc[end - model.get_history_len(forecasts):end])
+            done.append((time.time() - start, forecasts))
+        with lock:
+            requests.extend(done)
+
+    if args.engine == 'keras':
+        import keras.backend.tensorflow_backend as tb
+
+        def target(seed):
+            tb._SYMBOLIC_SCOPE.value = True
+            client(seed)
+    else:
+        target = client
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(args.clients)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    latency = np.array([r[0] for r in requests]) * 1000
+    windows = sum(r[1] for r in requests)
+    label = 'batched' if batcher is not None else 'unbatched'
+    print('%-9s %8.0f req/s %9.0f windows/s   latency ms p50 %6.2f p95 %6.2f p99 %6.2f max %7.2f' % (
+        label, len(requests) / elapsed, windows / elapsed,
+        np.percentile(latency, 50), np.percentile(latency, 95), np.percentile(latency, 99), latency.max()))
+    if batcher is not None and batcher.batches:
+        print('          %d forward passes, %.1f requests per pass' % (batcher.batches, batcher.requests / batcher.batches))
+
+
+def main():
+    model, df = load()
+
+    print('%d clients, 1..%d windows per request, %s engine' % (args.clients, args.max_forecasts, args.engine))
+    run(model, df, None)
+    batcher = PredictBatcher(model.model, max_delay=args.max_delay, max_batch=args.max_batch, engine=args.engine)
+    run(model, df, batcher)
+
+    # the batched forward pass gives the same predictions
+    tail = df.tail(model.get_history_len(args.max_forecasts))
+    model.batcher = None
+    expected = model.predict(tail)
+    model.batcher = batcher
+    print('batched predictions == unbatched: %s' % np.allclose(model.predict(tail), expected, rtol=1e-6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-batching load test')
+    parser.add_argument('--model_file', default=None)
+    parser.add_argument('--engine', default='numpy', choices=cfg.inference_engines)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of each run')
+    parser.add_argument('--max_forecasts', type=int, default=8, help='windows of a request: 1..max_forecasts')
+    parser.add_argument('--max_delay', type=float, default=cfg.predict_batch_delay)
+    parser.add_argument('--max_batch', type=int, default=cfg.predict_batch_max)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--features', type=int, default=4)
+    parser.add_argument('--sequence_len', type=int, default=12)
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Serialization cost and size of the predict response formats
+
+The predictions are put into a response message (see
+api_v2.format_predictions) and the message is serialized to JSON the way
+the API does, with the JSONEncoder patched by mods.mods_types; e.g.,
+
+    python -m mods.benchmarks.bench_formats --windows 43200 --features 4 --horizons 1
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import importlib.util
+import json
+import time
+
+import numpy as np
+
+import mods.config as cfg
+import mods.mods_types  # noqa: F401 - patches the JSONEncoder
+from mods.formats import decode
+from mods.models.api_v2 import format_predictions
+
+
+def main():
+    rnd = np.random.RandomState(0)
+    shape = (args.windows, args.features) if args.horizons == 1 else (args.windows, args.horizons, args.features)
+    predictions = rnd.rand(*shape) * 1000
+    columns = ['feature_%d' % i for i in range(args.features)]
+
+    formats = [f for f in cfg.response_formats if f != 'arrow' or importlib.util.find_spec('pyarrow')]
+    print('%d windows, shape %s' % (args.windows, shape))
+    for response_format in formats:
+        times = []
+        for _ in range(args.repeat):
+            start = time.time()
+            message = format_predictions({}, predictions, columns, {
+                'page': None, 'page_size': None, 'response_format': response_format
+            })
+            body = json.dumps(message)
+            times.append(time.time() - start)
+        payload = message['predictions']
+        if response_format == 'json':
+            payload = {'format': 'json', 'shape': list(shape), 'data': payload}
+        restored = decode(json.loads(body)['predictions'] if response_format != 'json' else payload)
+        print('%-9s %10.1f ms %12d bytes  lossless=%s' % (
+            response_format, min(times) * 1000, len(body), np.array_equal(restored, predictions)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Response format benchmark')
+    parser.add_argument('--windows', type=int, default=43200, help='e.g., a month of minute windows')
+    parser.add_argument('--features', type=int, default=4)
+    parser.add_argument('--horizons', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    main()
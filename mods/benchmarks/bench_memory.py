@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Peak RSS per pipeline stage with and without the memory lean mode
+
+The data preparation of the training (read, repair, delta, scaling and
+windowing) is run on synthetic counters. Peak RSS never decreases, so each
+mode runs in a fresh process; e.g.,
+
+    python -m mods.benchmarks.bench_memory --rows 2000000 --features 8
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+import mods.config as cfg
+import mods.models.mods_model as MODS
+import mods.utils as utl
+
+
+def generate(file, rows, features):
+    # counters as they come from the data pool
+    rnd = np.random.RandomState(0)
+    pd.DataFrame(
+        np.cumsum(rnd.randint(0, 1000, size=(rows, features)), axis=0),
+        columns=['f%d' % i for i in range(features)]
+    ).to_csv(file, sep='\t', index=False)
+
+
+def pipeline(file, sequence_len):
+    report = utl.log_memory('start', {})
+
+    df = pd.read_csv(file, sep='\t')
+    if cfg.memory_lean:
+        df = utl.downcast(df)
+    utl.log_memory('read', report)
+
+    df = utl.fix_missing_num_values(df)
+    utl.log_memory('fix_missing_num_values', report)
+
+    model = MODS.mods_model('bench_memory')
+    model.set_model_delta(True)
+    model.set_sequence_len(sequence_len)
+    model.set_steps_ahead(1)
+    df = model.transform(df)
+    utl.log_memory('transform', report)
+
+    norm = model.normalize(df, MinMaxScaler(feature_range=(0, 1)))
+    del df
+    utl.log_memory('normalize', report)
+
+    windows, _ = model.get_windows_targets(norm, 1)
+    # windows are a strided view; a batch is materialized the way the model input is
+    batch = np.ascontiguousarray(windows[:1024])
+    utl.log_memory('windows', report)
+
+    report['dtype'] = str(batch.dtype)
+    return report
+
+
+def main():
+    if args.mode:
+        cfg.memory_lean = args.mode == 'lean'
+        print(json.dumps(pipeline(args.file, args.sequence_len)))
+        return
+    fd, file = tempfile.mkstemp(suffix='.tsv')
+    os.close(fd)
+    try:
+        generate(file, args.rows, args.features)
+        results = {}
+        for mode in ['default', 'lean']:
+            out = subprocess.check_output([
+                sys.executable, '-m', 'mods.benchmarks.bench_memory',
+                '--file', file,
+                '--sequence_len', str(args.sequence_len),
+                '--mode', mode
+            ])
+            results[mode] = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+    finally:
+        os.remove(file)
+    print('%-24s %20s %20s' % ('rss / peak rss [MB]', 'default', 'lean'))
+    for stage in results['default']:
+        if stage == 'dtype':
+            continue
+        print('%-24s %20s %20s' % (
+            stage,
+            '%.1f / %.1f' % (results['default'][stage]['rss_mb'], results['default'][stage]['peak_rss_mb']),
+            '%.1f / %.1f' % (results['lean'][stage]['rss_mb'], results['lean'][stage]['peak_rss_mb'])
+        ))
+    print('%-24s %20s %20s' % ('model input dtype', results['default']['dtype'], results['lean']['dtype']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory benchmark')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--features', type=int, default=8)
+    parser.add_argument('--sequence_len', type=int, default=cfg.sequence_len)
+    parser.add_argument('--file', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--mode', default=None, choices=['default', 'lean'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    main()
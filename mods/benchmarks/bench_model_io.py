@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Load/save time benchmark of MODS model zips
+
+Compares the in-memory model and scaler (de)serialization with the former
+temp-file round trip; e.g.,
+
+    python -m mods.benchmarks.bench_model_io --model_file models/_default_/model.zip --repeat 10
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+from zipfile import ZipFile
+
+import h5py
+import keras
+import numpy as np
+
+import mods.models.mods_model as MODS
+
+
+def timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return np.mean(times), np.std(times)
+
+
+def load_tempfile(model_file, h5_file='model.h5'):
+    # the former approach: extract model.h5 into a temp file and load it from there
+    with ZipFile(model_file) as zip:
+        with zip.open(h5_file) as f:
+            _, fname = tempfile.mkstemp()
+            with open(fname, 'wb') as tf:
+                tf.write(f.read())
+            model = keras.models.load_model(fname)
+            os.remove(fname)
+    return model
+
+
+def load_inmemory(model_file, h5_file='model.h5'):
+    with ZipFile(model_file) as zip:
+        with zip.open(h5_file) as f:
+            buffer = io.BytesIO(f.read())
+    with h5py.File(buffer, mode='r') as h5file:
+        return keras.models.load_model(h5file)
+
+
+def save_tempfile(model):
+    _, fname = tempfile.mkstemp()
+    model.save(fname)
+    with open(fname, 'rb') as f:
+        data = f.read()
+    os.remove(fname)
+    return data
+
+
+def save_inmemory(model):
+    buffer = io.BytesIO()
+    with h5py.File(buffer, mode='w') as h5file:
+        model.save(h5file)
+    return buffer.getvalue()
+
+
+def main():
+    keras_model = load_inmemory(args.model_file)
+    results = [
+        ('load keras model (temp file)', timeit(lambda: load_tempfile(args.model_file), args.repeat)),
+        ('load keras model (in-memory)', timeit(lambda: load_inmemory(args.model_file), args.repeat)),
+        ('save keras model (temp file)', timeit(lambda: save_tempfile(keras_model), args.repeat)),
+        ('save keras model (in-memory)', timeit(lambda: save_inmemory(keras_model), args.repeat)),
+        ('load mods model (zip)', timeit(lambda: MODS.mods_model('bench').load(args.model_file), args.repeat)),
+    ]
+    for name, (mean, std) in results:
+        print('%-32s %8.4f s +/- %.4f' % (name, mean, std))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model load/save benchmark')
+    parser.add_argument('--model_file', required=True, help='MODS model zip')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Latency of mods_model.predict compared to the former pandas based path
+
+The reference (mods.tests.helpers.reference_predict) is the predict
+pipeline before it was rewritten to NumPy (pandas interpolate/diff,
+scikit-learn scaling, np.append padding, DataFrame inverse transform).
+Both paths run the same forward pass and their outputs are compared for
+equality; e.g.,
+
+    python -m mods.benchmarks.bench_predict --model_file models/_default_/model.zip
+    python -m mods.benchmarks.bench_predict --rows 5000
+
+Without --model_file, random LSTM models are run by the numpy engine on
+the test fixtures (or random data of --rows rows).
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import mods.models.mods_model as MODS
+import mods.utils as utl
+from mods.mods_types import TimeRange
+from mods.tests.helpers import FIXTURES, FIXTURES_QUERY, random_model, reference_predict
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return min(times), np.median(times)
+
+
+def compare(label, model, df, repeat):
+    expected = reference_predict(model, df)
+    actual = model.predict(df)
+    identical = np.array_equal(expected, actual, equal_nan=True) and expected.dtype == actual.dtype
+    ref = timeit(lambda: reference_predict(model, df), repeat)
+    new = timeit(lambda: model.predict(df), repeat)
+    print('%-28s rows=%6d identical=%-5s pandas: %8.2f ms  numpy: %8.2f ms  (min, median %.2f / %.2f ms)' % (
+        label, len(df), identical, ref[0] * 1000, new[0] * 1000, ref[1] * 1000, new[1] * 1000))
+    return identical
+
+
+def main():
+    if args.rows:
+        rnd = np.random.RandomState(1)
+        df = pd.DataFrame(np.cumsum(rnd.randint(0, 100, size=(args.rows, 4)), axis=0),
+                          columns=['a', 'b', 'c', 'd'])
+    else:
+        df, _ = utl.datapool_read(
+            FIXTURES_QUERY, TimeRange.from_str('<2019-06-01,2019-06-04)'), 'w01h-s10m', [], FIXTURES, caching=False
+        )
+        df = utl.fix_missing_num_values(df)
+
+    identical = True
+    if args.model_file:
+        model = MODS.mods_model(args.model_file)
+        model.load(args.model_file, engine=args.engine)
+        identical &= compare(os.path.basename(args.model_file), model, df[model.get_scaler().feature_names_in_]
+                             if hasattr(model.get_scaler(), 'feature_names_in_') else df, args.repeat)
+    else:
+        for delta in [True, False]:
+            for horizons in [1, 6]:
+                model = random_model(np.random.RandomState(0), df, delta=delta, horizons=horizons, sequence_len=12,
+                                     units=12)
+                label = '%s, %d horizon(s)' % ('delta' if delta else 'raw', horizons)
+                identical &= compare(label, model, df, args.repeat)
+    if not identical:
+        raise SystemExit('outputs differ')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Predict latency benchmark')
+    parser.add_argument('--model_file', default=None, help='MODS model zip; random models if not specified')
+    parser.add_argument('--engine', default='numpy', choices=['keras', 'numpy'])
+    parser.add_argument('--rows', type=int, default=0, help='random data rows instead of the test fixtures')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    main()
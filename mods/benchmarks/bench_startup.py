@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Start-up time of the metadata path
+
+Runs get_metadata, get_train_args and get_predict_args in a fresh
+interpreter with -X importtime, and reports the wall time, the slowest
+imports and the heavy dependencies that were imported; e.g.,
+
+    python -m mods.benchmarks.bench_startup --top 15
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ['tensorflow', 'keras', 'tcn', 'keras_self_attention', 'sklearn', 'scipy', 'pandas', 'h5py']
+
+METADATA_PATH = """
+import json, sys
+import mods.models.api_v2 as api
+api.get_metadata()
+api.get_train_args()
+api.get_predict_args()
+print(json.dumps([m for m in %r if m in sys.modules]))
+""" % HEAVY_MODULES
+
+REGEX_IMPORTTIME = re.compile(r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|(?P<indent>\s+)(?P<module>\S+)')
+
+
+def run(repeat):
+    times = []
+    imports = []
+    heavy = []
+    for _ in range(repeat):
+        start = time.time()
+        p = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', METADATA_PATH],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        times.append(time.time() - start)
+        heavy = json.loads(p.stdout.decode('utf-8').strip().splitlines()[-1])
+        imports = []
+        for line in p.stderr.decode('utf-8').splitlines():
+            match = REGEX_IMPORTTIME.match(line)
+            if match:
+                imports.append((int(match.group('cumulative')), match.group('module')))
+    return times, sorted(imports, reverse=True), heavy
+
+
+def main():
+    times, imports, heavy = run(args.repeat)
+    print('metadata path wall time: %s' % ', '.join('%.3f s' % t for t in times))
+    print('heavy modules imported: %s' % (', '.join(heavy) if heavy else 'none'))
+    print('slowest imports (cumulative):')
+    for cumulative, module in imports[:args.top]:
+        print('%10.1f ms  %s' % (cumulative / 1000, module))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Start-up time benchmark')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    main()
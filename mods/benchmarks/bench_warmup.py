@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+First request latency with and without the warm-up on load
+
+Each mode runs in a fresh process, so the cold start is not affected by
+graphs built in the same process; e.g.,
+
+    python -m mods.benchmarks.bench_warmup --model_file models/_default_/model.zip
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import mods.models.mods_model as MODS
+
+
+def first_request(model_file, warmup, engine):
+    model = MODS.mods_model(model_file)
+    start = time.time()
+    model.load(model_file, engine=engine, warmup=warmup)
+    load_time = time.time() - start
+    if model.sample_data is None:
+        raise Exception('model zip does not contain sample data')
+    times = []
+    for _ in range(3):
+        start = time.time()
+        model.predict(model.sample_data)
+        times.append(time.time() - start)
+    return {
+        'load_time': load_time,
+        'warmup_time': model.warmup_time,
+        'first_request': times[0],
+        'next_requests': times[1:],
+    }
+
+
+def main():
+    if args.mode:
+        print(json.dumps(first_request(args.model_file, args.mode == 'warm', args.engine)))
+        return
+    for mode in ['cold', 'warm']:
+        out = subprocess.check_output([
+            sys.executable, '-m', 'mods.benchmarks.bench_warmup',
+            '--model_file', args.model_file,
+            '--engine', args.engine,
+            '--mode', mode
+        ])
+        result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        print('%-5s load: %8.4f s, warm-up: %s s, first request: %8.4f s, next requests: %s' % (
+            mode,
+            result['load_time'],
+            result['warmup_time'],
+            result['first_request'],
+            ', '.join('%.4f s' % t for t in result['next_requests'])
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Warm-up benchmark')
+    parser.add_argument('--model_file', required=True, help='MODS model zip')
+    parser.add_argument('--engine', default='keras', choices=['keras', 'numpy'])
+    parser.add_argument('--mode', default=None, choices=['cold', 'warm'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    main()
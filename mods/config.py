@@ -94,28 +94,33 @@ app_logs               = os.path.join(IN_OUT_BASE_DIR, 'logs', EXPERIMENT_NAMESP
 app_tensorboard_logdir = os.path.join(app_logs, 'tensorboard')
 app_tensorboard_port   = os.getenv('monitorPORT', 6006)
 
-logging.info('app_data_remote=%s' % app_data_remote)
-logging.info('app_models_remote=%s' % app_models_remote)
-logging.info('app_data=%s' % app_data)
-logging.info('app_data_features=%s' % app_data_features)
-logging.info('app_models=%s' % app_models)
-logging.info('app_checkpoints=%s' % app_checkpoints)
-logging.info('app_cache=%s' % app_cache)
-logging.info('app_data_pool_cache=%s' % app_data_pool_cache)
-logging.info('app_logs=%s' % app_logs)
-logging.info('app_tensorboard_logdir=%s' % app_tensorboard_logdir)
-logging.info('app_tensorboard_port=%s' % app_tensorboard_port)
-
-#pathlib.Path(app_data).mkdir(parents=True, exist_ok=True)
-pathlib.Path(app_models).mkdir(parents=True, exist_ok=True)
-pathlib.Path(app_checkpoints).mkdir(parents=True, exist_ok=True)
-logging.info('%s %s' % (os.path.isdir(app_checkpoints), app_checkpoints))
-pathlib.Path(app_cache).mkdir(parents=True, exist_ok=True)
-logging.info('%s %s' % (os.path.isdir(app_cache), app_cache))
-pathlib.Path(app_logs).mkdir(parents=True, exist_ok=True)
-logging.info('%s %s' % (os.path.isdir(app_logs), app_logs))
-pathlib.Path(app_tensorboard_logdir).mkdir(parents=True, exist_ok=True)
-logging.info('%s %s' % (os.path.isdir(app_tensorboard_logdir), app_tensorboard_logdir))
+
+
+def log_dirs():
+    logging.info('app_data_remote=%s' % app_data_remote)
+    logging.info('app_models_remote=%s' % app_models_remote)
+    logging.info('app_data=%s' % app_data)
+    logging.info('app_data_features=%s' % app_data_features)
+    logging.info('app_models=%s' % app_models)
+    logging.info('app_checkpoints=%s' % app_checkpoints)
+    logging.info('app_cache=%s' % app_cache)
+    logging.info('app_data_pool_cache=%s' % app_data_pool_cache)
+    logging.info('app_trace=%s' % app_trace)
+    logging.info('app_logs=%s' % app_logs)
+    logging.info('app_tensorboard_logdir=%s' % app_tensorboard_logdir)
+    logging.info('app_tensorboard_port=%s' % app_tensorboard_port)
+
+
+# application dirs are not created on import (e.g., by get_metadata), but on their first use
+_dirs_created = set()
+
+
+def ensure_dir(dir):
+    if dir not in _dirs_created:
+        pathlib.Path(dir).mkdir(parents=True, exist_ok=True)
+        logging.info('%s %s' % (os.path.isdir(dir), dir))
+        _dirs_created.add(dir)
+    return dir
 
 # Generic settings
 time_range_inclusive_beg = True  # True: <beg; False: (beg
@@ -130,6 +135,53 @@ model_name_append_timestamp = True
 app_data_pool = app_data_features + 'w01h-s10m/'        # 'w10m-s01m/'
 data_pool_caching = True
 
+# memory lean mode: data are downcasted at load time (counters to the smallest lossless integer type,
+# other features to float32) and kept in float32 through the delta, scaling and windowing
+memory_lean = False
+
+# out-of-core training: the train data are streamed from the data pool in chunks of days, the scaler
+# is fitted incrementally and the transformed rows are spooled to a file in app_cache instead of memory
+out_of_core = False
+chunk_days = 7
+
+# rolling-origin backtesting (mods/models/backtest.py): folds are trained and evaluated by worker processes
+backtest_workers = 2
+backtest_modes = ['expanding', 'sliding']
+backtest_mode = 'expanding'
+
+# asynchronous trainings (mods/models/jobs.py): the jobs are stored in jobs_db in app_cache and run by at most
+# jobs_workers worker processes; a worker is limited to jobs_tf_threads threads, jobs_memory_limit bytes
+# of address space (0 - unlimited) and runs with niceness jobs_nice to keep the latency of the predictions;
+# batches of an epoch are reported every jobs_progress_interval seconds
+async_training = False
+jobs_db = 'jobs.sqlite'
+jobs_workers = 1
+jobs_tf_threads = max((os.cpu_count() or 2) // 2, 1)
+jobs_memory_limit = 0
+jobs_nice = 10
+jobs_poll_interval = 1.0
+jobs_progress_interval = 5.0
+
+# model catalogue (mods/models/catalogue.py): the config.json and metrics.json of the model zips in app_models are
+# indexed in catalogue_db in app_cache without loading the models; a refresh reads only the zips changed since
+# the previous one (by mtime and size); the catalogue is built by api find_models (or the command line) and then
+# lists the models of the metadata
+catalogue_db = 'catalogue.sqlite'
+
+# replication of the saved models to app_models_remote (mods/models/replication.py): the copies are queued in
+# replication_db in app_cache and run by replication_workers threads of the api process; with replication_async
+# the training returns without waiting for them. A copy is streamed in replication_chunk_size blocks, verified by
+# sha256 and retried at most replication_retries times, after replication_backoff seconds doubled after each
+# attempt up to replication_backoff_max
+replication_async = True
+replication_db = 'replication.sqlite'
+replication_workers = 1
+replication_chunk_size = 4 * 1024 ** 2
+replication_retries = 5
+replication_backoff = 2.0
+replication_backoff_max = 300.0
+replication_poll_interval = 1.0
+
 # !!! column names must be distinct (use tilde (~) to rename column; e.g., orig_col_name~new_col_name !!!
 # TODO: NaN problem: 'sip|internal_count_uid~sip_in;' +\
 data_select_query = \
@@ -147,6 +199,7 @@ train_data_select_query = data_select_query
 model_delta = True                          # True --> better predictions, first order differential
 sequence_len = 12                           # p in <6, 24> for w01h-s10m
 steps_ahead = 1                             # k in <1, 12> for w01h-s10m; k < p
+multi_horizon = False                       # forecast all horizons 1..steps_ahead by a single model
 model_types = [
     'MLP',
     'Conv1D',
@@ -171,6 +224,10 @@ batch_size_test = 1                         # don't change
 stacked_blocks = 3                          # 1 = no stack
 batch_normalization = False                 # no significant effect when used with ADAM
 dropout_rate = 1.0                          # range <0.5, 0.8>, 0.0=no outputs, 1.0=no dropout
+resume_training = True                      # continue an interrupted training from its latest checkpoint
+checkpoints_keep = 3                        # number of the last checkpoints kept for each training
+update_epochs = 5                           # bounded number of epochs when fine-tuning on new days
+update_epochs_patience = 2                  # early stopping when fine-tuning on new days
 
 # train_time_range = '<2019-04-15,2019-05-01)'   # 2 weeks
 # train_time_range = '<2019-04-01,2019-05-01)'   # 1 month
@@ -200,9 +257,70 @@ test_ws = ws_choice
 # Data transformation defaults
 interpolate = False
 
+# Inference engine: 'keras' or 'numpy' (pure NumPy forward pass, keras/tensorflow are not imported)
+inference_engines = ['keras', 'numpy']
+inference_engine = os.getenv('APP_INFERENCE_ENGINE', 'keras')
+if inference_engine not in inference_engines:
+    logging.info('[WARNING] APP_INFERENCE_ENGINE=%s is not one of %s, using keras' % (inference_engine, inference_engines))
+    inference_engine = 'keras'
+numpy_engine_tolerance = 1e-3               # max abs difference between keras and numpy predictions on export
+
+# Warm-up: number of sample windows stored in the model zip and replayed at load;
+# warm_models: api warm() loads (and warms up) all the models listed in app_models
+warmup_windows = 16
+warm_models = True
+
+# multi-model prediction: number of threads running the forward passes of the models concurrently
+predict_workers = 4
+
+# micro-batching (mods/models/batcher.py): the windows of concurrent predictions by the same loaded model are
+# collected for at most predict_batch_delay seconds or up to predict_batch_max windows and run by one forward pass;
+# a batcher thread exits after predict_batch_idle seconds without requests
+predict_batching = True
+predict_batch_delay = 0.002
+predict_batch_max = 4096
+predict_batch_idle = 10.0
+
+# cache of the prediction results (mods/models/result_cache.py) keyed by the model file, the fingerprint of the
+# data segments and the predict arguments; at most result_cache_entries results of result_cache_max_bytes
+# predictions in total, each kept for result_cache_ttl seconds
+result_caching = True
+result_cache_entries = 64
+result_cache_max_bytes = 512 * 1024 ** 2
+result_cache_ttl = 3600
+
+# predict response: format of the predictions (see mods/formats.py), gzip level of the columnar format
+# and the number of windows in a page of a paginated response
+response_formats = ['json', 'columnar', 'npy', 'arrow']
+response_format = 'json'
+response_gzip_level = 1
+predict_page_size = 10000
+
+# predict from the rows uploaded or sent inline (predict arguments data and data_inline) instead of the data pool;
+# the rows have a header and the columns are separated by upload_sep
+upload_sep = '\t'
+
+# anomaly scoring of the forecast residuals (mods/anomaly.py): smoothing factor of their moving mean and variance,
+# threshold of |score|, the number of windows seen before scoring and the floor of the standard deviation
+# (in the units of the features), so a change of a so far constant residual has a finite score
+anomaly_scoring = False
+anomaly_alpha = 0.01
+anomaly_threshold = 4.0
+anomaly_warmup = 144
+anomaly_min_std = 1e-3
+
+# debug tracing (MODS_DEBUG_MODE): pipeline stage arrays are written as .npy snapshots to app_trace/<model>/
+# by a background thread; every trace_every-th call of a stage is recorded, at most trace_max_rows rows of it,
+# until trace_max_bytes are written; snapshots are dropped when trace_queue_size of them wait to be written
+app_trace = os.path.join(app_data, 'trace')
+trace_every = 1
+trace_max_rows = 100000
+trace_max_bytes = 1024 ** 3
+trace_queue_size = 64
+
 # common defaults
 def list_models():
-    return list_dir(app_models, '*.zip')
+    return list_dir(ensure_dir(app_models), '*.zip')
 
 fill_missing_rows_in_timeseries = True                        # fills missing rows in time series data
 
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Response formats of the predictions
+
+    json      - nested lists of floats (the default)
+    columnar  - gzip-compressed json object of the columns, base64 encoded
+    npy       - numpy .npy file, base64 encoded
+    arrow     - Arrow IPC stream of the columns, base64 encoded (requires pyarrow)
+
+The binary formats are produced without converting the floats one by one
+to python objects, so their serialization cost does not depend on the JSON
+encoder. Multi-horizon predictions (windows, horizons, features) are stored
+as columns <feature>@<horizon> in the columnar formats. A large response may
+be split into pages of windows; see @paginate.
+
+    payload = encode(predictions, 'npy', columns)
+    predictions = decode(payload)
+
+@author: stefan dlugolinsky
+"""
+
+import base64
+import gzip
+import io
+import json
+import math
+
+import numpy as np
+
+import mods.config as cfg
+
+
+def paginate(predictions, page, page_size=None):
+    """
+    Returns the windows of the page (numbered from 1) and the page info;
+    all the predictions are returned if page is None
+    """
+    total = len(predictions)
+    if page is None:
+        return predictions, None
+    page_size = page_size or cfg.predict_page_size
+    pages = max(math.ceil(total / page_size), 1)
+    if page < 1 or page > pages:
+        raise ValueError('page %d out of range 1..%d' % (page, pages))
+    beg = (page - 1) * page_size
+    return predictions[beg:beg + page_size], {
+        'page': page,
+        'pages': pages,
+        'page_size': page_size,
+        'first_window': beg,
+        'total_windows': total
+    }
+
+
+def column_names(shape, columns=None):
+    features = shape[-1]
+    columns = [str(c) for c in columns] if columns is not None else [str(i) for i in range(features)]
+    if len(shape) == 3:
+        return ['%s@%d' % (c, h + 1) for h in range(shape[1]) for c in columns]
+    return columns
+
+
+def encode(predictions, format=None, columns=None):
+    """
+    Returns the payload of the predictions in the format; a dict with the
+    format, shape, columns and the encoded predictions
+    """
+    format = format or cfg.response_format
+    if format not in cfg.response_formats:
+        raise ValueError('response format %s is not one of %s' % (format, cfg.response_formats))
+    predictions = np.asarray(predictions)
+    payload = {
+        'format': format,
+        'shape': list(predictions.shape),
+        'columns': [str(c) for c in columns] if columns is not None else None
+    }
+    if format == 'json':
+        payload['data'] = predictions.tolist()
+        return payload
+
+    if format == 'npy':
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(predictions), allow_pickle=False)
+        data = buffer.getvalue()
+    else:
+        names = column_names(predictions.shape, columns)
+        table = predictions.reshape((len(predictions), -1))
+        if format == 'columnar':
+            # the float repr of numpy is not used; tolist per column is the fastest way to python floats
+            data = json.dumps({name: table[:, i].tolist() for i, name in enumerate(names)}).encode('utf-8')
+            data = gzip.compress(data, compresslevel=cfg.response_gzip_level)
+        else:
+            data = _arrow_ipc(table, names)
+    payload['data'] = base64.b64encode(data).decode('ascii')
+    return payload
+
+
+def decode(payload):
+    """Returns the predictions of a payload (see @encode) as a numpy array"""
+    format = payload['format']
+    shape = tuple(payload['shape'])
+    if format == 'json':
+        return np.array(payload['data'], dtype=np.float64).reshape(shape)
+    data = base64.b64decode(payload['data'])
+    if format == 'npy':
+        return np.load(io.BytesIO(data), allow_pickle=False)
+    if format == 'columnar':
+        columns = json.loads(gzip.decompress(data).decode('utf-8'))
+        table = np.array(list(columns.values()), dtype=np.float64).T
+    else:
+        import pyarrow as pa
+        table = pa.ipc.open_stream(data).read_all()
+        table = np.column_stack([c.to_numpy() for c in table.columns]) if table.num_columns else np.empty((0, 0))
+    return table.reshape(shape)
+
+
+def _arrow_ipc(table, names):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise Exception('response format arrow requires pyarrow; install it or use the npy format')
+    batch = pa.record_batch([pa.array(table[:, i]) for i in range(table.shape[1])], names=names)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
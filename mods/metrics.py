@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Streaming evaluation metrics
+
+The evaluation metrics (see mods.utils.compute_metrics) are reduced to
+per-column sums that are updated chunk by chunk and can be merged; e.g.,
+the accumulators of the chunks evaluated by several workers:
+
+    acc = Accumulator(model)
+    for y_true, y_pred in chunks:
+        acc.update(y_true, y_pred)
+    acc.merge(other)
+    metrics = acc.result()
+
+The variance of the true values (r2) is accumulated as the centered sum of
+squares and merged by the parallel algorithm of Chan et al., so it does not
+suffer from the cancellation of the sum of squares.
+
+@author: stefan dlugolinsky
+"""
+
+import numpy as np
+
+KERAS_METRICS = ['loss', 'mse', 'mae']
+
+
+class Moments:
+    """Per-column sums of a block of (samples, features) true and predicted values"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0                 # mean of the true values
+        self.m2 = 0.0                   # centered sum of squares of the true values
+        self.sq_err = 0.0               # sum of squared errors
+        self.dot = 0.0                  # sum of y_true * y_pred
+        self.sq_true = 0.0              # sum of squares of y_true
+        self.sq_pred = 0.0              # sum of squares of y_pred
+        self.smape = 0.0                # sum of 2 * |y_pred - y_true| / (|y_true| + |y_pred|)
+
+    def update(self, y_true, y_pred):
+        other = Moments()
+        other.n = len(y_true)
+        if other.n == 0:
+            return self
+        err = y_pred - y_true
+        other.mean = np.mean(y_true, axis=0)
+        other.m2 = np.sum(np.square(y_true - other.mean), axis=0)
+        other.sq_err = np.sum(np.square(err), axis=0)
+        other.dot = np.sum(y_true * y_pred, axis=0)
+        other.sq_true = np.sum(np.square(y_true), axis=0)
+        other.sq_pred = np.sum(np.square(y_pred), axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            other.smape = np.sum(2 * np.abs(err) / (np.abs(y_true) + np.abs(y_pred)), axis=0)
+        return self.merge(other)
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.m2 = self.m2 + other.m2 + np.square(delta) * self.n * other.n / n
+        self.mean = self.mean + delta * other.n / n
+        self.n = n
+        for name in ['sq_err', 'dot', 'sq_true', 'sq_pred', 'smape']:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def result(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rmse = np.sqrt(self.sq_err / self.n)
+            cosine = self.dot / (np.sqrt(self.sq_true) * np.sqrt(self.sq_pred))
+            r2 = 1 - self.sq_err / self.m2
+            # the same as sklearn.metrics.r2_score of a constant column
+            r2 = np.where(self.m2 == 0, np.where(self.sq_err == 0, 1.0, 0.0), r2)
+            smape = 100 / self.n * self.smape
+        return {
+            'mods_smape': scores(smape, nan_as_str=True),
+            'mods_r2': scores(r2),
+            'mods_rmse': scores(rmse),
+            'mods_cosine': scores(cosine)
+        }
+
+
+class Accumulator:
+    """
+    Evaluation metrics of a model accumulated over the aligned true and
+    predicted real values; (samples, features) or, for multi-horizon models,
+    (samples, horizons, features)
+    """
+
+    def __init__(self, model=None, scale=None, delta=None, metrics_names=None):
+        """
+        Parameters
+        ----------
+        model : mods.models.mods_model.mods_model
+            Model providing the scaler, the delta setting and the keras metrics names; the keras metrics
+            are not computed without a model or a scale
+        """
+        if model is not None:
+            scale = model.get_scaler().scale_ if scale is None else scale
+            delta = model.is_delta() if delta is None else delta
+            metrics_names = metrics_names or getattr(model.model, 'metrics_names', None)
+        self.scale = scale
+        self.delta = bool(delta)
+        self.metrics_names = metrics_names or KERAS_METRICS
+        self.samples = 0
+        self.all = Moments()
+        self.horizons = None
+        # keras metrics: sums of the squared and absolute normalized errors and their count
+        self.sq_norm_err = 0.0
+        self.abs_norm_err = 0.0
+        self.norm_count = 0
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        y_pred = np.asarray(y_pred, dtype=np.float64)
+        if len(y_true) != len(y_pred):
+            raise ValueError('y_true and y_pred differ in length: %d != %d' % (len(y_true), len(y_pred)))
+        if len(y_true) == 0:
+            return self
+        self.samples += len(y_true)
+
+        if self.scale is not None:
+            # the models are trained on normalized (delta) values, the errors are therefore scaled and,
+            # for the accumulated multi-horizon deltas, differenced over the horizons
+            err = y_pred - y_true
+            if err.ndim == 3 and self.delta:
+                err = np.diff(err, axis=1, prepend=0)
+            err *= self.scale
+            self.sq_norm_err += float(np.sum(np.square(err)))
+            self.abs_norm_err += float(np.sum(np.abs(err)))
+            self.norm_count += err.size
+
+        if y_true.ndim == 3:
+            if self.horizons is None:
+                self.horizons = [Moments() for _ in range(y_true.shape[1])]
+            for h, moments in enumerate(self.horizons):
+                moments.update(y_true[:, h], y_pred[:, h])
+            # all horizons together
+            y_true = y_true.reshape((-1, y_true.shape[2]))
+            y_pred = y_pred.reshape((-1, y_pred.shape[2]))
+
+        self.all.update(y_true, y_pred)
+        return self
+
+    def merge(self, other):
+        self.samples += other.samples
+        self.all.merge(other.all)
+        if other.horizons is not None:
+            if self.horizons is None:
+                self.horizons = [Moments() for _ in other.horizons]
+            for moments, other_moments in zip(self.horizons, other.horizons):
+                moments.merge(other_moments)
+        self.sq_norm_err += other.sq_norm_err
+        self.abs_norm_err += other.abs_norm_err
+        self.norm_count += other.norm_count
+        return self
+
+    def __len__(self):
+        return self.samples
+
+    def result(self):
+        result = {}
+        if self.all.n == 0:
+            return result
+        result.update(self.all.result())
+        if self.norm_count > 0:
+            mse = self.sq_norm_err / self.norm_count
+            mae = self.abs_norm_err / self.norm_count
+            keras = {
+                'loss': mse,
+                'mse': mse,
+                'mean_squared_error': mse,
+                'mae': mae,
+                'mean_absolute_error': mae
+            }
+            result.update({name: keras[name] for name in self.metrics_names if name in keras})
+        if self.horizons is not None:
+            result['horizons'] = {str(h + 1): moments.result() for h, moments in enumerate(self.horizons)}
+        return result
+
+
+def scores(score, nan_as_str=False):
+    """Per-column scores as a list; nan scores may be reported as strings"""
+    return [str(s) if nan_as_str and np.isnan(s) else s for s in np.asarray(score, dtype=np.float64).tolist()]
+
+
+def aligned(model, df, predictions):
+    """
+    True values of the data aligned with the predictions of the model; only
+    the rows with all the (horizon) values known are returned
+    """
+    targets = model.get_horizon_targets(df)
+    if not model.is_multi_horizon():
+        # the prediction #steps_ahead rows after the window
+        targets = targets[:, -1]
+    predictions = np.asarray(predictions)
+    axis = tuple(range(1, targets.ndim))
+    known = ~(np.isnan(targets).any(axis=axis) | np.isnan(predictions).any(axis=axis))
+    return targets[known], predictions[known]
+
+
+def evaluate_chunks(model, chunks, accumulator=None):
+    """
+    Evaluates the model over the chunks of consecutive data (see
+    mods.utils.datapool_iter) in constant memory. The rows of a chunk whose
+    predictions need the next chunk are carried over, so every forecast is
+    evaluated exactly once, as if the data were not split.
+    """
+    import pandas as pd
+
+    acc = accumulator or Accumulator(model)
+    # history rows of the first prediction and the rows of its last horizon
+    carry_len = model.get_sequence_len() + (1 if model.is_delta() else 0) + model.get_steps_ahead() - 1
+    carry = None
+    for chunk in chunks:
+        df = chunk if carry is None else pd.concat([carry, chunk])
+        if len(df) > carry_len:
+            y_true, y_pred = aligned(model, df, model.predict(df))
+            acc.update(y_true, y_pred)
+        carry = df.tail(carry_len)
+    return acc
@@ -24,21 +24,26 @@ Train models with first order differential to monitor changes
 
 import os
 
+import arrow
 import logging
 import datetime
 import pkg_resources
+import pytz
 import re
-from shutil import copyfile
-from keras import backend
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from marshmallow import Schema, INCLUDE
 from webargs import fields
 
 import mods.config as cfg
 import mods.dataset.make_dataset as mdata
-import mods.models.mods_model as MODS
-import mods.utils as utl
 from mods.mods_types import TimeRange
 
+# mods.models.mods_model and mods.utils pull in pandas, scikit-learn (and keras on training),
+# so they are imported only by the functions that need them; the metadata and the arguments
+# are available without the heavy imports
+
 
 class TimeRangeField(fields.Field):
     def _serialize(self, value: TimeRange, attr, obj, **kwargs):
@@ -190,6 +195,30 @@ class TrainArgsSchema(Schema):
         missing=cfg.batch_size,
         description="Training batch size"
     )
+    multi_horizon = fields.Boolean(
+        required=False,
+        missing=cfg.multi_horizon,
+        enum=[True, False],
+        description="Forecast all horizons 1..steps_ahead by a single model in a single forward pass"
+    )
+    out_of_core = fields.Boolean(
+        required=False,
+        missing=cfg.out_of_core,
+        enum=[True, False],
+        description="Stream the train data in chunks of days instead of loading the whole train time range into memory"
+    )
+    resume = fields.Boolean(
+        required=False,
+        missing=cfg.resume_training,
+        enum=[True, False],
+        description="Resume an interrupted training of the same model configuration from its latest checkpoint"
+    )
+    async_job = fields.Boolean(
+        required=False,
+        missing=cfg.async_training,
+        enum=[True, False],
+        description="Queue the training as a job and return its id; see get_job and cancel_job"
+    )
 
 
 class PredictArgsSchema(Schema):
@@ -202,6 +231,17 @@ class PredictArgsSchema(Schema):
         #enum=cfg.list_models(),
         description="Choose model for prediction. See available models in metadata."
     )
+    model_names = fields.List(
+        fields.Str(),
+        required=False,
+        missing=None,
+        description= \
+            """
+            Predict by several models at once; model_name is ignored. The models sharing
+            the data select query and window/slide read and prepare the data only once.
+            If executing prediction from the command line, use ';' as model name delimiter.
+            """
+    )
     time_range = TimeRangeField(
         required=False,
         missing=cfg.test_time_range,
@@ -228,25 +268,191 @@ class PredictArgsSchema(Schema):
         missing=cfg.batch_size,
         description="Batch size"
     )
+    inference_engine = fields.Str(
+        required=False,
+        missing=cfg.inference_engine,
+        enum=cfg.inference_engines,
+        description="Inference engine; 'numpy' runs the model without keras/tensorflow"
+    )
+    forecast_only = fields.Boolean(
+        required=False,
+        missing=False,
+        enum=[True, False],
+        description="Read only the most recent history needed and return just the last forecasts without evaluation"
+    )
+    forecasts = fields.Integer(
+        required=False,
+        missing=1,
+        description="Number of the last forecasts returned in the forecast only mode"
+    )
+    response_format = fields.Str(
+        required=False,
+        missing=cfg.response_format,
+        enum=cfg.response_formats,
+        description= \
+            """
+            Format of the predictions in the response:
+                json     - nested lists
+                columnar - gzip-compressed json of the columns, base64 encoded
+                npy      - numpy .npy file, base64 encoded
+                arrow    - Arrow IPC stream, base64 encoded (requires pyarrow)
+            See mods.formats.decode.
+            """
+    )
+    page = fields.Integer(
+        required=False,
+        missing=None,
+        description="Return only the page (numbered from 1) of page_size prediction windows"
+    )
+    page_size = fields.Integer(
+        required=False,
+        missing=cfg.predict_page_size,
+        description="Number of prediction windows in a page"
+    )
+    anomaly = fields.Boolean(
+        required=False,
+        missing=cfg.anomaly_scoring,
+        enum=[True, False],
+        description="Score the residuals of the forecasts against their moving statistics and report the anomalies; "
+                    "not available in the forecast only mode"
+    )
+    use_cache = fields.Boolean(
+        required=False,
+        missing=cfg.result_caching,
+        enum=[True, False],
+        description="Return the cached result of the same prediction if neither the model nor its data changed"
+    )
+    data = fields.Field(
+        required=False,
+        missing=None,
+        type="file",
+        location="form",
+        description="Predict from the rows of this file instead of the data pool; the file has a header "
+                    "with the columns of the model's data select query (other columns are ignored)"
+    )
+    data_inline = fields.Str(
+        required=False,
+        missing=None,
+        description="Predict from these rows instead of the data pool; see data"
+    )
+    data_sep = fields.Str(
+        required=False,
+        missing=cfg.upload_sep,
+        description="Column separator of data and data_inline"
+    )
+
+
+class UpdateArgsSchema(Schema):
+    class Meta:
+        unknown = INCLUDE  # support 'full_paths' parameter
+
+    model_name = fields.Str(
+        required=False,
+        missing=cfg.model_name,
+        description="Model to be updated by the data arrived after the end of its train time range"
+    )
+    update_until = fields.Str(
+        required=False,
+        missing=None,
+        description= \
+            """
+            Exclusive end of the new data; e.g., 2019-06-01. Defaults to today, i.e., the last complete day.
+            format: YYYY-MM-DD
+            """
+    )
+    num_epochs = fields.Integer(
+        required=False,
+        missing=cfg.update_epochs,
+        description="Maximum number of fine-tuning epochs"
+    )
+    epochs_patience = fields.Integer(
+        required=False,
+        missing=cfg.update_epochs_patience,
+        description="Early stopping patience"
+    )
+    batch_size = fields.Integer(
+        required=False,
+        missing=None,
+        description="Fine-tuning batch size; defaults to the model's batch size"
+    )
+
+
+# loaded (and warmed up) models: (model file, engine) -> (mtime, mods_model)
+_models = {}
+_models_lock = threading.Lock()
+
+
+def clear_session(engine=None):
+    """
+    Clears keras session; keras is not imported for the numpy inference engine
+    """
+    if (engine or cfg.inference_engine) == 'numpy':
+        return
+    from keras import backend
+    backend.clear_session()
+    # keras models living in the cleared session are not usable anymore
+    with _models_lock:
+        for key in [key for key in _models if key[1] != 'numpy']:
+            del _models[key]
 
 
 def load_model(
         model_name=cfg.model_name,
-        models_dir=cfg.app_models
+        models_dir=cfg.app_models,
+        engine=None
 ):
     """
     Function loads existing MODS model
 
     :param model_name: file name of the model ('zip' extension is optional)
     :param models_dir:
+    :param engine: inference engine ('keras' or 'numpy'); default is cfg.inference_engine
     :return: mods.models.mods_model
     """
-    backend.clear_session()
+    import mods.models.mods_model as MODS
+    clear_session(engine)
     m = MODS.mods_model(model_name)
-    m.load(os.path.join(models_dir, model_name))
+    m.load(os.path.join(models_dir, model_name), engine=engine)
     return m
 
 
+def get_model_file(model_name, models_dir=cfg.app_models):
+    model_file = os.path.join(models_dir, model_name)
+    if not model_file.lower().endswith('.zip'):
+        model_file += '.zip'
+    return model_file
+
+
+def get_model(
+        model_name=cfg.model_name,
+        models_dir=cfg.app_models,
+        engine=None
+):
+    """
+    Returns a loaded and warmed up MODS model; the model is loaded again only if its file changes
+
+    :param model_name: file name of the model ('zip' extension is optional)
+    :param models_dir:
+    :param engine: inference engine ('keras' or 'numpy'); default is cfg.inference_engine
+    :return: mods.models.mods_model
+    """
+    import mods.models.mods_model as MODS
+    engine = engine or cfg.inference_engine
+    model_file = get_model_file(model_name, models_dir)
+    mtime = os.path.getmtime(model_file)
+    key = (os.path.abspath(model_file), engine)
+    with _models_lock:
+        if key in _models and _models[key][0] == mtime:
+            return _models[key][1]
+        m = MODS.mods_model(model_name)
+        m.load(model_file, engine=engine)
+        if cfg.predict_batching:
+            from mods.models.batcher import PredictBatcher
+            m.batcher = PredictBatcher(m.model, engine=engine)
+        _models[key] = (mtime, m)
+        return m
+
+
 def get_metadata():
     """
     https://docs.deep-hybrid-datacloud.eu/projects/deepaas/en/wip-api_v2/user/v2-api.html#deepaas.model.v2.base.BaseModel.get_metadata
@@ -262,7 +468,7 @@ def get_metadata():
         "license": "",
         "url": "https://github.com/deephdc/mods",
         "version": "",
-        "models": cfg.list_models()
+        "models": list_models()
     }
 
     # override above values by values from PKG-INFO file (loads metadata from setup.cfg)
@@ -276,15 +482,152 @@ def get_metadata():
     return meta
 
 
+def list_models():
+    """
+    Model zips in app_models; listed from the model catalogue if it was built (see find_models),
+    the catalogue is not created here, so the metadata do not write to app_cache
+    """
+    import sqlite3
+    if os.path.isfile(os.path.join(cfg.app_cache, cfg.catalogue_db)):
+        import mods.models.catalogue as catalogue
+        try:
+            models = catalogue.get_catalogue()
+            models.refresh()
+            return models.names()
+        except (sqlite3.Error, OSError) as e:
+            logging.info('[WARNING] model catalogue: %s' % e)
+    return cfg.list_models()
+
+
+def find_models(metric=None, limit=None, **filters):
+    """
+    Models matching the config values (e.g., data_select_query, window_slide), ranked by the metric (e.g., smape);
+    the configs and metrics are read from the model catalogue, the models are not loaded
+    """
+    import mods.models.catalogue as catalogue
+    models = catalogue.get_catalogue()
+    models.refresh()
+    return models.query(metric=metric, limit=limit, **filters)
+
+
 def warm():
     """
     https://docs.deep-hybrid-datacloud.eu/projects/deepaas/en/wip-api_v2/user/v2-api.html#deepaas.model.v2.base.BaseModel.warm
     :return:
     """
+    cfg.log_dirs()
+
     # prepare the data
     if not (os.path.exists(cfg.app_data_features) and os.path.isdir(cfg.app_data_features)):
         mdata.prepare_data()
 
+    # resume the replicas of the models queued before a restart
+    import mods.models.replication as replication
+    replication.get_replicator().start()
+
+    # load and warm up the models
+    if cfg.warm_models:
+        for model_name in cfg.list_models():
+            try:
+                model = get_model(model_name)
+                logging.info('warmed up %s: warm-up time %s' % (model_name, model.warmup_time))
+            except Exception as e:
+                logging.info('model %s not warmed up: %s' % (model_name, e))
+
+
+def copy_model_remote(model_file):
+    """
+    Replicates the model file into the remote storage; the replica is awaited unless cfg.replication_async.
+    Returns the replica (see mods/models/replication.py) or None if there is no remote storage
+    """
+    if cfg.app_models_remote != None and not (os.path.isdir(cfg.app_models_remote) and os.path.samefile(
+            cfg.app_models_remote, cfg.ensure_dir(cfg.app_models))):
+        import mods.models.replication as replication
+        replicator = replication.get_replicator()
+        replica = replicator.submit(model_file, cfg.app_models_remote)
+        if not cfg.replication_async:
+            replica = replicator.wait(replica['id'])
+        return replica
+    else:
+        logging.info('skipping uploading model into a remote storage: cfg.app_models_remote=%s' % cfg.app_models_remote)
+        return None
+
+
+def format_predictions(message, predictions, columns, predict_args):
+    """Puts the (page of the) predictions into the message in the requested response format"""
+    from mods.formats import encode, paginate
+
+    predictions, page = paginate(predictions, predict_args['page'], predict_args['page_size'])
+    response_format = predict_args['response_format']
+    message['response_format'] = response_format
+    if response_format == 'json':
+        message['predictions'] = predictions.tolist()
+    else:
+        message['predictions'] = encode(predictions, response_format, columns)
+    if page is not None:
+        message['page'] = page
+        if 'anomaly' in message:
+            # scores of the same windows as the predictions
+            beg = page['first_window']
+            end = beg + len(predictions)
+            # a new dict; the scores of all the windows may be cached
+            anomaly = message['anomaly']
+            message['anomaly'] = dict(
+                anomaly,
+                scores=anomaly['scores'][beg:end],
+                score=anomaly['score'][beg:end],
+                anomalies=[a for a in anomaly['anomalies'] if beg <= a['window'] < end]
+            )
+    return message
+
+
+def read_data(model, data, sep=cfg.upload_sep):
+    """
+    Reads the rows of an uploaded file or of an inline text or bytes by the
+    typed parser; the feature columns of the model's data select query are
+    required and the other columns, except the time windows used to fill
+    the missing rows, are not read
+    """
+    import io
+    import mods.utils as utl
+
+    data_select_query = model.get_data_select_query()
+    protocols, merge_on_col = utl.parse_data_specs(data_select_query)
+    _, columns = utl.datapool_columns(protocols, merge_on_col)
+    if hasattr(data, 'filename'):
+        # deepaas uploaded file
+        buffer = data.filename
+    elif isinstance(data, bytes):
+        buffer = io.BytesIO(data)
+    else:
+        buffer = io.StringIO(data)
+    read = set(columns + merge_on_col)
+    df = model.read_file_or_buffer(
+        buffer,
+        sep=sep,
+        header=0,
+        engine='c',
+        usecols=lambda col: col in read,
+        dtype={col: 'float32' if cfg.memory_lean else 'float64' for col in columns},
+        na_values=['None', 'NaN', 'nan', ''],
+        fill_missing_rows_in_timeseries=cfg.fill_missing_rows_in_timeseries
+    )
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise ValueError('data: columns %s of the data select query %s are missing' % (missing, data_select_query))
+    if df.empty:
+        raise ValueError('data: no rows')
+    return df[columns]
+
+
+def evaluate(model, df, predictions):
+    """Compares the predictions of the data with the known future values"""
+    import mods.metrics as metrics
+    import mods.utils as utl
+
+    y_true, y_pred = metrics.aligned(model, df, predictions)
+    return utl.compute_metrics(y_true, y_pred, model)
+
 
 def get_train_args(**kwargs):
     """
@@ -300,6 +643,10 @@ def train(**kwargs):
     """
     https://docs.deep-hybrid-datacloud.eu/projects/deepaas/en/wip-api_v2/user/v2-api.html#deepaas.model.v2.base.BaseModel.train
     """
+    import mods.models.jobs as jobs
+    import mods.models.mods_model as MODS
+    import mods.utils as utl
+
     logging.info("train(**kwargs) - kwargs: %s" % (kwargs))
 
     # use this schema
@@ -309,8 +656,18 @@ def train(**kwargs):
 
     logging.info('train_args: %s', train_args)
 
+    if train_args['async_job']:
+        # the job calls this function with the same arguments
+        job = jobs.get_queue().submit('mods.models.api_v2:train', **dict(kwargs, async_job=False))
+        # the workers of the jobs only queue the replicas of the models
+        import mods.models.replication as replication
+        replication.get_replicator().start()
+        return {'job': job}
+
     models_dir = cfg.app_models
     model_name = train_args['model_name']
+    # checkpoints are shared by the trainings of the same model name and configuration
+    checkpoint_name = model_name
 
     if cfg.model_name_append_timestamp:
         ts = datetime.datetime.timestamp(datetime.datetime.now())
@@ -324,30 +681,70 @@ def train(**kwargs):
         models_dir = os.path.dirname(model_name)
         model_name = os.path.basename(model_name)
 
-    # read train data from the features
-    df_train, cached_file_train = utl.datapool_read(
-        train_args['data_select_query'],
-        train_args['train_time_range'],
-        train_args['window_slide'],
-        train_args['train_time_ranges_excluded'],
-        cfg.app_data_features
-    )
-    # repair the data
-    df_train = utl.fix_missing_num_values(df_train)
+    memory_report = utl.log_memory('start', {})
+    jobs.report(stage='read')
 
-    # read test data from the features
-    df_test, cached_file_test = utl.datapool_read(
-        train_args['data_select_query'],
-        train_args['test_time_range'],
-        train_args['window_slide'],
-        train_args['test_time_ranges_excluded'],
-        cfg.app_data_features
-    )
-    # repair the data
-    df_test = utl.fix_missing_num_values(df_test)
+    if train_args['out_of_core']:
+        # train data are read and repaired chunk by chunk during the training
+        df_train = (utl.fix_missing_num_values(df) for df in utl.datapool_iter(
+            train_args['data_select_query'],
+            train_args['train_time_range'],
+            train_args['window_slide'],
+            train_args['train_time_ranges_excluded'],
+            cfg.app_data_features
+        ))
+        cached_file_train = None
+    else:
+        # read train data from the features
+        df_train, cached_file_train = utl.datapool_read(
+            train_args['data_select_query'],
+            train_args['train_time_range'],
+            train_args['window_slide'],
+            train_args['train_time_ranges_excluded'],
+            cfg.app_data_features
+        )
+        utl.log_memory('datapool_read train', memory_report)
+        # repair the data
+        df_train = utl.fix_missing_num_values(df_train)
+        utl.log_memory('fix_missing_num_values train', memory_report)
 
-    backend.clear_session()
+    if train_args['out_of_core']:
+        # test data are read, repaired and evaluated chunk by chunk after the training
+        df_test = (utl.fix_missing_num_values(df) for df in utl.datapool_iter(
+            train_args['data_select_query'],
+            train_args['test_time_range'],
+            train_args['window_slide'],
+            train_args['test_time_ranges_excluded'],
+            cfg.app_data_features
+        ))
+        cached_file_test = None
+    else:
+        # read test data from the features
+        df_test, cached_file_test = utl.datapool_read(
+            train_args['data_select_query'],
+            train_args['test_time_range'],
+            train_args['window_slide'],
+            train_args['test_time_ranges_excluded'],
+            cfg.app_data_features
+        )
+        # repair the data
+        df_test = utl.fix_missing_num_values(df_test)
+        utl.log_memory('read and repair test', memory_report)
+
+    clear_session('keras')
     model = MODS.mods_model(model_name)
+    model.memory_report = memory_report
+    # store data select query into the model
+    model.set_data_select_query(train_args['data_select_query'])
+    # store time ranges
+    model.set_train_time_range(train_args['train_time_range'])
+    model.set_test_time_range(train_args['test_time_range'])
+    # store window_slide into the model
+    model.set_window_slide(train_args['window_slide'])
+    # store exclusion filters
+    model.set_train_time_ranges_excluded(train_args['train_time_ranges_excluded'])
+    model.set_test_time_ranges_excluded(train_args['test_time_ranges_excluded'])
+
     model.train(
         df_train=df_train,
         sequence_len=train_args['sequence_len'],
@@ -357,62 +754,219 @@ def train(**kwargs):
         epochs_patience=train_args['epochs_patience'],
         blocks=train_args['blocks'],
         steps_ahead=train_args['steps_ahead'],
-        batch_size=train_args['batch_size']
+        multi_horizon=train_args['multi_horizon'],
+        batch_size=train_args['batch_size'],
+        resume=train_args['resume'],
+        checkpoint_name=checkpoint_name,
+        callbacks=jobs.keras_callbacks()
     )
 
     # evaluate the model
-    predictions = model.predict(df_test)
-    metrics = utl.compute_metrics(
-        df_test[model.get_sequence_len():-train_args['steps_ahead']],
-        predictions[:-train_args['steps_ahead']],  # here, we predict # steps_ahead
-        model,
-    )
+    jobs.report(stage='evaluate')
+    if train_args['out_of_core']:
+        from mods.metrics import evaluate_chunks
+        metrics = evaluate_chunks(model, df_test).result()
+    else:
+        predictions = model.predict(df_test)
+        metrics = evaluate(model, df_test, predictions)
+
+    utl.log_memory('evaluation', memory_report)
 
     # put computed metrics into the model to be saved in model's zip
     model.update_metrics(metrics)
-    # store data select query into the model
-    model.set_data_select_query(train_args['data_select_query'])
-    # store time ranges
-    model.set_train_time_range(train_args['train_time_range'])
-    model.set_test_time_range(train_args['test_time_range'])
-    # store window_slide into the model
-    model.set_window_slide(train_args['window_slide'])
-    # store exclusion filters
-    model.set_train_time_ranges_excluded(train_args['train_time_ranges_excluded'])
-    model.set_test_time_ranges_excluded(train_args['test_time_ranges_excluded'])
- 
+
     # save model locally
-    model_file = model.save(os.path.join(models_dir, model_name))
+    model_file = model.save(os.path.join(cfg.ensure_dir(models_dir), model_name))
     logging.info('model_file: %s', model_file)
     
     # copy model to a remote dir
-    if cfg.app_models_remote != None and not os.path.samefile(cfg.app_models_remote, cfg.app_models):
-        model_file_remote = os.path.join(cfg.app_models_remote, os.path.basename(model_file))
-        logging.info('copyfile(%s, %s): start' % (model_file, model_file_remote))
-        copyfile(model_file, model_file_remote)
-        logging.info('copyfile(%s, %s): done' % (model_file, model_file_remote))
-    else:
-        logging.info('skipping uploading model into a remote storage: cfg.app_models_remote=%s' % cfg.app_models_remote)
-    
+    jobs.report(stage='copy')
+    replica = copy_model_remote(model_file)
+
     message = {
         'dir_models': models_dir,
         'model_name': model_name,
         'steps_ahead': model.get_steps_ahead(),
+        'multi_horizon': model.is_multi_horizon(),
         'batch_size': model.get_batch_size(),
         'window_slide': train_args['window_slide'],
         'data_select_query': train_args['data_select_query'],
         'train_time_range': str(train_args['train_time_range']),
         'train_time_ranges_excluded': str(train_args['train_time_ranges_excluded']),
         'train_cached_df': cached_file_train,
+        'out_of_core': train_args['out_of_core'],
         'test_time_range': str(train_args['test_time_range']),
         'test_time_ranges_excluded': str(train_args['test_time_ranges_excluded']),
         'test_cached_df': cached_file_test,
         'evaluation': model.get_metrics(),
+        'memory_lean': cfg.memory_lean,
+        'memory': memory_report,
+        'replication': replica,
     }
 
     return message
 
 
+def get_job(job_id):
+    """State, progress and result of an asynchronous training"""
+    import mods.models.jobs as jobs
+    return jobs.get_queue().status(job_id)
+
+
+def list_jobs(state=None):
+    import mods.models.jobs as jobs
+    return jobs.get_queue().list(state)
+
+
+def get_replication(replica_id):
+    """State of the copy of a model into the remote storage"""
+    import mods.models.replication as replication
+    return replication.get_replicator().status(replica_id)
+
+
+def list_replications(state=None):
+    import mods.models.replication as replication
+    return replication.get_replicator().list(state)
+
+
+def cancel_job(job_id):
+    import mods.models.jobs as jobs
+    return jobs.get_queue().cancel(job_id)
+
+
+def get_update_args():
+    return UpdateArgsSchema().fields
+
+
+def update(**kwargs):
+    """
+    Fine-tunes an existing model on the days arrived after the end of its train time range
+    (out of its test time range) and saves it as a new version with the extended train time range
+    and new metrics.
+    """
+    import mods.models.mods_model as MODS
+    import mods.utils as utl
+
+    logging.info("update(**kwargs) - kwargs: %s" % (kwargs))
+
+    schema = UpdateArgsSchema()
+    update_args = schema.load(kwargs)
+
+    logging.info('update_args: %s', update_args)
+
+    models_dir = cfg.app_models
+    model_name = update_args['model_name']
+
+    # support full paths for command line calls
+    full_paths = update_args['full_paths'] if 'full_paths' in update_args else False
+    if full_paths:
+        logging.info('full_paths: %s', full_paths)
+        models_dir = os.path.dirname(model_name)
+        model_name = os.path.basename(model_name)
+
+    clear_session('keras')
+    model = MODS.mods_model(model_name)
+    model.load(os.path.join(models_dir, model_name), engine='keras', warmup=False)
+
+    # the new data start where the train time range ends
+    train_time_range = model.get_train_time_range()
+    if update_args['update_until']:
+        end = arrow.get(update_args['update_until'].strip()).datetime.replace(tzinfo=pytz.UTC)
+    else:
+        end = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    new_time_range = TimeRange(train_time_range.end, end, not train_time_range.is_rclosed(), False)
+
+    # the test time range is kept out of the new data, otherwise the metrics of the
+    # updated model would be computed on the data it was fine-tuned on
+    test_time_range = model.get_test_time_range()
+    excluded = model.get_train_time_ranges_ecluded()
+    test_excluded = utl.overlaps(new_time_range, test_time_range)
+    if test_excluded:
+        excluded.append(test_time_range)
+
+    message = {
+        'dir_models': models_dir,
+        'updated_model_name': model_name,
+        'train_time_range': str(train_time_range),
+        'update_time_range': str(new_time_range),
+        'update_test_time_range_excluded': test_excluded,
+    }
+
+    if new_time_range.end <= new_time_range.beg:
+        logging.info('model %s is up to date: %s' % (model_name, train_time_range))
+        message['model_name'] = model_name
+        return message
+
+    if test_excluded and test_time_range.beg <= new_time_range.beg and new_time_range.end <= test_time_range.end:
+        logging.info('model %s not updated: no new data out of its test time range %s' % (model_name, test_time_range))
+        message['model_name'] = model_name
+        return message
+
+    # read only the new days
+    df_new, cached_file_new = utl.datapool_read(
+        model.get_data_select_query(),
+        new_time_range,
+        model.get_window_slide(),
+        excluded,
+        cfg.app_data_features
+    )
+    # repair the data
+    df_new = utl.fix_missing_num_values(df_new)
+
+    update_time = model.fine_tune(
+        df_new,
+        num_epochs=update_args['num_epochs'],
+        epochs_patience=update_args['epochs_patience'],
+        batch_size=update_args['batch_size']
+    )
+
+    model.set_train_time_range(TimeRange(
+        train_time_range.beg,
+        new_time_range.end,
+        train_time_range.is_lclosed(),
+        new_time_range.is_rclosed()
+    ))
+    model.set_train_time_ranges_excluded(excluded)
+
+    # evaluate on the model's test time range, so the metrics of the versions are comparable
+    df_test, cached_file_test = utl.datapool_read(
+        model.get_data_select_query(),
+        model.get_test_time_range(),
+        model.get_window_slide(),
+        model.get_test_time_ranges_ecluded(),
+        cfg.app_data_features
+    )
+    df_test = utl.fix_missing_num_values(df_test)
+    predictions = model.predict(df_test)
+    metrics = evaluate(model, df_test, predictions)
+    metrics['update_time'] = update_time
+    metrics['update_test_time_range_excluded'] = test_excluded
+    model.update_metrics(metrics)
+
+    # save as a new version
+    new_model_name = model_name
+    if cfg.model_name_append_timestamp:
+        ts = datetime.datetime.timestamp(datetime.datetime.now())
+        new_model_name = re.sub(r'(?i)(-\d{10}\.\d+)?(\.zip)?$', r'-%s\2' % str(ts), model_name, count=1)
+    model.name = new_model_name
+    model_file = model.save(os.path.join(cfg.ensure_dir(models_dir), new_model_name))
+    logging.info('model_file: %s', model_file)
+
+    replica = copy_model_remote(model_file)
+
+    message.update({
+        'model_name': new_model_name,
+        'replication': replica,
+        'update_cached_df': cached_file_new,
+        'update_rows': len(df_new),
+        'test_time_range': str(model.get_test_time_range()),
+        'test_cached_df': cached_file_test,
+        'evaluation': model.get_metrics(),
+    })
+
+    return message
+
+
 def get_predict_args():
     """
     https://docs.deep-hybrid-datacloud.eu/projects/deepaas/en/wip-api_v2/user/v2-api.html#deepaas.model.v2.base.BaseModel.get_predict_args
@@ -427,6 +981,8 @@ def predict(**kwargs):
     :param kwargs:
     :return:
     """
+    import mods.utils as utl
+
     logging.info("predict(**kwargs) - kwargs: %s" % (kwargs))
 
     # use this schema
@@ -436,6 +992,9 @@ def predict(**kwargs):
 
     logging.info('predict_args: %s', predict_args)
 
+    if predict_args['model_names']:
+        return predict_models(predict_args)
+
     models_dir = cfg.app_models
     model_name = predict_args['model_name']
 
@@ -446,48 +1005,252 @@ def predict(**kwargs):
         models_dir = os.path.dirname(model_name)
         model_name = os.path.basename(model_name)
 
-    backend.clear_session()
-    model = load_model(
+    start_time = time.time()
+
+    engine = predict_args['inference_engine']
+    model = get_model(
         models_dir=models_dir,
-        model_name=model_name
+        model_name=model_name,
+        engine=engine
     )
 
     data_select_query = model.get_data_select_query()
     window_slide = model.get_window_slide()
 
-    # read data from the features
-    df_data, cached_file_train = utl.datapool_read(
-        data_select_query,
-        predict_args['time_range'],
-        window_slide,
-        predict_args['time_ranges_excluded'],
-        cfg.app_data_features
-    )
+    # uploaded or inline rows
+    data = predict_args['data'] if predict_args['data'] is not None else predict_args['data_inline']
+
+    time_range = predict_args['time_range']
+    forecast_only = predict_args['forecast_only']
+    if forecast_only:
+        history_len = model.get_history_len(predict_args['forecasts'])
+        if data is None:
+            # read only the days holding the history needed for the last forecasts
+            time_range = utl.tail_time_range(time_range, history_len, window_slide)
+            logging.info('forecast only: history_len=%d, time_range=%s' % (history_len, time_range))
+
+    # batch size of this request; the loaded model is shared by the requests and is not changed
+    batch_size = kwargs['batch_size']
+
+    cache = None
+    if predict_args['use_cache'] and data is None:
+        from mods.models.result_cache import cache_key, file_digest, get_cache
+
+        cache = get_cache()
+        # the batch size and the response format do not change the result
+        key = cache_key(
+            file_digest(get_model_file(model_name, models_dir)),
+            utl.datapool_fingerprint(
+                data_select_query,
+                time_range,
+                window_slide,
+                predict_args['time_ranges_excluded'],
+                cfg.app_data_features
+            ),
+            data_select_query,
+            window_slide,
+            time_range,
+            predict_args['time_ranges_excluded'],
+            engine,
+            forecast_only,
+            predict_args['forecasts'] if forecast_only else None,
+            predict_args['anomaly'] and not forecast_only,
+            [cfg.anomaly_alpha, cfg.anomaly_threshold, cfg.anomaly_warmup, cfg.anomaly_min_std],
+            cfg.memory_lean
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            (cached_message, predictions, columns), age = cached
+            logging.info('predict: cached result, age %.1f s' % age)
+            message = dict(
+                cached_message,
+                batch_size=batch_size,
+                predict_time=time.time() - start_time,
+                result_cache={'hit': True, 'age': age}
+            )
+            return format_predictions(message, predictions, columns, predict_args)
+
+    if data is not None:
+        # rows sent by the caller; the data pool is not read
+        df_data = read_data(model, data, predict_args['data_sep'])
+        cached_file_train = None
+    else:
+        # read data from the features
+        df_data, cached_file_train = utl.datapool_read(
+            data_select_query,
+            time_range,
+            window_slide,
+            predict_args['time_ranges_excluded'],
+            cfg.app_data_features
+        )
     # repair the data
     df_data = utl.fix_missing_num_values(df_data)
 
-    # override batch_size
-    batch_size = kwargs['batch_size']
-    model.set_batch_size(batch_size)
+    if forecast_only:
+        if len(df_data) < history_len:
+            logging.info('[WARNING] forecast only: %d rows available, %d rows needed' % (len(df_data), history_len))
+        df_data = df_data.tail(history_len)
 
-    predictions = model.predict(df_data)
+    predictions = model.predict(df_data, batch_size=batch_size)
+
+    if forecast_only:
+        evaluation = {}
+    else:
+        evaluation = evaluate(model, df_data, predictions)
+
+    anomaly = None
+    if predict_args['anomaly'] and not forecast_only:
+        from mods.anomaly import score_predictions
+        anomaly = score_predictions(model, df_data, predictions)
 
     message = {
         'dir_models': models_dir,
         'model_name': model_name,
         'data_select_query': data_select_query,
         'window_slide': window_slide,
-        'time_range': str(predict_args['time_range']),
-        'time_ranges_excluded': str(predict_args['time_ranges_excluded']),
+        'time_range': str(predict_args['time_range']) if data is None else None,
+        'time_ranges_excluded': str(predict_args['time_ranges_excluded']) if data is None else None,
+        'data_rows': len(df_data) if data is not None else None,
         'cached_df': cached_file_train,
         'steps_ahead': model.get_steps_ahead(),
-        'batch_size': model.get_batch_size(),
-        'evaluation': utl.compute_metrics(
-            df_data[model.get_sequence_len():-model.get_steps_ahead()],
-            predictions[:-model.get_steps_ahead()],
-            model,
-        ),
-        'predictions': predictions.tolist()
+        'multi_horizon': model.is_multi_horizon(),
+        'batch_size': batch_size,
+        'inference_engine': engine,
+        'forecast_only': forecast_only,
+        'evaluation': evaluation,
+        'warmup_time': model.warmup_time,
+        'predict_time': time.time() - start_time,
     }
+    if anomaly is not None:
+        message['anomaly'] = anomaly
+    if cache is not None:
+        cache.put(key, (dict(message), predictions, list(df_data.columns)), size=predictions.nbytes)
+        message['result_cache'] = {'hit': False}
+    format_predictions(message, predictions, df_data.columns, predict_args)
 
     return message
+
+
+def predict_models(predict_args):
+    """
+    Predicts by several models. The models are grouped by the data select query
+    and window/slide; each group reads and repairs its data once, the models
+    of the same interpolation and transformation share the prepared data, and
+    the forward passes run concurrently.
+    """
+    import mods.utils as utl
+
+    start_time = time.time()
+
+    full_paths = predict_args['full_paths'] if 'full_paths' in predict_args else False
+    engine = predict_args['inference_engine']
+    forecast_only = predict_args['forecast_only']
+    data = predict_args['data'] if predict_args['data'] is not None else predict_args['data_inline']
+
+    results = {}
+    groups = {}
+    for name in predict_args['model_names']:
+        models_dir = cfg.app_models
+        model_name = name
+        if full_paths:
+            models_dir = os.path.dirname(name)
+            model_name = os.path.basename(name)
+        try:
+            model = get_model(models_dir=models_dir, model_name=model_name, engine=engine)
+        except Exception as e:
+            logging.info('model %s not loaded: %s' % (name, e))
+            results[name] = {'dir_models': models_dir, 'model_name': model_name, 'error': str(e)}
+            continue
+        key = (model.get_data_select_query(), model.get_window_slide())
+        groups.setdefault(key, []).append((name, models_dir, model_name, model))
+
+    with ThreadPoolExecutor(max_workers=cfg.predict_workers) as executor:
+        futures = {}
+        for (data_select_query, window_slide), models in groups.items():
+            time_range = predict_args['time_range']
+            if forecast_only and data is None:
+                history_len = max(m.get_history_len(predict_args['forecasts']) for _, _, _, m in models)
+                time_range = utl.tail_time_range(time_range, history_len, window_slide)
+
+            # read and repair the data once for the group
+            if data is not None:
+                df_data, cached_file = read_data(models[0][3], data, predict_args['data_sep']), None
+            else:
+                df_data, cached_file = utl.datapool_read(
+                    data_select_query,
+                    time_range,
+                    window_slide,
+                    predict_args['time_ranges_excluded'],
+                    cfg.app_data_features
+                )
+            df_data = utl.fix_missing_num_values(df_data)
+            logging.info('predict group (%s, %s): %d models, %d rows' % (
+                data_select_query, window_slide, len(models), len(df_data)))
+
+            prepared = {}
+            for name, models_dir, model_name, model in models:
+                df = df_data
+                if forecast_only:
+                    df = df_data.tail(model.get_history_len(predict_args['forecasts']))
+                    model_prepared = model.prepare(df)
+                else:
+                    # interpolation and delta shared by the models of the same settings
+                    prepare_key = model.get_prepare_key()
+                    if prepare_key not in prepared:
+                        prepared[prepare_key] = model.prepare(df)
+                    model_prepared = prepared[prepare_key]
+                futures[name] = executor.submit(
+                    _predict_model, model, df, model_prepared, engine, forecast_only, predict_args
+                )
+                results[name] = {
+                    'dir_models': models_dir,
+                    'model_name': model_name,
+                    'data_select_query': data_select_query,
+                    'window_slide': window_slide,
+                    'cached_df': cached_file,
+                }
+
+        for name, future in futures.items():
+            try:
+                results[name].update(future.result())
+            except Exception as e:
+                logging.info('model %s failed: %s' % (name, e))
+                results[name]['error'] = str(e)
+
+    message = {
+        'time_range': str(predict_args['time_range']),
+        'time_ranges_excluded': str(predict_args['time_ranges_excluded']),
+        'inference_engine': engine,
+        'forecast_only': forecast_only,
+        'data_groups': len(groups),
+        'predict_time': time.time() - start_time,
+        'models': [results[name] for name in predict_args['model_names']],
+    }
+
+    return message
+
+
+def _predict_model(model, df, prepared, engine, forecast_only, predict_args):
+    if engine == 'keras':
+        # -->
+        # TODO: workaround for https://github.com/keras-team/keras/issues/13353
+        # the symbolic scope is thread-local
+        import keras.backend.tensorflow_backend as tb
+        tb._SYMBOLIC_SCOPE.value = True
+        # <--
+    start_time = time.time()
+    # batch size of this request; the loaded model is shared by the requests and is not changed
+    predictions = model.predict(df, prepared=prepared, batch_size=predict_args['batch_size'])
+    evaluation = {} if forecast_only else evaluate(model, df, predictions)
+    result = {
+        'steps_ahead': model.get_steps_ahead(),
+        'multi_horizon': model.is_multi_horizon(),
+        'batch_size': predict_args['batch_size'],
+        'evaluation': evaluation,
+        'warmup_time': model.warmup_time,
+        'predict_time': time.time() - start_time,
+    }
+    if predict_args['anomaly'] and not forecast_only:
+        from mods.anomaly import score_predictions
+        result['anomaly'] = score_predictions(model, df, predictions)
+    return format_predictions(result, predictions, df.columns, predict_args)
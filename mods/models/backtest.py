@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Rolling-origin backtesting of a model configuration
+
+The days of the whole time range are read from the data pool once and
+stored to a file in app_cache. The range is split into folds of test days
+preceded by their train days; the train range either expands from the
+beginning of the range or slides with the test days:
+
+    expanding:  [train      ][test]
+                [train            ][test]
+    sliding:    [train      ][test]
+                      [train      ][test]
+
+The folds are trained and evaluated by worker processes (spawned, keras is
+not fork-safe), which map the stored data to memory. The test rows are
+preceded by the history of their first forecast, so every test day is
+forecasted once. The report contains the metrics and timings of the folds,
+their means and standard deviations and the metrics pooled over all the
+folds; e.g.,
+
+    python mods/models/backtest.py --time_range "<2019-04-01,2019-07-01)" \\
+        --train_days 28 --test_days 7 --mode sliding --workers 4 --report backtest.json
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import bisect
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import mods.config as cfg
+from mods.mods_types import TimeRange
+
+# configuration of the model trained in each fold; see api_v2.TrainArgsSchema
+MODEL_PARAMS = [
+    'sequence_len', 'model_delta', 'model_type', 'num_epochs', 'epochs_patience', 'blocks', 'steps_ahead',
+    'multi_horizon', 'batch_size'
+]
+
+
+def make_folds(time_range, train_days, test_days, step_days=None, mode=cfg.backtest_mode):
+    """
+    Returns a list of (train time range, test time range) of the folds; the
+    ranges are left-closed and right-open days within the time range
+    """
+    if mode not in cfg.backtest_modes:
+        raise ValueError('mode %s is not one of %s' % (mode, cfg.backtest_modes))
+    day = datetime.timedelta(days=1)
+    beg = time_range.beg.replace(hour=0, minute=0, second=0, microsecond=0)
+    if not time_range.is_lclosed():
+        beg += day
+    end = time_range.end.replace(hour=0, minute=0, second=0, microsecond=0)
+    if time_range.is_rclosed():
+        end += day
+    step = (step_days or test_days) * day
+    folds = []
+    test_beg = beg + train_days * day
+    while test_beg + test_days * day <= end:
+        train_beg = beg if mode == 'expanding' else test_beg - train_days * day
+        folds.append((
+            TimeRange(train_beg, test_beg, True, False),
+            TimeRange(test_beg, test_beg + test_days * day, True, False)
+        ))
+        test_beg += step
+    return folds
+
+
+def load_days(data_select_query, time_range, ws, excluded=[], base_dir=cfg.app_data_features):
+    """
+    Reads the days of the time range once; returns the repaired data, the
+    days and the offsets of their first rows (the last offset is the number
+    of rows)
+    """
+    import mods.utils as utl
+
+    days = []
+    frames = []
+    for chunk_days, df in utl.datapool_iter(data_select_query, time_range, ws, excluded, base_dir,
+                                            chunk_days=1, with_days=True):
+        days.extend(chunk_days)
+        frames.append(df)
+    if not frames:
+        raise Exception('no data in %s' % time_range)
+    df = utl.fix_missing_num_values(pd.concat(frames, ignore_index=True))
+    offsets = np.cumsum([0] + [len(f) for f in frames])
+    return df, days, offsets
+
+
+def rows_of(time_range, days, offsets):
+    """Row range of the loaded days within a (left-closed, right-open) time range"""
+    beg = bisect.bisect_left(days, time_range.beg)
+    end = bisect.bisect_left(days, time_range.end)
+    return int(offsets[beg]), int(offsets[end])
+
+
+def run_fold(task):
+    """Trains and evaluates one fold; runs in a worker process"""
+    try:
+        return _run_fold(task)
+    except Exception as e:
+        logging.exception('fold %d failed' % task['fold'])
+        return {
+            'fold': task['fold'],
+            'train_time_range': task['train_time_range'],
+            'test_time_range': task['test_time_range'],
+            'error': '%s: %s' % (type(e).__name__, e)
+        }, None
+
+
+def _run_fold(task):
+    cfg.launch_tensorboard = False
+
+    from keras import backend
+    import mods.models.mods_model as MODS
+    from mods.metrics import Accumulator, aligned
+
+    fold = task['fold']
+    data = np.load(task['data_file'], mmap_mode='r')
+    columns = task['columns']
+    train_beg, train_end = task['train_rows']
+    test_beg, test_end = task['test_rows']
+    result = {
+        'fold': fold,
+        'train_time_range': task['train_time_range'],
+        'test_time_range': task['test_time_range'],
+        'train_rows': train_end - train_beg,
+        'test_rows': test_end - test_beg,
+    }
+    start = time.time()
+
+    backend.clear_session()
+    model = MODS.mods_model('backtest-fold%d' % fold)
+    model.train(
+        df_train=pd.DataFrame(np.array(data[train_beg:train_end]), columns=columns),
+        resume=False,
+        checkpoint_name='%s-fold%d' % (task['run'], fold),
+        **task['params']
+    )
+    train_time = time.time() - start
+
+    # the first forecast (of the evaluated or the first horizon) is the first test row
+    history = model.get_sequence_len() + (1 if model.is_delta() else 0)
+    if not model.is_multi_horizon():
+        history += model.get_steps_ahead() - 1
+    df_test = pd.DataFrame(np.array(data[max(test_beg - history, 0):test_end]), columns=columns)
+    predict_start = time.time()
+    predictions = model.predict(df_test)
+    predict_time = time.time() - predict_start
+
+    eval_start = time.time()
+    y_true, y_pred = aligned(model, df_test, predictions)
+    acc = Accumulator(model).update(y_true, y_pred)
+    eval_time = time.time() - eval_start
+
+    result['evaluated'] = len(acc)
+    result['times'] = {
+        'train': train_time,
+        'predict': predict_time,
+        'evaluate': eval_time,
+        'total': time.time() - start
+    }
+    result['metrics'] = acc.result()
+    return result, acc
+
+
+def summarize(results):
+    """Means and standard deviations of the fold metrics and timings"""
+    values = {}
+    for result in results:
+        if 'metrics' not in result:
+            continue
+        for name, value in list(result['metrics'].items()) + [('time_' + k, v) for k, v in result['times'].items()]:
+            if isinstance(value, dict):
+                # per horizon metrics are pooled only
+                continue
+            values.setdefault(name, []).append(np.asarray(value, dtype=np.float64))
+    mean = {}
+    std = {}
+    for name, value in values.items():
+        value = np.array(value)
+        with np.errstate(invalid='ignore'):
+            mean[name] = np.nanmean(value, axis=0).tolist()
+            std[name] = np.nanstd(value, axis=0).tolist()
+    return mean, std
+
+
+def backtest(
+        data_select_query,
+        time_range,
+        ws,
+        train_days,
+        test_days,
+        step_days=None,
+        mode=cfg.backtest_mode,
+        excluded=[],
+        params={},
+        workers=cfg.backtest_workers,
+        base_dir=cfg.app_data_features
+):
+    folds = make_folds(time_range, train_days, test_days, step_days, mode)
+    if not folds:
+        raise Exception('no fold of %d train and %d test days fits in %s' % (train_days, test_days, time_range))
+    logging.info('backtesting %d folds' % len(folds))
+
+    start = time.time()
+    df, days, offsets = load_days(data_select_query, time_range, ws, excluded, base_dir)
+    load_time = time.time() - start
+
+    fd, data_file = tempfile.mkstemp(prefix='backtest-', suffix='.npy', dir=cfg.ensure_dir(cfg.app_cache))
+    os.close(fd)
+    run = os.path.basename(data_file)[:-4]
+    try:
+        np.save(data_file, np.ascontiguousarray(df.values, dtype=np.float32 if cfg.memory_lean else np.float64))
+        tasks = []
+        for i, (train_range, test_range) in enumerate(folds):
+            train_rows = rows_of(train_range, days, offsets)
+            test_rows = rows_of(test_range, days, offsets)
+            if train_rows[0] == train_rows[1] or test_rows[0] == test_rows[1]:
+                logging.info('[WARNING] skipping fold %d: no data in %s or %s' % (i, train_range, test_range))
+                continue
+            tasks.append({
+                'run': run,
+                'fold': i,
+                'data_file': data_file,
+                'columns': list(df.columns),
+                'train_time_range': str(train_range),
+                'test_time_range': str(test_range),
+                'train_rows': train_rows,
+                'test_rows': test_rows,
+                'params': params
+            })
+        del df
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                done = list(pool.map(run_fold, tasks))
+        else:
+            done = [run_fold(task) for task in tasks]
+    finally:
+        os.remove(data_file)
+
+    results = [result for result, _ in done]
+    pooled = None
+    for _, acc in done:
+        if acc is not None:
+            pooled = acc if pooled is None else pooled.merge(acc)
+    mean, std = summarize(results)
+    return {
+        'data_select_query': data_select_query,
+        'time_range': str(time_range),
+        'window_slide': ws,
+        'mode': mode,
+        'train_days': train_days,
+        'test_days': test_days,
+        'step_days': step_days or test_days,
+        'params': params,
+        'folds': results,
+        'summary': {
+            'folds': len(results),
+            'failed': len([result for result in results if 'error' in result]),
+            'mean': mean,
+            'std': std,
+            'pooled': pooled.result() if pooled is not None else {}
+        },
+        'times': {
+            'load': load_time,
+            'total': time.time() - start
+        }
+    }
+
+
+def main():
+    from mods.models.api_v2 import TrainArgsSchema
+
+    # the same parsing of the model parameters as in the training
+    train_args = TrainArgsSchema().load({k: v for k, v in vars(args).items() if k in MODEL_PARAMS and v is not None})
+    excluded = [TimeRange.from_str(r) for r in args.time_ranges_excluded.split(';') if r.strip()] \
+        if args.time_ranges_excluded else []
+    report = backtest(
+        args.data_select_query,
+        TimeRange.from_str(args.time_range),
+        args.window_slide,
+        args.train_days,
+        args.test_days,
+        step_days=args.step_days,
+        mode=args.mode,
+        excluded=excluded,
+        params={k: train_args[k] for k in MODEL_PARAMS},
+        workers=args.workers,
+        base_dir=args.base_dir
+    )
+    report = json.dumps(report, indent=2, default=str)
+    if args.report:
+        with open(args.report, mode='w') as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rolling-origin backtesting')
+    parser.add_argument('--data_select_query', default=cfg.train_data_select_query)
+    parser.add_argument('--time_range', required=True, help='whole time range of the folds; e.g., <2019-01-01,2019-07-01)')
+    parser.add_argument('--time_ranges_excluded', default=None, help="time ranges to skip delimited by ';'")
+    parser.add_argument('--window_slide', default=cfg.train_ws, choices=cfg.train_ws_choices)
+    parser.add_argument('--mode', default=cfg.backtest_mode, choices=cfg.backtest_modes)
+    parser.add_argument('--train_days', type=int, required=True, help='train days of the first (expanding) or each (sliding) fold')
+    parser.add_argument('--test_days', type=int, required=True, help='test days of each fold')
+    parser.add_argument('--step_days', type=int, default=None, help='shift of the folds; test_days by default')
+    parser.add_argument('--workers', type=int, default=cfg.backtest_workers)
+    parser.add_argument('--base_dir', default=cfg.app_data_features)
+    parser.add_argument('--report', default=None, help='writes the report to a json file')
+    for param in MODEL_PARAMS:
+        parser.add_argument('--%s' % param, default=None)
+    args = parser.parse_args()
+    main()
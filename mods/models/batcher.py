@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Micro-batching of the forward passes of concurrent predictions
+
+The windows of the predictions by the same loaded model, requested
+concurrently by several threads (api requests), are collected by a worker
+thread for at most max_delay seconds after the first of them, or until
+max_batch windows are collected. The worker waits only for as many
+requests as it collected into the previous batch, so the added latency
+follows the load: a lone request is not delayed and a full batch of the
+concurrent clients is run as soon as it is complete. The collected
+windows are run by a single forward pass and its output is split back to
+the waiting requests; the per-call overhead of keras (or of the recurrent
+layers of the numpy engine) is paid once per batch instead of once per
+request. A prediction of max_batch or more windows does not wait and runs
+alone.
+
+    model.batcher = PredictBatcher(model.model, engine='numpy')
+    pred = model.batcher.predict(windows, batch_size=64)
+
+The worker thread exits when there are no requests for
+cfg.predict_batch_idle seconds and it is started again by the next one.
+
+@author: stefan dlugolinsky
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import mods.config as cfg
+
+
+class PredictBatcher:
+    def __init__(self, model, max_delay=cfg.predict_batch_delay, max_batch=cfg.predict_batch_max, engine=None):
+        """
+        :param model: keras or numpy model; see NumpyModel.predict
+        :param engine: inference engine of the model ('keras' or 'numpy'); default is cfg.inference_engine
+        """
+        self.model = model
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.engine = engine or cfg.inference_engine
+        # counters of the batched requests and the forward passes
+        self.requests = 0
+        self.batches = 0
+        self.__queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    def predict(self, x, batch_size=None):
+        """Output of the model for the windows x; blocks until the batch of x is predicted"""
+        if len(x) == 0 or len(x) >= self.max_batch:
+            return self.model.predict(x, batch_size=batch_size)
+        future = Future()
+        self.__queue.put((x, batch_size, future))
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name='batcher', daemon=True)
+                self.__thread.start()
+        return future.result()
+
+    def __run(self):
+        if self.engine == 'keras':
+            # -->
+            # TODO: workaround for https://github.com/keras-team/keras/issues/13353
+            # the symbolic scope is thread-local
+            import keras.backend.tensorflow_backend as tb
+            tb._SYMBOLIC_SCOPE.value = True
+            # <--
+        # requests of the previous batch; a single request under no load is run without a delay
+        expected = 1
+        while True:
+            try:
+                requests = [self.__queue.get(timeout=cfg.predict_batch_idle)]
+            except queue.Empty:
+                with self.__lock:
+                    # a request put before the lock is served by this thread
+                    if self.__queue.empty():
+                        self.__thread = None
+                        return
+                continue
+            windows = len(requests[0][0])
+            deadline = time.time() + self.max_delay
+            while windows < self.max_batch:
+                # the requests already queued are taken without waiting; more of them are awaited
+                # only until the batch is as large as the previous one
+                timeout = deadline - time.time() if len(requests) < expected else 0
+                try:
+                    request = self.__queue.get(timeout=timeout) if timeout > 0 else self.__queue.get_nowait()
+                except queue.Empty:
+                    break
+                requests.append(request)
+                windows += len(request[0])
+            expected = len(requests)
+            self.__forward(requests)
+
+    def __forward(self, requests):
+        try:
+            if len(requests) == 1:
+                x = requests[0][0]
+            else:
+                x = np.concatenate([x for x, _, _ in requests])
+            batch_size = max(batch_size or 0 for _, batch_size, _ in requests) or None
+            pred = self.model.predict(x, batch_size=batch_size)
+        except Exception as e:
+            logging.exception('batched forward pass of %d requests' % len(requests))
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+        self.requests += len(requests)
+        self.batches += 1
+        beg = 0
+        for x, _, future in requests:
+            future.set_result(pred[beg:beg + len(x)])
+            beg += len(x)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Catalogue of the models
+
+The config.json and metrics.json of the model zips are indexed in a sqlite
+database in app_cache; the networks, scalers and sample data are not read.
+A refresh lists the models directory and reads only the zips added or
+changed (by mtime and size) since the last refresh, so the catalogue stays
+fast with thousands of models. The metrics are indexed by their means over
+the features, so the models can be ranked by a metric:
+
+    catalogue = get_catalogue()
+    catalogue.refresh()
+    model = catalogue.best('smape', data_select_query=query, window_slide='w01h-s10m')
+    models = catalogue.query(model_type='LSTM', metric='r2', limit=10)
+
+or from the command line:
+
+    python mods/models/catalogue.py --metric smape --window_slide w01h-s10m --limit 5
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import zipfile
+from contextlib import closing
+
+import mods.config as cfg
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS models (
+        file TEXT PRIMARY KEY,
+        dir TEXT NOT NULL,
+        name TEXT NOT NULL,
+        mtime INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        data_select_query TEXT,
+        window_slide TEXT,
+        model_type TEXT,
+        sequence_len INTEGER,
+        steps_ahead INTEGER,
+        multi_horizon INTEGER,
+        model_delta INTEGER,
+        train_time_range TEXT,
+        test_time_range TEXT,
+        config TEXT,
+        metrics TEXT,
+        error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS models_dir ON models (dir)",
+    """
+    CREATE TABLE IF NOT EXISTS metrics (
+        file TEXT NOT NULL,
+        name TEXT NOT NULL,
+        value REAL,
+        PRIMARY KEY (file, name)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS metrics_name ON metrics (name, value)"
+]
+
+# config keys stored in their own columns; see mods_model
+COLUMNS = [
+    'data_select_query', 'window_slide', 'model_type', 'sequence_len', 'steps_ahead', 'multi_horizon', 'model_delta',
+    'train_time_range', 'test_time_range'
+]
+
+# metrics ranked in the ascending order; the others (r2, cosine) in the descending order
+LOWER_IS_BETTER = ['smape', 'mape', 'rmse', 'mse', 'mae', 'loss', 'mean_squared_error', 'mean_absolute_error']
+
+
+def read_model_info(file):
+    """config and metrics of a model zip; the other members are not read"""
+    with zipfile.ZipFile(file) as zip:
+        config = json.loads(zip.read('config.json').decode('utf-8'))
+        try:
+            metrics = json.loads(zip.read('metrics.json').decode('utf-8'))
+        except KeyError:
+            metrics = {}
+    return config, metrics
+
+
+def metric_values(metrics):
+    """Mean of each metric over the features; the nan scores are skipped"""
+    values = {}
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            # per horizon metrics
+            continue
+        scores = []
+        for score in value if isinstance(value, list) else [value]:
+            try:
+                # nan is stored as a string in metrics.json
+                score = float(score)
+            except (TypeError, ValueError):
+                continue
+            if not math.isnan(score):
+                scores.append(score)
+        values[name.lower()] = sum(scores) / len(scores) if scores else None
+    return values
+
+
+class Catalogue:
+    def __init__(self, models_dir=None, db_file=None):
+        self.models_dir = os.path.abspath(models_dir or cfg.app_models)
+        self.db_file = db_file or os.path.join(cfg.ensure_dir(cfg.app_cache), cfg.catalogue_db)
+        self.__lock = threading.Lock()
+        with closing(self.__connect()) as db:
+            for sql in SCHEMA:
+                db.execute(sql)
+
+    def __connect(self):
+        db = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def refresh(self):
+        """Indexes the added and changed zips and drops the removed ones; returns the numbers of them"""
+        files = {}
+        if os.path.isdir(self.models_dir):
+            with os.scandir(self.models_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith('.zip'):
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+
+        # refreshes of the same catalogue do not read the same zips twice
+        with self.__lock, closing(self.__connect()) as db:
+            indexed = {row['file']: (row['mtime'], row['size']) for row in db.execute(
+                'SELECT file, mtime, size FROM models WHERE dir = ?', (self.models_dir,))}
+            changed = [file for file, version in files.items() if indexed.get(file) != version]
+            removed = [file for file in indexed if file not in files]
+
+            rows = [self.__row(file, files[file]) for file in changed]
+            db.execute('BEGIN')
+            try:
+                for file in removed + changed:
+                    db.execute('DELETE FROM models WHERE file = ?', (file,))
+                    db.execute('DELETE FROM metrics WHERE file = ?', (file,))
+                for row, values in rows:
+                    db.execute('INSERT INTO models (%s) VALUES (%s)' % (
+                        ', '.join(row), ', '.join('?' * len(row))), list(row.values()))
+                    db.executemany('INSERT INTO metrics (file, name, value) VALUES (?, ?, ?)',
+                                   [(row['file'], name, value) for name, value in values.items()])
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+
+        counts = {
+            'added': len([file for file in changed if file not in indexed]),
+            'updated': len([file for file in changed if file in indexed]),
+            'removed': len(removed),
+            'models': len(files)
+        }
+        if changed or removed:
+            logging.info('catalogue %s: %s' % (self.models_dir, counts))
+        return counts
+
+    def __row(self, file, version):
+        row = {
+            'file': file,
+            'dir': self.models_dir,
+            'name': os.path.basename(file),
+            'mtime': version[0],
+            'size': version[1]
+        }
+        try:
+            config, metrics = read_model_info(file)
+        except Exception as e:
+            # e.g., a zip being copied; it is read again when its mtime changes
+            logging.info('[WARNING] catalogue: %s not indexed: %s' % (file, e))
+            row['error'] = str(e)
+            return row, {}
+        for column in COLUMNS:
+            value = config.get(column)
+            row[column] = json.dumps(value) if isinstance(value, (list, dict)) else value
+        row['config'] = json.dumps(config)
+        row['metrics'] = json.dumps(metrics)
+        return row, metric_values(metrics)
+
+    @staticmethod
+    def __model(row):
+        model = dict(row)
+        for column in ['config', 'metrics']:
+            model[column] = json.loads(model[column]) if model[column] else None
+        for column in ['multi_horizon', 'model_delta']:
+            model[column] = bool(model[column]) if model[column] is not None else None
+        return model
+
+    def names(self):
+        with closing(self.__connect()) as db:
+            return [row['name'] for row in db.execute(
+                'SELECT name FROM models WHERE dir = ? ORDER BY name', (self.models_dir,))]
+
+    def get(self, name):
+        """Config and metrics of the model (zip file name) without loading it; None if it is not indexed"""
+        if not name.lower().endswith('.zip'):
+            name += '.zip'
+        with closing(self.__connect()) as db:
+            row = db.execute('SELECT * FROM models WHERE dir = ? AND name = ?', (self.models_dir, name)).fetchone()
+        return self.__model(row) if row is not None else None
+
+    def metric_name(self, metric):
+        """Indexed name of a metric; e.g., SMAPE -> mods_smape"""
+        metric = metric.lower()
+        with closing(self.__connect()) as db:
+            for name in [metric, 'mods_' + metric]:
+                if db.execute('SELECT 1 FROM metrics WHERE name = ? LIMIT 1', (name,)).fetchone():
+                    return name
+        return metric
+
+    def query(self, metric=None, limit=None, **filters):
+        """
+        Models matching the filters (config values; e.g., window_slide='w01h-s10m'),
+        ranked by the metric if given; the models without the metric are skipped
+        """
+        unknown = [column for column in filters if column not in COLUMNS]
+        if unknown:
+            raise ValueError('catalogue: unknown filters %s; use %s' % (unknown, COLUMNS))
+        sql = 'SELECT models.*'
+        params = []
+        if metric is not None:
+            metric = self.metric_name(metric)
+            sql += ', metrics.value AS score FROM models JOIN metrics ON metrics.file = models.file' \
+                   ' AND metrics.name = ? AND metrics.value IS NOT NULL'
+            params.append(metric)
+        else:
+            sql += ' FROM models'
+        sql += ' WHERE models.dir = ?'
+        params.append(self.models_dir)
+        for column, value in filters.items():
+            if value is None:
+                continue
+            sql += ' AND models.%s = ?' % column
+            params.append(json.dumps(value) if isinstance(value, (list, dict)) else value)
+        if metric is not None:
+            order = 'ASC' if metric.replace('mods_', '') in LOWER_IS_BETTER else 'DESC'
+            sql += ' ORDER BY score %s, models.name' % order
+        else:
+            sql += ' ORDER BY models.name'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with closing(self.__connect()) as db:
+            return [self.__model(row) for row in db.execute(sql, params)]
+
+    def best(self, metric, **filters):
+        """The best model by the metric; None if no model matches"""
+        models = self.query(metric=metric, limit=1, **filters)
+        return models[0] if models else None
+
+
+_catalogues = {}
+_catalogues_lock = threading.Lock()
+
+
+def get_catalogue(models_dir=None):
+    """The catalogue of the models directory (app_models by default) in this process"""
+    models_dir = os.path.abspath(models_dir or cfg.app_models)
+    with _catalogues_lock:
+        if models_dir not in _catalogues:
+            _catalogues[models_dir] = Catalogue(models_dir)
+        return _catalogues[models_dir]
+
+
+def main():
+    catalogue = Catalogue(args.models_dir, args.db)
+    print(json.dumps(catalogue.refresh()))
+    filters = {column: getattr(args, column) for column in ['data_select_query', 'window_slide', 'model_type']}
+    for model in catalogue.query(metric=args.metric, limit=args.limit, **filters):
+        print('%s\t%s\t%s\t%s' % (model['name'], model['window_slide'], model['model_type'], model.get('score', '')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model catalogue')
+    parser.add_argument('--models_dir', default=cfg.app_models)
+    parser.add_argument('--db', default=None, help='catalogue database; %s in app_cache by default' % cfg.catalogue_db)
+    parser.add_argument('--metric', default=None, help='rank the models by the metric; e.g., smape, r2')
+    parser.add_argument('--data_select_query', default=None)
+    parser.add_argument('--window_slide', default=None)
+    parser.add_argument('--model_type', default=None)
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+    main()
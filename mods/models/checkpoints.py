@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Training checkpoints
+
+Checkpoints of a training are stored in
+
+    <app_checkpoints>/<model name>-<config hash>/epoch-<epoch>.hdf5
+
+so an interrupted training of the same model configuration can be resumed
+from the latest valid checkpoint (including the optimizer state). The early
+stopping is not resumed: its patience and best loss are counted again from
+the resumed epoch. The checkpoints of a finished training are removed. The
+model is serialized in the training thread, while the file is written (and
+old checkpoints are pruned) in a background thread.
+
+@author: stefan dlugolinsky
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from keras.callbacks import Callback
+
+import mods.config as cfg
+import mods.utils as utl
+
+REGEX_CHECKPOINT = re.compile(r'^epoch-(?P<epoch>\d+)\.hdf5$')
+
+# model configuration not affecting the trained weights; e.g., more epochs may be requested when resuming
+HASH_EXCLUDED_KEYS = ['epochs', 'epochs_patience']
+
+
+def config_hash(config):
+    model_config = {k: v for k, v in config['model'].items() if k not in HASH_EXCLUDED_KEYS}
+    m = hashlib.md5()
+    m.update(json.dumps(model_config, sort_keys=True).encode('utf-8'))
+    return m.hexdigest()
+
+
+def get_checkpoint_dir(name, config):
+    name = re.sub(r'(?i)\.zip$', '', os.path.basename(name))
+    return os.path.join(cfg.app_checkpoints, '%s-%s' % (name, config_hash(config)))
+
+
+def list_checkpoints(checkpoint_dir):
+    """Returns (epoch, file) pairs sorted by the epoch"""
+    checkpoints = []
+    if os.path.isdir(checkpoint_dir):
+        for f in os.listdir(checkpoint_dir):
+            match = REGEX_CHECKPOINT.match(f)
+            if match:
+                checkpoints.append((int(match.group('epoch')), os.path.join(checkpoint_dir, f)))
+    return sorted(checkpoints)
+
+
+def load_latest_checkpoint(checkpoint_dir, custom_objects=None):
+    """Returns (epoch, keras model) of the latest loadable checkpoint or (0, None)"""
+    for epoch, file in reversed(list_checkpoints(checkpoint_dir)):
+        try:
+            with open(file, 'rb') as f:
+                model = utl.keras_model_from_bytes(f.read(), custom_objects=custom_objects)
+            return epoch, model
+        except Exception as e:
+            logging.info('invalid checkpoint %s: %s' % (file, e))
+    return 0, None
+
+
+def remove_checkpoints(checkpoint_dir):
+    for _, file in list_checkpoints(checkpoint_dir):
+        os.remove(file)
+    if os.path.isdir(checkpoint_dir) and not os.listdir(checkpoint_dir):
+        os.rmdir(checkpoint_dir)
+
+
+class AsyncModelCheckpoint(Callback):
+    """Saves the model after each epoch and keeps only the last #keep checkpoints"""
+
+    def __init__(self, checkpoint_dir, keep=cfg.checkpoints_keep):
+        super(AsyncModelCheckpoint, self).__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.keep = keep
+        self.__executor = None
+        self.__pending = []
+
+    def on_train_begin(self, logs=None):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+
+    def on_epoch_end(self, epoch, logs=None):
+        # the weights must be captured before the next epoch modifies them
+        data = utl.keras_model_to_bytes(self.model)
+        self.__pending = [f for f in self.__pending if not f.done()]
+        self.__pending.append(self.__executor.submit(self.__write, epoch + 1, data))
+
+    def on_train_end(self, logs=None):
+        self.__executor.shutdown(wait=True)
+        for f in self.__pending:
+            if f.exception() is not None:
+                logging.info('checkpoint not written: %s' % f.exception())
+        self.__pending = []
+
+    def __write(self, epoch, data):
+        file = os.path.join(self.checkpoint_dir, 'epoch-%04d.hdf5' % epoch)
+        tmp_file = file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+        # checkpoint appears under its name only when it is complete
+        os.replace(tmp_file, file)
+        logging.info('checkpoint saved: %s' % file)
+        for _, old_file in list_checkpoints(self.checkpoint_dir)[:-self.keep]:
+            os.remove(old_file)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Exports weights of trained MODS models for the numpy inference engine
+
+Models trained before the numpy engine was introduced do not contain the
+exported weights; this script loads them by keras and saves them again
+together with the weights for the numpy engine; e.g.,
+
+    python mods/models/export_numpy.py --model_file models/_default_/model.zip
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import logging
+
+import mods.models.mods_model as MODS
+
+
+def main():
+    for model_file in args.model_file:
+        model = MODS.mods_model(model_file)
+        model.load(model_file, engine='keras')
+        if model.export_numpy_model() is None:
+            logging.info('skipping %s: model cannot be exported for the numpy engine' % model_file)
+            continue
+        model.save(model_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export MODS models for the numpy inference engine')
+    parser.add_argument('--model_file', nargs='+', required=True, help='MODS model zip(s)')
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Training data generators
+
+TimeseriesGenerator yields a single target row per window; WindowGenerator
+yields the batches in the same order, but the targets may span several
+horizons, which are flattened to match the model output. The windows may
+be views of not yet normalized data (e.g., a memory mapped spool); then
+the batches are normalized by the scaler when they are generated.
+
+@author: stefan dlugolinsky
+"""
+
+import numpy as np
+from keras.utils import Sequence
+
+
+class WindowGenerator(Sequence):
+
+    def __init__(self, windows, targets, batch_size=1, scaler=None):
+        """
+        Parameters
+        ----------
+        windows : numpy.ndarray
+            (samples, sequence_len, features); e.g., a view returned by mods_model.get_windows_targets
+        targets : numpy.ndarray
+            (samples, ...) targets of the windows
+        batch_size : int
+        scaler : sklearn.preprocessing.MinMaxScaler
+            Fitted scaler normalizing the batches; None if the data are normalized
+        """
+        self.windows = windows
+        self.targets = targets
+        self.batch_size = batch_size
+        self.scaler = scaler
+
+    def __len__(self):
+        return (len(self.windows) + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, index):
+        batch = slice(index * self.batch_size, (index + 1) * self.batch_size)
+        x = np.array(self.windows[batch])
+        y = np.array(self.targets[batch])
+        if self.scaler is not None:
+            # the same way as MinMaxScaler.transform
+            x *= self.scaler.scale_
+            x += self.scaler.min_
+            y *= self.scaler.scale_
+            y += self.scaler.min_
+        return x, y.reshape((len(x), -1))
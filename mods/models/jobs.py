@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Asynchronous jobs; e.g., the trainings requested with async_job=true
+
+A job is a call of a function given by its 'module:function' path with
+json serializable key-word arguments. The jobs are stored in a sqlite
+database in app_cache, so their state survives the restarts of the api:
+
+    queued -> running -> done | failed
+          \\-> cancelled <-/
+
+A dispatcher thread of the api process starts the queued jobs in spawned
+worker processes (keras is not fork-safe), at most cfg.jobs_workers of them
+at once. A worker process is limited in the number of threads of
+tensorflow and the math libraries, in its address space and runs with a
+lower priority, so the predictions served by the api process keep their
+latency. The job reports its progress by @report; the trainings report
+their stages and, by the callbacks of @keras_callbacks, their epochs and
+losses.
+
+    queue = get_queue()
+    job = queue.submit('mods.models.api_v2:train', model_name='model.zip', ...)
+    queue.status(job['id'])
+    queue.cancel(job['id'])
+    job = queue.wait(job['id'])     # job['result'] or job['error']
+
+The jobs may be listed, watched and cancelled from the command line too:
+
+    python mods/models/jobs.py list
+    python mods/models/jobs.py wait <job id>
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import mods.config as cfg
+from mods.models.replication import pid_alive
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = [DONE, FAILED, CANCELLED]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    target TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    state TEXT NOT NULL,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    pid INTEGER,
+    progress TEXT,
+    result TEXT,
+    error TEXT
+)
+"""
+
+JSON_COLUMNS = ['kwargs', 'progress', 'result']
+
+# seconds between the claim of a job and the start of its worker, after which a job without a pid is interrupted
+START_TIMEOUT = 60.0
+
+
+def to_json(obj):
+    """json.dumps default of the arguments and results of the jobs"""
+    if hasattr(obj, 'tolist'):
+        # numpy arrays and scalars
+        return obj.tolist()
+    if hasattr(obj.__class__, 'to_json'):
+        return obj.__class__.to_json(obj)
+    return str(obj)
+
+
+class JobStore:
+    """
+    Persistent state of the jobs; a connection is opened for each
+    operation, so the store may be used by several threads and processes
+    """
+
+    def __init__(self, db_file=None):
+        self.db_file = db_file or os.path.join(cfg.ensure_dir(cfg.app_cache), cfg.jobs_db)
+        with closing(self.__connect()) as db:
+            db.execute(SCHEMA)
+
+    def __connect(self):
+        # autocommit; the transaction of @claim is explicit
+        db = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @staticmethod
+    def __job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        for column in JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def add(self, target, kwargs):
+        job_id = uuid.uuid4().hex
+        with closing(self.__connect()) as db:
+            db.execute(
+                'INSERT INTO jobs (id, target, kwargs, state, submitted) VALUES (?, ?, ?, ?, ?)',
+                (job_id, target, json.dumps(kwargs, default=to_json), QUEUED, time.time())
+            )
+        return job_id
+
+    def get(self, job_id):
+        with closing(self.__connect()) as db:
+            return self.__job(db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def list(self, state=None, limit=100):
+        """The latest jobs first"""
+        with closing(self.__connect()) as db:
+            if state is None:
+                rows = db.execute('SELECT * FROM jobs ORDER BY submitted DESC LIMIT ?', (limit,))
+            else:
+                rows = db.execute('SELECT * FROM jobs WHERE state = ? ORDER BY submitted DESC LIMIT ?', (state, limit))
+            return [self.__job(row) for row in rows.fetchall()]
+
+    def update(self, job_id, states=None, **values):
+        """
+        Sets the values of the job if it is in one of the states (any state
+        if None); returns whether the job was updated
+        """
+        for column in JSON_COLUMNS:
+            if column in values:
+                values[column] = json.dumps(values[column], default=to_json)
+        sql = 'UPDATE jobs SET %s WHERE id = ?' % ', '.join('%s = ?' % column for column in values)
+        params = list(values.values()) + [job_id]
+        if states is not None:
+            sql += ' AND state IN (%s)' % ', '.join('?' * len(states))
+            params += list(states)
+        with closing(self.__connect()) as db:
+            return db.execute(sql, params).rowcount > 0
+
+    def claim(self):
+        """Marks the oldest queued job as running and returns it; None if there is no queued job"""
+        with closing(self.__connect()) as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT * FROM jobs WHERE state = ? ORDER BY submitted LIMIT 1', (QUEUED,)).fetchone()
+                if row is not None:
+                    db.execute('UPDATE jobs SET state = ?, started = ? WHERE id = ?', (RUNNING, time.time(), row['id']))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        job = self.__job(row)
+        if job is not None:
+            job['state'] = RUNNING
+        return job
+
+    def recover(self):
+        """
+        Fails the jobs left running by the exited workers; e.g., at a restart of the api.
+        The jobs of the live workers (e.g., of another api process) are kept; returns the number of the failed jobs
+        """
+        now = time.time()
+        with closing(self.__connect()) as db:
+            rows = db.execute('SELECT id, pid, started FROM jobs WHERE state = ?', (RUNNING,)).fetchall()
+            interrupted = [row['id'] for row in rows if (
+                not pid_alive(row['pid']) if row['pid'] else row['started'] < now - START_TIMEOUT
+            )]
+            for job_id in interrupted:
+                db.execute('UPDATE jobs SET state = ?, finished = ?, error = ? WHERE id = ? AND state = ?',
+                           (FAILED, now, 'interrupted by a restart of the api', job_id, RUNNING))
+        return len(interrupted)
+
+
+# the job run by this (worker) process: (store, job id, progress)
+_job = None
+
+
+def report(**progress):
+    """Updates the progress of the job run by this process; does nothing outside of a job"""
+    if _job is None:
+        return
+    store, job_id, current = _job
+    current.update(progress)
+    current['time'] = time.time()
+    store.update(job_id, progress=current)
+
+
+def keras_callbacks():
+    """Callbacks reporting the epochs and batches of the training run by this process as a job"""
+    if _job is None:
+        return []
+
+    from keras.callbacks import Callback
+
+    class Progress(Callback):
+        def __init__(self):
+            super().__init__()
+            self.reported = 0
+
+        def on_epoch_begin(self, epoch, logs=None):
+            report(stage='train', epoch=epoch + 1, epochs=self.params.get('epochs'), batch=0,
+                   steps=self.params.get('steps'))
+
+        def on_batch_end(self, batch, logs=None):
+            # batches are reported at most every jobs_progress_interval seconds
+            if time.time() - self.reported >= cfg.jobs_progress_interval:
+                self.reported = time.time()
+                report(batch=batch + 1, loss=float((logs or {}).get('loss', float('nan'))))
+
+        def on_epoch_end(self, epoch, logs=None):
+            report(logs={k: float(v) for k, v in (logs or {}).items()})
+
+    return [Progress()]
+
+
+def limit_resources(limits):
+    """Limits the threads, the address space and the priority of this process"""
+    threads = limits.get('tf_threads')
+    if threads:
+        # read by keras (tensorflow session config), tensorflow and the math libraries when they are imported
+        for name in ['OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS', 'MKL_NUM_THREADS',
+                     'OPENBLAS_NUM_THREADS']:
+            os.environ[name] = str(threads)
+    memory = limits.get('memory_limit')
+    if memory:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    if limits.get('nice'):
+        os.nice(limits['nice'])
+
+
+def resolve(target):
+    module, function = target.split(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def run(db_file, job_id, limits):
+    """Runs a claimed job; the target of the worker processes"""
+    global _job
+
+    limit_resources(limits)
+    cfg.launch_tensorboard = False
+    # the models are replicated by the replicator of the api process
+    cfg.replication_workers = 0
+
+    store = JobStore(db_file)
+    job = store.get(job_id)
+    if job is None or job['state'] != RUNNING:
+        # cancelled before it started
+        return
+    _job = (store, job_id, {})
+    logging.info('job %s: %s(%s)' % (job_id, job['target'], job['kwargs']))
+    try:
+        result = resolve(job['target'])(**job['kwargs'])
+    except Exception as e:
+        logging.exception('job %s failed' % job_id)
+        store.update(job_id, states=[RUNNING], state=FAILED, finished=time.time(),
+                     error='%s: %s' % (type(e).__name__, e))
+    else:
+        store.update(job_id, states=[RUNNING], state=DONE, finished=time.time(), result=result)
+    finally:
+        _job = None
+
+
+class JobQueue:
+    """
+    Bounded pool of the worker processes running the jobs of a store; the
+    dispatcher thread is started by the first @submit or @start
+    """
+
+    def __init__(
+            self,
+            store=None,
+            workers=cfg.jobs_workers,
+            tf_threads=cfg.jobs_tf_threads,
+            memory_limit=cfg.jobs_memory_limit,
+            nice=cfg.jobs_nice,
+            poll_interval=cfg.jobs_poll_interval
+    ):
+        self.store = store or JobStore()
+        self.workers = workers
+        self.limits = {'tf_threads': tf_threads, 'memory_limit': memory_limit, 'nice': nice}
+        self.poll_interval = poll_interval
+        self.__context = multiprocessing.get_context('spawn')
+        self.__processes = {}
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__stopped = False
+        self.__thread = None
+
+    def start(self):
+        with self.__lock:
+            if self.__thread is None:
+                recovered = self.store.recover()
+                if recovered:
+                    logging.info('[WARNING] %d interrupted jobs marked as failed' % recovered)
+                self.__thread = threading.Thread(target=self.__dispatch, name='jobs', daemon=True)
+                self.__thread.start()
+
+    def submit(self, target, **kwargs):
+        """Queues a call of the function target ('module:function'); returns the job"""
+        job_id = self.store.add(target, kwargs)
+        logging.info('job %s queued: %s' % (job_id, target))
+        self.start()
+        self.__wakeup.set()
+        return self.store.get(job_id)
+
+    def status(self, job_id):
+        return self.store.get(job_id)
+
+    def list(self, state=None, limit=100):
+        return self.store.list(state, limit)
+
+    def wait(self, job_id, timeout=None):
+        """Waits until the job finishes; returns the job (its state is not final on timeout)"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.store.get(job_id)
+            if job is None or job['state'] in FINISHED:
+                return job
+            if deadline is not None and time.time() >= deadline:
+                return job
+            time.sleep(min(self.poll_interval, 0.5))
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job; returns the job"""
+        with self.__lock:
+            if not self.store.update(job_id, states=[QUEUED, RUNNING], state=CANCELLED, finished=time.time()):
+                return self.store.get(job_id)
+            job = self.store.get(job_id)
+            process = self.__processes.get(job_id)
+            if process is not None:
+                process.terminate()
+            elif job['pid']:
+                # running in a worker of another process; e.g., cancelled from the command line
+                try:
+                    os.kill(job['pid'], signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+        logging.info('job %s cancelled' % job_id)
+        self.__wakeup.set()
+        return job
+
+    def shutdown(self, cancel=False):
+        """Stops the dispatcher; waits for the running jobs or cancels them"""
+        with self.__lock:
+            self.__stopped = True
+            thread = self.__thread
+        if thread is not None:
+            self.__wakeup.set()
+            thread.join()
+        for job_id in list(self.__processes):
+            if cancel:
+                self.cancel(job_id)
+            self.__processes[job_id].join()
+        with self.__lock:
+            self.__reap()
+
+    def __reap(self):
+        for job_id, process in list(self.__processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self.__processes[job_id]
+            # a worker killed; e.g., by the memory limit
+            if self.store.update(job_id, states=[RUNNING], state=FAILED, finished=time.time(),
+                                 error='worker exited with code %s' % process.exitcode):
+                logging.info('[WARNING] job %s: worker exited with code %s' % (job_id, process.exitcode))
+
+    def __dispatch(self):
+        while True:
+            try:
+                with self.__lock:
+                    if self.__stopped:
+                        return
+                    self.__reap()
+                    while len(self.__processes) < self.workers:
+                        job = self.store.claim()
+                        if job is None:
+                            break
+                        process = self.__context.Process(
+                            target=run,
+                            args=(self.store.db_file, job['id'], self.limits),
+                            name='job-%s' % job['id'],
+                            daemon=True
+                        )
+                        process.start()
+                        self.store.update(job['id'], pid=process.pid)
+                        self.__processes[job['id']] = process
+                        logging.info('job %s started, pid=%d' % (job['id'], process.pid))
+            except Exception:
+                logging.exception('job dispatcher')
+            self.__wakeup.wait(self.poll_interval)
+            self.__wakeup.clear()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """The job queue of this process"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+
+def main():
+    queue = JobQueue(JobStore(args.db) if args.db else None)
+    if args.command == 'list':
+        jobs = queue.list(args.state, args.limit)
+        for job in jobs:
+            print('%s  %-9s  %s  %s' % (job['id'], job['state'],
+                                         time.strftime(cfg.format_string, time.localtime(job['submitted'])),
+                                         job['progress'] or ''))
+        return
+    if args.job_id is None:
+        parser.error('%s requires a job id' % args.command)
+    if args.command == 'status':
+        job = queue.status(args.job_id)
+    elif args.command == 'cancel':
+        job = queue.cancel(args.job_id)
+    else:
+        job = queue.wait(args.job_id, args.timeout)
+    print(json.dumps(job, indent=2, default=to_json))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Asynchronous jobs')
+    parser.add_argument('command', choices=['list', 'status', 'cancel', 'wait'])
+    parser.add_argument('job_id', nargs='?', default=None)
+    parser.add_argument('--state', default=None, choices=[QUEUED, RUNNING] + FINISHED)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=None)
+    parser.add_argument('--db', default=None, help='job database; %s in app_cache by default' % cfg.jobs_db)
+    args = parser.parse_args()
+    main()
@@ -21,39 +21,26 @@ Created on Mon Jan 11 13:34:37 2019
 """
 
 import io
+import itertools
 import json
 import logging
 import os
 import subprocess
 import sys
-import tempfile
 import time
 from zipfile import ZipFile
 
-import joblib
-import keras
 import numpy as np
 import pandas as pd
-from keras.callbacks import Callback, EarlyStopping, ModelCheckpoint, TensorBoard
-from keras.layers import Bidirectional
-from keras.layers import Dense
-from keras.layers import Flatten
-from keras.layers import Input
-from keras.layers import RepeatVector
-from keras.layers.convolutional import Conv1D
-from keras.layers.convolutional import MaxPooling1D
-from keras.layers.recurrent import GRU
-from keras.layers.recurrent import LSTM
-from keras.models import Model
-from keras.optimizers import Adam
-from keras.preprocessing.sequence import TimeseriesGenerator
-from keras_self_attention import SeqSelfAttention
 from multiprocessing import Process
-from sklearn.preprocessing import MinMaxScaler
-from tcn import TCN
 
 import mods.config as cfg
 import mods.utils as utl
+from mods.mods_types import TimeRange
+from mods.models.numpy_model import NumpyModel, export_keras_model, is_supported, max_abs_diff
+
+# keras (and tensorflow) is imported only where it is needed,
+# so the models can be served by the numpy inference engine without it
 
 def launch_tensorboard(port, logdir):
     subprocess.call(['tensorboard',
@@ -69,6 +56,7 @@ class mods_model:
     __FILE = 'file'
     # model
     __MODEL = 'model'
+    __NUMPY_MODEL = 'numpy_model'
     __MULTIVARIATE = 'multivariate'
     __SEQUENCE_LEN = 'sequence_len'
     __MODEL_DELTA = 'model_delta'
@@ -79,6 +67,7 @@ class mods_model:
     __BLOCKS = 'blocks'
     __STACKED_BLOCKS = 'stacked_blocks'
     __STEPS_AHEAD = 'steps_ahead'
+    __MULTI_HORIZON = 'multi_horizon'
     __BATCH_SIZE = 'batch_size'
     __BATCH_NORMALIZATION = 'batch_normalization'
     __DROPOUT_RATE = 'dropout_rate'
@@ -94,11 +83,6 @@ class mods_model:
     __SCALER = 'scaler'
     # sample data
     __SAMPLE_DATA = 'sample_data'
-    __SEP = 'sep'
-    __SKIPROWS = 'skiprows'
-    __SKIPFOOTER = 'skipfooter'
-    __ENGINE = 'engine'
-    __USECOLS = 'usecols'
 
     def __init__(self, name):
         self.name = name
@@ -106,39 +90,19 @@ class mods_model:
         self.model = None
         self.__scaler = None
         self.sample_data = None
+        self.warmup_time = None
+        self.memory_report = {}
+        # forward passes of concurrent predictions are batched by the batcher if set; see api_v2.get_model
+        self.batcher = None
         self.__metrics = {}
         self.config = self.__default_config()
 
-    # saves the contents of the original file (e.g. file in a zip) into a temp file and runs func over it
-    def __func_over_tempfile(self, orig_file, func, mode='wb', *args, **kwargs):
-        # create temp file
-        _, fname = tempfile.mkstemp()
-
-        with open(fname, mode) as tf:
-            # extract model to the temp file
-            tf.write(orig_file.read())
-
-            # call the func over the temp file
-            result = func(fname, *args, **kwargs)
-
-        # remove the temp file
-        os.remove(fname)
-        return result
-
     def __save_bytes_in_zip_as_file(self, zip, filename, binary_data):
         if sys.version_info >= (3, 6, 0):
             with zip.open(filename, mode='w') as f:
                 f.write(binary_data)
         else:
-            # create temp file
-            _, fname = tempfile.mkstemp()
-            # write data into the temp file
-            with open(fname, 'wb') as tf:
-                tf.write(binary_data)
-            # put the temp file into the zip
-            zip.write(fname, filename)
-            # remove the temp file
-            os.remove(fname)
+            zip.writestr(filename, binary_data)
 
     def __get_sample_data_cfg(self):
         if mods_model.__SAMPLE_DATA in self.config:
@@ -150,36 +114,59 @@ class mods_model:
             file += '.zip'
         logging.info('Saving model: %s' % file)
 
+        # scaler is no longer pickled, migrate models loaded from older zips
+        scaler_config = self.config[mods_model.__SCALER]
+        if scaler_config[mods_model.__FILE].lower().endswith('.pkl'):
+            scaler_config[mods_model.__FILE] = 'scaler.json'
+
+        numpy_model = self.__export_numpy_model()
+        if numpy_model is None:
+            self.config.pop(mods_model.__NUMPY_MODEL, None)
+        else:
+            self.config[mods_model.__NUMPY_MODEL] = {mods_model.__FILE: 'model.npz'}
+
         with ZipFile(file, mode='w') as zip:
             self.__save_config(zip, 'config.json')
             self.__save_model(zip, self.config[mods_model.__MODEL])
+            if numpy_model is not None:
+                self.__save_bytes_in_zip_as_file(
+                    zip,
+                    self.config[mods_model.__NUMPY_MODEL][mods_model.__FILE],
+                    numpy_model.to_bytes()
+                )
             self.__save_scaler(zip, self.config[mods_model.__SCALER])
-            # self.__save_sample_data(zip, self.__get_sample_data_cfg())
+            self.__save_sample_data(zip, self.__get_sample_data_cfg())
             self.__save_metrics(zip, 'metrics.json')
             zip.close()
 
         logging.info('Model saved')
         return file
 
-    def load(self, file):
+    def load(self, file, engine=None, warmup=True):
         if not file.lower().endswith('.zip'):
             file += '.zip'
-        logging.info('Loading model: %s' % file)
-        # -->
-        # TODO: workaround for https://github.com/keras-team/keras/issues/13353
-        import keras.backend.tensorflow_backend as tb
-        tb._SYMBOLIC_SCOPE.value = True
-        # <--
+        if engine is None:
+            engine = cfg.inference_engine
+        logging.info('Loading model: %s (inference engine: %s)' % (file, engine))
         with ZipFile(file) as zip:
             self.__load_config(zip, 'config.json')
-            self.__load_model(zip, self.config[mods_model.__MODEL])
+            if engine == 'numpy':
+                self.__load_numpy_model(zip, self.config.get(mods_model.__NUMPY_MODEL))
+            else:
+                # -->
+                # TODO: workaround for https://github.com/keras-team/keras/issues/13353
+                import keras.backend.tensorflow_backend as tb
+                tb._SYMBOLIC_SCOPE.value = True
+                # <--
+                self.__load_model(zip, self.config[mods_model.__MODEL])
             self.__load_scaler(zip, self.config[mods_model.__SCALER])
-            # self.__load_sample_data(zip, self.__get_sample_data_cfg())
+            self.__load_sample_data(zip, self.__get_sample_data_cfg())
             self.__load_metrics(zip, 'metrics.json')
             zip.close()
 
         logging.info('Model loaded')
-        self.__init()
+        if warmup:
+            self.__init()
 
     def __save_config(self, zip, file):
         data = json.dumps(self.config)
@@ -208,34 +195,92 @@ class mods_model:
         except Exception as e:
             logging.info('Error: Could not load model metrics [%s]' % str(e))
 
+    # keras model is serialized into an in-memory HDF5 file image; no temp files are involved
     def __save_model(self, zip, model_config):
         logging.info('Saving keras model')
-        _, fname = tempfile.mkstemp()
-        self.model.save(fname)
-        zip.write(fname, model_config[mods_model.__FILE])
-        os.remove(fname)
+        self.__save_bytes_in_zip_as_file(zip, model_config[mods_model.__FILE], utl.keras_model_to_bytes(self.model))
         logging.info('Keras model saved')
 
     def __load_model(self, zip, model_config):
         logging.info('Loading keras model')
         with zip.open(model_config[mods_model.__FILE]) as f:
-            self.model = self.__func_over_tempfile(f, keras.models.load_model)
+            self.model = utl.keras_model_from_bytes(f.read())
         logging.info('Keras model loaded')
 
+    # exports weights of the keras model for the numpy inference engine;
+    # returns None for model types the engine does not support
+    def __export_numpy_model(self):
+        if isinstance(self.model, NumpyModel):
+            return self.model
+        if not is_supported(self.model):
+            logging.info('Numpy inference engine does not support model type: %s' % self.get_model_type())
+            return None
+        numpy_model = export_keras_model(self.model)
+        # check the forward pass against keras on random windows
+        x = np.random.RandomState(0).rand(16, self.get_sequence_len(), self.get_multivariate()).astype('float32')
+        diff = max_abs_diff(self.model, numpy_model, x)
+        if diff > cfg.numpy_engine_tolerance:
+            logging.info('Numpy model not exported: max abs diff %s > %s' % (diff, cfg.numpy_engine_tolerance))
+            return None
+        logging.info('Numpy model exported: max abs diff %s' % diff)
+        return numpy_model
+
+    def export_numpy_model(self):
+        return self.__export_numpy_model()
+
+    def __load_numpy_model(self, zip, numpy_model_config):
+        if numpy_model_config is None:
+            raise Exception('model does not contain weights for the numpy inference engine; '
+                            'export them by mods.models.export_numpy or use the keras engine')
+        logging.info('Loading numpy model')
+        with zip.open(numpy_model_config[mods_model.__FILE]) as f:
+            self.model = NumpyModel.from_bytes(f.read())
+        logging.info('Numpy model loaded')
+
+    # MinMaxScaler is stored as a compact json with its fitted parameters
+    @staticmethod
+    def __scaler_to_dict(scaler):
+        return {
+            'feature_range': list(scaler.feature_range),
+            'dtype': str(scaler.scale_.dtype),
+            'n_samples_seen_': int(scaler.n_samples_seen_),
+            'min_': scaler.min_.tolist(),
+            'scale_': scaler.scale_.tolist(),
+            'data_min_': scaler.data_min_.tolist(),
+            'data_max_': scaler.data_max_.tolist(),
+            'data_range_': scaler.data_range_.tolist()
+        }
+
+    @staticmethod
+    def __scaler_from_dict(params):
+        from sklearn.preprocessing import MinMaxScaler
+        scaler = MinMaxScaler(feature_range=tuple(params['feature_range']))
+        scaler.n_samples_seen_ = params['n_samples_seen_']
+        for attr in ['min_', 'scale_', 'data_min_', 'data_max_', 'data_range_']:
+            setattr(scaler, attr, np.array(params[attr], dtype=params['dtype']))
+        return scaler
+
     def __save_scaler(self, zip, scaler_config):
         logging.info('Saving scaler')
-        _, fname = tempfile.mkstemp()
-        joblib.dump(self.__scaler, fname)
-        zip.write(fname, scaler_config[mods_model.__FILE])
-        os.remove(fname)
+        data = json.dumps(mods_model.__scaler_to_dict(self.__scaler))
+        binary_data = bytes(data, 'utf-8')
+        self.__save_bytes_in_zip_as_file(zip, scaler_config[mods_model.__FILE], binary_data)
         logging.info('Scaler saved')
 
     def __load_scaler(self, zip, scaler_config):
         logging.info('Loading scaler')
-        with zip.open(scaler_config[mods_model.__FILE]) as f:
-            self.__scaler = joblib.load(f)
+        file = scaler_config[mods_model.__FILE]
+        with zip.open(file) as f:
+            if file.lower().endswith('.pkl'):
+                # backward compatibility: models saved with a pickled scaler
+                import joblib
+                self.__scaler = joblib.load(io.BytesIO(f.read()))
+            else:
+                params = json.loads(f.read().decode('utf-8'))
+                self.__scaler = mods_model.__scaler_from_dict(params)
         logging.info('Scaler loaded')
 
+    # sample data are stored as compressed npz of raw float32 rows together with the column names
     def __save_sample_data(self, zip, sample_data_config):
         if sample_data_config is None:
             return
@@ -245,16 +290,14 @@ class mods_model:
             return
         logging.info('Saving sample data')
 
-        with zip.open(sample_data_config[mods_model.__FILE], mode='w') as f:
-            self.sample_data.to_csv(
-                io.TextIOWrapper(f),
-                sep=sample_data_config[mods_model.__SEP],
-                skiprows=sample_data_config[mods_model.__SKIPROWS],
-                skipfooter=sample_data_config[mods_model.__SKIPFOOTER],
-                engine=sample_data_config[mods_model.__ENGINE],
-                usecols=lambda col: col in sample_data_config[mods_model.__USECOLS]
-            )
-        logging.info('Sample data saved:\n%s' % self.sample_data)
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            data=self.sample_data.values.astype(np.float32),
+            columns=np.array([str(col) for col in self.sample_data.columns])
+        )
+        self.__save_bytes_in_zip_as_file(zip, sample_data_config[mods_model.__FILE], buffer.getvalue())
+        logging.info('Sample data saved: %s rows' % len(self.sample_data))
 
     def __load_sample_data(self, zip, sample_data_config):
         if sample_data_config is None:
@@ -263,15 +306,9 @@ class mods_model:
 
         try:
             with zip.open(sample_data_config[mods_model.__FILE]) as f:
-                self.sample_data = pd.read_csv(
-                    io.TextIOWrapper(f),
-                    sep=sample_data_config[mods_model.__SEP],
-                    skiprows=sample_data_config[mods_model.__SKIPROWS],
-                    skipfooter=sample_data_config[mods_model.__SKIPFOOTER],
-                    engine=sample_data_config[mods_model.__ENGINE],
-                    usecols=lambda col: col in sample_data_config[mods_model.__USECOLS]
-                )
-            logging.info('Sample data loaded:\n%s' % self.sample_data)
+                with np.load(io.BytesIO(f.read()), allow_pickle=False) as npz:
+                    self.sample_data = pd.DataFrame(npz['data'], columns=npz['columns'].tolist())
+            logging.info('Sample data loaded: %s rows' % len(self.sample_data))
         except Exception as e:
             logging.info('Sample data not loaded: %s' % e)
 
@@ -310,12 +347,16 @@ class mods_model:
                 mods_model.__BLOCKS: cfg.blocks,
                 mods_model.__STACKED_BLOCKS: cfg.stacked_blocks,
                 mods_model.__STEPS_AHEAD: cfg.steps_ahead,
+                mods_model.__MULTI_HORIZON: cfg.multi_horizon,
                 mods_model.__BATCH_SIZE: cfg.batch_size,
                 mods_model.__BATCH_NORMALIZATION: cfg.batch_normalization,
                 mods_model.__DROPOUT_RATE: cfg.dropout_rate,
             },
             mods_model.__SCALER: {
-                mods_model.__FILE: 'scaler.pkl'
+                mods_model.__FILE: 'scaler.json'
+            },
+            mods_model.__SAMPLE_DATA: {
+                mods_model.__FILE: 'sample_data.npz'
             }
         }
 
@@ -382,6 +423,17 @@ class mods_model:
     def get_steps_ahead(self):
         return self.cfg_model()[mods_model.__STEPS_AHEAD]
 
+    def set_multi_horizon(self, multi_horizon):
+        self.cfg_model()[mods_model.__MULTI_HORIZON] = multi_horizon
+
+    def is_multi_horizon(self):
+        # models trained before the option was introduced forecast a single horizon
+        return self.cfg_model().get(mods_model.__MULTI_HORIZON, False)
+
+    # number of horizons forecasted by one forward pass
+    def get_horizons(self):
+        return self.get_steps_ahead() if self.is_multi_horizon() else 1
+
     def set_batch_size(self, batch_size):
         self.cfg_model()[mods_model.__BATCH_SIZE] = batch_size
 
@@ -410,13 +462,13 @@ class mods_model:
         self.cfg_model()[mods_model.__TRAIN_TIME_RANGE] = train_time_range.to_str()
 
     def get_train_time_range(self):
-        return self.cfg_model()[mods_model.__TRAIN_TIME_RANGE].from_str()
+        return TimeRange.from_str(self.cfg_model()[mods_model.__TRAIN_TIME_RANGE])
 
     def set_test_time_range(self, test_time_range):
         self.cfg_model()[mods_model.__TEST_TIME_RANGE] = test_time_range.to_str()
 
     def get_test_time_range(self):
-        return self.cfg_model()[mods_model.__TEST_TIME_RANGE].from_str()
+        return TimeRange.from_str(self.cfg_model()[mods_model.__TEST_TIME_RANGE])
 
     def set_window_slide(self, window_slide):
         self.cfg_model()[mods_model.__WINDOW_SLIDE] = window_slide
@@ -435,7 +487,7 @@ class mods_model:
     def get_train_time_ranges_ecluded(self):
         train_time_ranges_excluded = self.cfg_model()[mods_model.__TRAIN_TIME_RANGES_EXCLUDED]
         try:
-            train_time_ranges_excluded = [r.from_str() for r in train_time_ranges_excluded]
+            train_time_ranges_excluded = [TimeRange.from_str(r) for r in train_time_ranges_excluded]
         except Exception as e:
             logging.info(str(e))
             train_time_ranges_excluded = []
@@ -472,6 +524,7 @@ class mods_model:
 
     def get_scaler(self):
         if not self.__scaler:
+            from sklearn.preprocessing import MinMaxScaler
             self.__scaler = MinMaxScaler(feature_range=(0, 1))
         return self.__scaler
 
@@ -499,11 +552,26 @@ class mods_model:
             blocks=cfg.blocks,
             stacked_blocks=cfg.stacked_blocks,
             steps_ahead=cfg.steps_ahead,
+            multi_horizon=cfg.multi_horizon,
             batch_size=cfg.batch_size,
             batch_normalization=cfg.batch_normalization,
-            dropout_rate=cfg.dropout_rate
+            dropout_rate=cfg.dropout_rate,
+            resume=cfg.resume_training,
+            checkpoint_name=None,
+            callbacks=None
     ):
-        multivariate = len(df_train.columns)
+        from keras.callbacks import EarlyStopping, TensorBoard
+        from mods.models.checkpoints import AsyncModelCheckpoint
+        from mods.models.checkpoints import get_checkpoint_dir, load_latest_checkpoint, remove_checkpoints
+
+        if not isinstance(df_train, pd.DataFrame):
+            # out-of-core training; df_train is an iterable of data frames (chunks) in time order
+            chunks = iter(df_train)
+            first = next(chunks)
+            multivariate = len(first.columns)
+            df_train = itertools.chain([first], chunks)
+        else:
+            multivariate = len(df_train.columns)
         self.set_multivariate(multivariate)
 
         if sequence_len is None:
@@ -551,6 +619,11 @@ class mods_model:
         else:
             self.set_steps_ahead(steps_ahead)
 
+        if multi_horizon is None:
+            multi_horizon = self.is_multi_horizon()
+        else:
+            self.set_multi_horizon(multi_horizon)
+
         if batch_size is None:
             batch_size = self.get_batch_size()
         else:
@@ -566,6 +639,200 @@ class mods_model:
         else:
             self.set_dropout_rate(dropout_rate)
 
+        # Checkpointing: resume from the latest checkpoint of the same model configuration
+        checkpoint_dir = get_checkpoint_dir(checkpoint_name or self.name, self.config)
+        initial_epoch = 0
+        self.model = None
+        if resume:
+            initial_epoch, self.model = load_latest_checkpoint(checkpoint_dir, self.__custom_objects())
+            if self.model is not None:
+                logging.info('resuming training from epoch %d: %s' % (initial_epoch, checkpoint_dir))
+        else:
+            remove_checkpoints(checkpoint_dir)
+
+        if self.model is None:
+            self.model = self.__build_model(multivariate, sequence_len, model_type, stacked_blocks)
+
+        checkpoints = AsyncModelCheckpoint(checkpoint_dir, keep=cfg.checkpoints_keep)
+
+        # Earlystopping; its patience and best loss are not restored from the checkpoints
+        earlystops = EarlyStopping(
+            monitor='loss',
+            patience=epochs_patience,
+            verbose=1
+        )
+
+        callbacks_list = [checkpoints, earlystops] + list(callbacks or [])
+
+        # launch tensorboard
+        if cfg.launch_tensorboard:
+            logging.info('launching Tensorboard')
+            subprocess.run(['fuser', '-k', '{}/tcp'.format(cfg.app_tensorboard_port)])  # kill any previous process in that port
+            cfg.ensure_dir(cfg.app_tensorboard_logdir)
+            p = Process(target=launch_tensorboard, args=(cfg.app_tensorboard_port, cfg.app_tensorboard_logdir), daemon=True)
+            p.start()
+            logging.info('Tensorboard PID:%d' % p.pid)
+            tensorboard = TensorBoard(log_dir=os.path.join(cfg.app_tensorboard_logdir, "{}".format(time.time())))
+            callbacks_list.append(tensorboard)
+            logging.info('Tensorboard callback was added to the callback list')
+
+        spool = None
+        if isinstance(df_train, pd.DataFrame):
+            # Replace None by 0
+            df_train.replace('None', 0, inplace=True)
+
+            # Add missing values
+            if self.get_interpolate():
+                df_train.interpolate(inplace=True)
+
+            # keep the last rows of the training data to warm up the model after loading
+            self.set_sample_data(df_train.tail(self.get_history_len(cfg.warmup_windows)))
+
+            # Data transformation
+            # df_train = df_train.values.astype('float32')
+            df_train = self.transform(df_train)
+            utl.log_memory('transform', self.memory_report)
+            df_train = self.normalize(df_train, self.get_scaler())
+            utl.log_memory('normalize', self.memory_report)
+            tsg_train = self.get_tsg(df_train, steps_ahead=steps_ahead, batch_size=batch_size)
+        else:
+            from mods.models.generators import WindowGenerator
+            from mods.models.spool import Spool
+
+            # first pass: transform the chunks, fit the scaler and spool the rows to a file
+            self.set_scaler(None)
+            spool = Spool(self)
+            try:
+                for chunk in df_train:
+                    spool.append(chunk)
+                spooled = spool.open()
+                self.set_sample_data(spool.tail)
+                utl.log_memory('spool', self.memory_report)
+
+                # windows of the memory mapped spool are normalized batch by batch
+                windows, targets = self.get_windows_targets(spooled, steps_ahead)
+                tsg_train = WindowGenerator(windows, targets, batch_size=batch_size, scaler=self.get_scaler())
+            except BaseException:
+                # e.g., a chunk failed to be read or transformed; the spool file is removed
+                spool.close()
+                raise
+
+        if cfg.MODS_DEBUG_MODE:
+            # TODO:
+            logging.info(self.config)
+
+        start_time = time.time()
+        try:
+            self.model.fit_generator(
+                tsg_train,
+                epochs=num_epochs,
+                initial_epoch=initial_epoch,
+                callbacks=callbacks_list
+            )
+        finally:
+            if spool is not None:
+                spool.close()
+        # the checkpoints resume only an interrupted training; a finished one is trained again from scratch
+        remove_checkpoints(checkpoint_dir)
+        training_time = time.time() - start_time
+        self.set_training_time(training_time)
+        logging.info('training time: %s' % training_time)
+        utl.log_memory('fit', self.memory_report)
+
+    def fine_tune(
+            self,
+            df_new,
+            num_epochs=cfg.update_epochs,
+            epochs_patience=cfg.update_epochs_patience,
+            batch_size=None
+    ):
+        """Continues the training of a loaded (keras) model on newly arrived data
+
+        The stored sample data (the last rows seen in the training) precede the
+        new rows, so the first windows of the new data have their history. The
+        scaler range is only extended (never shrunk) by the new data.
+
+        Returns
+        -------
+        float
+            Fine-tuning time
+        """
+        from keras.callbacks import EarlyStopping
+
+        if self.model is None or isinstance(self.model, NumpyModel):
+            raise Exception('fine-tuning requires the model loaded by keras')
+
+        if batch_size is None:
+            batch_size = self.get_batch_size()
+        steps_ahead = self.get_steps_ahead()
+
+        df_new.replace('None', 0, inplace=True)
+        if self.sample_data is not None:
+            missing = [c for c in self.sample_data.columns if c not in df_new.columns]
+            if missing:
+                raise Exception('new data miss the model columns: %s' % missing)
+            df = pd.concat([self.sample_data, df_new[self.sample_data.columns]], ignore_index=True)
+        else:
+            logging.info('[WARNING] model has no sample data, the first windows of the new data are skipped')
+            df = df_new
+
+        if self.get_interpolate():
+            df.interpolate(inplace=True)
+
+        if len(df) < self.get_history_len():
+            raise Exception('not enough data to fine-tune the model: %d rows' % len(df))
+
+        self.set_sample_data(df.tail(self.get_history_len(cfg.warmup_windows)))
+
+        df = self.transform(df)
+
+        scaler = self.get_scaler()
+        data_min = scaler.data_min_.copy()
+        data_max = scaler.data_max_.copy()
+        scaler.partial_fit(df)
+        extended = (scaler.data_min_ < data_min) | (scaler.data_max_ > data_max)
+        if extended.any():
+            logging.info('scaler range extended for features: %s' % list(np.flatnonzero(extended)))
+        df = self.normalize(df, scaler, fit=False)
+
+        tsg = self.get_tsg(df, steps_ahead=steps_ahead, batch_size=batch_size)
+
+        earlystops = EarlyStopping(
+            monitor='loss',
+            patience=epochs_patience,
+            verbose=1
+        )
+
+        start_time = time.time()
+        self.model.fit_generator(
+            tsg,
+            epochs=num_epochs,
+            callbacks=[earlystops]
+        )
+        update_time = time.time() - start_time
+        logging.info('fine-tuning time: %s' % update_time)
+        return update_time
+
+    def __custom_objects(self):
+        from keras_self_attention import SeqSelfAttention
+        from tcn import TCN
+        return {'TCN': TCN, 'SeqSelfAttention': SeqSelfAttention}
+
+    def __build_model(self, multivariate, sequence_len, model_type, stacked_blocks):
+        from keras.layers import Bidirectional
+        from keras.layers import Dense
+        from keras.layers import Flatten
+        from keras.layers import Input
+        from keras.layers import RepeatVector
+        from keras.layers.convolutional import Conv1D
+        from keras.layers.convolutional import MaxPooling1D
+        from keras.layers.recurrent import GRU
+        from keras.layers.recurrent import LSTM
+        from keras.models import Model
+        from keras.optimizers import Adam
+        from keras_self_attention import SeqSelfAttention
+        from tcn import TCN
+
         # Define model
         h = None
         x = Input(shape=(sequence_len, multivariate))
@@ -615,85 +882,37 @@ class mods_model:
         if h is None:
             raise Exception('model not specified (h is None)')
 
-        y = Dense(units=multivariate, activation='sigmoid')(h)  # 'softmax' for multiclass classification
+        # all horizons are forecasted at once; the output is flattened to (horizons * multivariate)
+        y = Dense(units=multivariate * self.get_horizons(), activation='sigmoid')(h)  # 'softmax' for multiclass classification
 
-        self.model = Model(inputs=x, outputs=y)
+        model = Model(inputs=x, outputs=y)
 
         # Drawing model
-        logging.info(self.model.summary())
+        logging.info(model.summary())
 
         # Optimizer
         opt = Adam(clipnorm=1.0, clipvalue=0.5)
 
         # Compile model
-        self.model.compile(
+        model.compile(
             loss='mean_squared_error',  # Adam
             optimizer=opt,              # 'adam', 'adagrad', 'rmsprop', opt
             metrics=['mse', 'mae'])     # 'cosine', 'mape'
 
-        # Checkpointing and earlystopping
-        filepath = os.path.join(cfg.app_checkpoints, self.name + '-{epoch:02d}.hdf5')
-        checkpoints = ModelCheckpoint(
-            filepath,
-            monitor='loss',
-            save_best_only=True,
-            mode=max,
-            verbose=1
-        )
-
-        earlystops = EarlyStopping(
-            monitor='loss',
-            patience=epochs_patience,
-            verbose=1
-        )
-
-        callbacks_list = [checkpoints, earlystops]
-
-        # launch tensorboard
-        if cfg.launch_tensorboard:
-            logging.info('launching Tensorboard')
-            subprocess.run(['fuser', '-k', '{}/tcp'.format(cfg.app_tensorboard_port)])  # kill any previous process in that port
-            p = Process(target=launch_tensorboard, args=(cfg.app_tensorboard_port, cfg.app_tensorboard_logdir), daemon=True)
-            p.start()
-            logging.info('Tensorboard PID:%d' % p.pid)
-            tensorboard = TensorBoard(log_dir=os.path.join(cfg.app_tensorboard_logdir, "{}".format(time.time())))
-            callbacks_list.append(tensorboard)
-            logging.info('Tensorboard callback was added to the callback list')
-
-        # Replace None by 0
-        df_train.replace('None', 0, inplace=True)
-
-        # Add missing values
-        if self.get_interpolate():
-            df_train.interpolate(inplace=True)
-
-        # Data transformation
-        # df_train = df_train.values.astype('float32')
-        df_train = self.transform(df_train)
-        df_train = self.normalize(df_train, self.get_scaler())
-        tsg_train = self.get_tsg(df_train, steps_ahead=steps_ahead, batch_size=batch_size)
-
-        if cfg.MODS_DEBUG_MODE:
-            # TODO:
-            logging.info(self.config)
-
-        start_time = time.time()
-        self.model.fit_generator(
-            tsg_train,
-            epochs=num_epochs,
-            callbacks=callbacks_list
-        )
-        training_time = time.time() - start_time
-        self.set_training_time(training_time)
-        logging.info('training time: %s' % training_time)
+        return model
 
     def plot(self, *args):
         logging.info('this method is not yet implemented')
 
+    # warms up the model by predicting the sample data; the first real prediction
+    # then does not pay for building the graph and initializing the kernels
     def __init(self):
         logging.info('Initializing model')
         if self.sample_data is not None:
+            start_time = time.time()
             self.predict(self.sample_data)
+            self.warmup_time = time.time() - start_time
+            logging.info('warm-up time: %s' % self.warmup_time)
         logging.info('Model initialized')
 
     # First order differential for numpy array      y' = d(y)/d(t) = f(y,t)
@@ -714,12 +933,20 @@ class mods_model:
             return df
 
     def inverse_transform(self, original, pred_denorm):
+        if self.is_multi_horizon():
+            if self.is_delta():
+                # forecasted deltas are accumulated over the horizons starting from the last known row
+                beg = self.get_sequence_len()
+                y = np.asarray(original)[beg:beg + len(pred_denorm)]
+                return y[:, np.newaxis, :] + np.cumsum(pred_denorm, axis=1)
+            return pred_denorm
         if self.is_delta():
             beg = self.get_sequence_len() - self.get_steps_ahead() + 1
             y = original[beg:]
-            utl.dbg_df(y, self.name, 'y.tsv', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
             d = pred_denorm
-            utl.dbg_df(d, self.name, 'd.tsv', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+            if cfg.MODS_DEBUG_MODE:
+                utl.dbg_df(y, self.name, 'y', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+                utl.dbg_df(d, self.name, 'd', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
             return y + d
         else:
             return pred_denorm
@@ -741,6 +968,12 @@ class mods_model:
                 steps_ahead=cfg.steps_ahead,
                 batch_size=cfg.batch_size
                 ):
+        from keras.preprocessing.sequence import TimeseriesGenerator
+
+        if self.is_multi_horizon():
+            from mods.models.generators import WindowGenerator
+            windows, targets = self.get_windows_targets(df, steps_ahead)
+            return WindowGenerator(windows, targets, batch_size=batch_size)
 
         x = y = df
         length = self.get_sequence_len()
@@ -757,46 +990,139 @@ class mods_model:
             batch_size=batch_size
         )
 
-    def predict(self, df):
+    # number of the most recent rows needed to predict the last #forecasts steps
+    def get_history_len(self, forecasts=1):
+        if self.is_delta():
+            # one row is consumed by the first order differential
+            return self.get_sequence_len() + forecasts
+        return self.get_sequence_len() + forecasts - 1
 
-        utl.dbg_df(df, self.name, 'original', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+    # returns all windows of sequence_len rows as a read-only view of the data;
+    # the windows are the same samples as generated by the TimeseriesGenerator
+    def get_windows(self, data):
+        length = self.get_sequence_len()
+        data = np.ascontiguousarray(data)
+        num = max(len(data) - length, 0)
+        return np.lib.stride_tricks.as_strided(
+            data,
+            shape=(num, length) + data.shape[1:],
+            strides=(data.strides[0],) + data.strides,
+            writeable=False
+        )
 
+    # windows and targets for steps_ahead prediction; see @get_tsg
+    # multi-horizon targets are read-only views of shape (windows, steps_ahead, features)
+    def get_windows_targets(self, data, steps_ahead):
+        x = y = data
+        if steps_ahead > 1:
+            x = data[:-(steps_ahead - 1)]
+            y = data[steps_ahead - 1:]
+        windows = self.get_windows(x)
+        if self.is_multi_horizon():
+            y = np.ascontiguousarray(data)[self.get_sequence_len():]
+            targets = np.lib.stride_tricks.as_strided(
+                y,
+                shape=(len(windows), steps_ahead) + y.shape[1:],
+                strides=(y.strides[0],) + y.strides,
+                writeable=False
+            )
+            return windows, targets
+        return windows, y[self.get_sequence_len():len(x)]
+
+    # true (raw) values of all horizons aligned with the predictions; shape (predictions, steps_ahead, features),
+    # the last horizon is the target of a single-horizon model, unknown future values are NaN
+    def get_horizon_targets(self, df):
+        values = np.asarray(df, dtype=np.float64)
+        horizons = self.get_steps_ahead()
+        # the first forecast follows the first window; one more row is consumed by the delta
+        offset = self.get_sequence_len() + (1 if self.is_delta() else 0)
+        num = max(len(values) - offset + 1, 0)
+        padded = np.concatenate([values, np.full((horizons, values.shape[1]), np.nan)])
+        return np.stack([padded[offset + h:offset + h + num] for h in range(horizons)], axis=1)
+
+    # interpolated and transformed data as contiguous arrays; these do not depend on the trained model,
+    # so they can be shared by the models of the same @get_prepare_key
+    def prepare(self, df):
+        values = self.__values(df)
+        return values, self.transform(values)
+
+    def get_prepare_key(self):
+        return self.get_interpolate(), self.is_delta()
+
+    # the data are converted to a contiguous array once; float64 keeps the predictions
+    # identical to the pandas/scikit-learn operations, float32 is used in the memory lean mode
+    def __values(self, df):
+        values = np.array(df, dtype=np.float32 if cfg.memory_lean else np.float64, order='C')
         if self.get_interpolate():
-            df = df.interpolate()
-            utl.dbg_df(df, self.name, 'interpolated', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
-
-        trans = self.transform(df)
-        utl.dbg_df(trans, self.name, 'transformed', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+            utl.interpolate_nan(values)
+        if cfg.MODS_DEBUG_MODE:
+            utl.dbg_df(values, self.name, 'interpolated', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+        return values
 
-        norm = self.normalize(trans, self.get_scaler(), fit=False)
-        utl.dbg_df(norm, self.name, 'normalized', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+    # batch_size overrides the batch size of the model for this call; the model may be shared by concurrent requests
+    def predict(self, df, prepared=None, batch_size=None):
 
-        # append #steps_ahead dummy rows at the end of the norm
-        # np.ndarray in order to tsg generate last sample
-        # for prediction of the future state
-        dummy = [np.nan] * self.get_multivariate()
-        for i in range(self.get_steps_ahead()):
-            norm = np.append(norm, [dummy], axis=0)
-        utl.dbg_df(norm, self.name, 'normalized+nan', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+        if cfg.MODS_DEBUG_MODE:
+            utl.dbg_df(df, self.name, 'original', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
 
-        tsg = self.get_tsg(norm, steps_ahead=self.get_steps_ahead(), batch_size=self.get_batch_size())
-        utl.dbg_tsg(tsg, 'norm_tsg', debug=cfg.MODS_DEBUG_MODE)
+        if prepared is None:
+            values, trans = self.__values(df), None
+        else:
+            values, trans = prepared
+
+        steps_ahead = self.get_steps_ahead()
+        rows = len(values) - 1 if self.is_delta() else len(values)
+        rows = max(rows, 0)
+
+        # transformed rows followed by #steps_ahead NaN rows in one preallocated array;
+        # the dummy rows let the last window predict the future state
+        norm = np.empty((rows + steps_ahead, self.get_multivariate()), dtype=values.dtype)
+        if trans is not None:
+            norm[:rows] = trans
+        elif self.is_delta():
+            np.subtract(values[1:], values[:-1], out=norm[:rows])
+        else:
+            norm[:rows] = values
+        norm[rows:] = np.nan
+        if cfg.MODS_DEBUG_MODE:
+            utl.dbg_df(norm[:rows], self.name, 'transformed', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
 
-        pred = self.model.predict_generator(tsg)
-        utl.dbg_df(pred, self.name, 'prediction', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+        # normalize in place the same way as MinMaxScaler.transform
+        scaler = self.get_scaler()
+        norm[:rows] *= scaler.scale_
+        norm[:rows] += scaler.min_
+        if cfg.MODS_DEBUG_MODE:
+            utl.dbg_scaler(scaler, 'normalize', debug=cfg.MODS_DEBUG_MODE)
+            utl.dbg_df(norm, self.name, 'normalized+nan', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
 
-        pred_denorm = self.inverse_normalize(pred)
-        utl.dbg_df(pred_denorm, self.name, 'pred_denormalized', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+        windows, _ = self.get_windows_targets(norm, steps_ahead)
 
-        pred_invtrans = self.inverse_transform(df, pred_denorm)
-        utl.dbg_df(pred_invtrans, self.name, 'pred_inv_trans', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+        batch_size = batch_size or self.get_batch_size()
+        if self.batcher is not None:
+            pred = self.batcher.predict(windows, batch_size=batch_size)
+        else:
+            pred = self.model.predict(windows, batch_size=batch_size)
+        if cfg.MODS_DEBUG_MODE:
+            utl.dbg_df(pred, self.name, 'prediction', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
+
+        # inverse normalization in place the same way as MinMaxScaler.inverse_transform
+        pred_denorm = np.array(pred)
+        if self.is_multi_horizon():
+            # (windows, steps_ahead * features) --> (windows, steps_ahead, features)
+            pred_denorm = pred_denorm.reshape((len(pred), steps_ahead, self.get_multivariate()))
+        pred_denorm -= scaler.min_
+        pred_denorm /= scaler.scale_
+        if cfg.MODS_DEBUG_MODE:
+            utl.dbg_df(pred_denorm, self.name, 'pred_denormalized', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
 
-        if isinstance(pred_invtrans, pd.DataFrame):
-            pred_invtrans = pred_invtrans.values
+        pred_invtrans = self.inverse_transform(values, pred_denorm)
+        if cfg.MODS_DEBUG_MODE:
+            utl.dbg_df(pred_invtrans, self.name, 'pred_inv_trans', print=cfg.MODS_DEBUG_MODE, save=cfg.MODS_DEBUG_MODE)
 
         return pred_invtrans
 
-    # This function wraps pandas._read_csv() and reads the csv data
+    # This function wraps pandas._read_csv() and reads the csv data;
+    # with the dtype of the columns and the 'c' engine, the values are parsed directly to numbers
     def read_file_or_buffer(self, *args, **kwargs):
         try:
             fill_missing_rows_in_timeseries = kwargs['fill_missing_rows_in_timeseries']
@@ -804,7 +1130,7 @@ class mods_model:
             fill_missing_rows_in_timeseries = False
         if kwargs is not None:
             kwargs = {k: v for k, v in kwargs.items() if k in [
-                'usecols', 'sep', 'skiprows', 'skipfooter', 'engine', 'header'
+                'usecols', 'sep', 'skiprows', 'skipfooter', 'engine', 'header', 'dtype', 'na_values'
             ]}
             if 'usecols' in kwargs:
                 if isinstance(kwargs['usecols'], str):
@@ -835,9 +1161,11 @@ class mods_model:
         trans = self.transform(interpol)
         # logging.info('transformed:\n%s' % transf)
 
-        norm = self.normalize(trans, self.get_scaler())
+        norm = self.normalize(trans, self.get_scaler(), fit=False)
         # logging.info('normalized:\n%s' % norm)
 
-        tsg = self.get_tsg(norm, self.get_steps_ahead(), cfg.batch_size_test)
+        windows, targets = self.get_windows_targets(norm, self.get_steps_ahead())
+        if self.is_multi_horizon():
+            targets = targets.reshape((len(targets), -1))
 
-        return self.model.evaluate_generator(tsg)
+        return self.model.evaluate(windows, targets, batch_size=cfg.batch_size_test)
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Pure NumPy inference engine for trained MODS models
+
+The weights of a trained keras model are exported layer by layer into a npz
+file; the forward pass is then computed by NumPy only, without importing
+keras, tensorflow, tcn or keras_self_attention.
+
+Supported layers: InputLayer, Dense, Flatten, Dropout, Activation, Conv1D,
+MaxPooling1D, RepeatVector, LSTM, GRU and Bidirectional (LSTM, GRU); i.e.,
+MLP, autoencoderMLP, Conv1D, GRU, LSTM, bidirectLSTM, stackedLSTM and
+seq2seqLSTM model types.
+
+@author: stefan dlugolinsky
+"""
+
+import io
+import json
+
+import numpy as np
+
+SPEC_KEY = '__spec__'
+
+
+def sigmoid(x):
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+def relu(x):
+    return np.maximum(x, 0.0)
+
+
+def linear(x):
+    return x
+
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'sigmoid': sigmoid,
+    'hard_sigmoid': hard_sigmoid,
+    'relu': relu,
+    'tanh': np.tanh,
+    'linear': linear,
+    'softmax': softmax,
+}
+
+
+def activation(name):
+    try:
+        return ACTIVATIONS[name]
+    except KeyError:
+        raise NotImplementedError('activation not supported by the numpy engine: %s' % name)
+
+
+def dense(x, config, weights):
+    y = np.dot(x, weights[0])
+    if config.get('use_bias', True):
+        y += weights[1]
+    return activation(config['activation'])(y)
+
+
+def conv1d(x, config, weights):
+    kernel = weights[0]                         # (kernel_size, input_dim, filters)
+    kernel_size = kernel.shape[0]
+    stride = config['strides'][0]
+    dilation = config['dilation_rate'][0]
+    padding = config['padding']
+    span = (kernel_size - 1) * dilation
+    if padding == 'causal':
+        x = np.pad(x, ((0, 0), (span, 0), (0, 0)), mode='constant')
+    elif padding == 'same':
+        x = np.pad(x, ((0, 0), (span // 2, span - span // 2), (0, 0)), mode='constant')
+    elif padding != 'valid':
+        raise NotImplementedError('Conv1D padding not supported by the numpy engine: %s' % padding)
+    steps = (x.shape[1] - span - 1) // stride + 1
+    y = np.zeros((x.shape[0], steps, kernel.shape[2]), dtype=x.dtype)
+    for k in range(kernel_size):
+        beg = k * dilation
+        y += np.dot(x[:, beg:beg + (steps - 1) * stride + 1:stride], kernel[k])
+    if config.get('use_bias', True):
+        y += weights[1]
+    return activation(config['activation'])(y)
+
+
+def max_pooling1d(x, config, weights):
+    pool = config['pool_size'][0]
+    stride = config['strides'][0]
+    if config['padding'] != 'valid':
+        raise NotImplementedError('MaxPooling1D padding not supported by the numpy engine')
+    steps = (x.shape[1] - pool) // stride + 1
+    y = x[:, 0:(steps - 1) * stride + 1:stride]
+    for p in range(1, pool):
+        y = np.maximum(y, x[:, p:p + (steps - 1) * stride + 1:stride])
+    return y
+
+
+def flatten(x, config, weights):
+    return x.reshape((x.shape[0], -1))
+
+
+def identity(x, config, weights):
+    return x
+
+
+def activation_layer(x, config, weights):
+    return activation(config['activation'])(x)
+
+
+def repeat_vector(x, config, weights):
+    return np.repeat(x[:, np.newaxis, :], config['n'], axis=1)
+
+
+def lstm(x, config, weights):
+    kernel, recurrent_kernel = weights[0], weights[1]
+    units = config['units']
+    act = activation(config['activation'])
+    rec_act = activation(config['recurrent_activation'])
+    xw = np.dot(x, kernel)
+    if config.get('use_bias', True):
+        xw += weights[2]
+    steps = range(x.shape[1])
+    if config.get('go_backwards', False):
+        steps = reversed(steps)
+    h = np.zeros((x.shape[0], units), dtype=x.dtype)
+    c = np.zeros((x.shape[0], units), dtype=x.dtype)
+    outputs = []
+    for t in steps:
+        z = xw[:, t] + np.dot(h, recurrent_kernel)
+        i = rec_act(z[:, :units])
+        f = rec_act(z[:, units:2 * units])
+        c = f * c + i * act(z[:, 2 * units:3 * units])
+        o = rec_act(z[:, 3 * units:])
+        h = o * act(c)
+        outputs.append(h)
+    if config.get('return_sequences', False):
+        return np.stack(outputs, axis=1)
+    return h
+
+
+def gru(x, config, weights):
+    kernel, recurrent_kernel = weights[0], weights[1]
+    units = config['units']
+    act = activation(config['activation'])
+    rec_act = activation(config['recurrent_activation'])
+    use_bias = config.get('use_bias', True)
+    reset_after = config.get('reset_after', False)
+    xw = np.dot(x, kernel)
+    input_bias = recurrent_bias = 0.0
+    if use_bias:
+        bias = weights[2]
+        if reset_after:
+            input_bias, recurrent_bias = bias[0], bias[1]
+        else:
+            input_bias = bias
+    xw += input_bias
+    steps = range(x.shape[1])
+    if config.get('go_backwards', False):
+        steps = reversed(steps)
+    h = np.zeros((x.shape[0], units), dtype=x.dtype)
+    outputs = []
+    for t in steps:
+        xz, xr, xh = xw[:, t, :units], xw[:, t, units:2 * units], xw[:, t, 2 * units:]
+        if reset_after:
+            inner = np.dot(h, recurrent_kernel) + recurrent_bias
+            z = rec_act(xz + inner[:, :units])
+            r = rec_act(xr + inner[:, units:2 * units])
+            hh = act(xh + r * inner[:, 2 * units:])
+        else:
+            z = rec_act(xz + np.dot(h, recurrent_kernel[:, :units]))
+            r = rec_act(xr + np.dot(h, recurrent_kernel[:, units:2 * units]))
+            hh = act(xh + np.dot(r * h, recurrent_kernel[:, 2 * units:]))
+        h = z * h + (1.0 - z) * hh
+        outputs.append(h)
+    if config.get('return_sequences', False):
+        return np.stack(outputs, axis=1)
+    return h
+
+
+RECURRENT_LAYERS = {
+    'LSTM': lstm,
+    'GRU': gru,
+}
+
+
+def bidirectional(x, config, weights):
+    inner = config['layer']
+    forward = RECURRENT_LAYERS.get(inner['class_name'])
+    if forward is None:
+        raise NotImplementedError('Bidirectional(%s) not supported by the numpy engine' % inner['class_name'])
+    n = len(weights) // 2
+    config_fw = dict(inner['config'], go_backwards=False)
+    config_bw = dict(inner['config'], go_backwards=True)
+    y_fw = forward(x, config_fw, weights[:n])
+    y_bw = forward(x, config_bw, weights[n:])
+    if inner['config'].get('return_sequences', False):
+        y_bw = y_bw[:, ::-1]
+    merge_mode = config.get('merge_mode', 'concat')
+    if merge_mode == 'concat':
+        return np.concatenate([y_fw, y_bw], axis=-1)
+    elif merge_mode == 'sum':
+        return y_fw + y_bw
+    elif merge_mode == 'ave':
+        return (y_fw + y_bw) / 2
+    elif merge_mode == 'mul':
+        return y_fw * y_bw
+    raise NotImplementedError('Bidirectional merge_mode not supported by the numpy engine: %s' % merge_mode)
+
+
+LAYERS = {
+    'InputLayer': identity,
+    'Dropout': identity,
+    'Dense': dense,
+    'Flatten': flatten,
+    'Activation': activation_layer,
+    'Conv1D': conv1d,
+    'MaxPooling1D': max_pooling1d,
+    'RepeatVector': repeat_vector,
+    'LSTM': lstm,
+    'GRU': gru,
+    'Bidirectional': bidirectional,
+}
+
+
+def is_supported(keras_model):
+    return all(layer.__class__.__name__ in LAYERS for layer in keras_model.layers)
+
+
+def export_keras_model(keras_model):
+    """Extracts layer specification and weights from a sequential chain of keras layers.
+
+    Parameters
+    ----------
+    keras_model : keras.models.Model
+        Trained keras model
+
+    Returns
+    -------
+    NumpyModel
+        Model computing the same forward pass using NumPy only
+    """
+    layers = []
+    weights = []
+    for layer in keras_model.layers:
+        class_name = layer.__class__.__name__
+        if class_name not in LAYERS:
+            raise NotImplementedError('layer not supported by the numpy engine: %s' % class_name)
+        config = layer.get_config()
+        if class_name == 'Bidirectional':
+            # keep only the serializable part of the wrapped layer
+            config = {
+                'merge_mode': config.get('merge_mode', 'concat'),
+                'layer': {
+                    'class_name': config['layer']['class_name'],
+                    'config': config['layer']['config']
+                }
+            }
+        layers.append({'class_name': class_name, 'config': config})
+        weights.append([np.asarray(w, dtype=np.float32) for w in layer.get_weights()])
+    return NumpyModel(layers, weights)
+
+
+class NumpyModel:
+    # the only loss MODS models are compiled with: 'mean_squared_error' and metrics=['mse', 'mae']
+    metrics_names = ['loss', 'mse', 'mae']
+
+    def __init__(self, layers, weights, dtype=np.float32):
+        self.layers = layers
+        self.weights = weights
+        self.dtype = dtype
+
+    def __call__(self, x):
+        y = np.asarray(x, dtype=self.dtype)
+        for layer, weights in zip(self.layers, self.weights):
+            y = LAYERS[layer['class_name']](y, layer['config'], weights)
+        return y
+
+    def predict(self, x, batch_size=None, **kwargs):
+        # batch_size does not affect the results; larger chunks amortize the python overhead of recurrent layers
+        chunk = max(batch_size or 0, 1024)
+        if len(x) <= chunk:
+            return self(x)
+        return np.concatenate([self(x[i:i + chunk]) for i in range(0, len(x), chunk)], axis=0)
+
+    def evaluate(self, x, y, batch_size=None, **kwargs):
+        pred = self.predict(x, batch_size=batch_size)
+        err = pred - np.asarray(y, dtype=self.dtype)
+        mse = float(np.mean(np.square(err)))
+        mae = float(np.mean(np.abs(err)))
+        return [mse, mse, mae]
+
+    def to_bytes(self):
+        arrays = {SPEC_KEY: np.array(json.dumps(self.layers))}
+        for i, weights in enumerate(self.weights):
+            for j, w in enumerate(weights):
+                arrays['w%d_%d' % (i, j)] = w
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            layers = json.loads(str(npz[SPEC_KEY][()]))
+            weights = []
+            for i in range(len(layers)):
+                w = []
+                j = 0
+                while 'w%d_%d' % (i, j) in npz.files:
+                    w.append(npz['w%d_%d' % (i, j)])
+                    j += 1
+                weights.append(w)
+        return cls(layers, weights)
+
+
+def max_abs_diff(keras_model, numpy_model, x):
+    """Returns maximal absolute difference between keras and numpy predictions for the input x"""
+    y_keras = keras_model.predict(x)
+    y_numpy = numpy_model.predict(x)
+    return float(np.max(np.abs(y_keras - y_numpy)))
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Stateful incremental predictor for streaming window rows
+
+Instead of re-running the whole mods_model.predict pipeline, the predictor
+keeps a ring buffer of the last sequence_len normalized (delta) rows and the
+last raw rows. Each new row is transformed in O(1) and followed by a single
+forward pass over the current window.
+
+    predictor = OnlinePredictor(model)
+    predictor.prime(df_history)
+    forecast = predictor.update(row)
+
+With a scorer (see mods.anomaly.ResidualScorer), each new row is scored
+against the forecast made for it and the result is kept in last_score.
+
+@author: stefan dlugolinsky
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class OnlinePredictor:
+
+    def __init__(self, model, scorer=None):
+        """
+        Parameters
+        ----------
+        model : mods.models.mods_model.mods_model
+            Loaded (or trained) MODS model
+        scorer : mods.anomaly.ResidualScorer
+            Scores the new rows against their (first horizon) forecasts
+        """
+        self.model = model
+        scaler = model.get_scaler()
+        self.__min = scaler.min_
+        self.__scale = scaler.scale_
+        self.__length = model.get_sequence_len()
+        self.__steps_ahead = model.get_steps_ahead()
+        self.__delta = model.is_delta()
+        self.__multi_horizon = model.is_multi_horizon()
+        self.__interpolate = model.get_interpolate()
+        features = model.get_multivariate()
+        # the buffer is kept twice, so the last sequence_len rows are always a contiguous slice
+        self.__window = np.zeros((2 * self.__length, features))
+        self.__pos = 0
+        # raw rows the predicted delta is added to; the oldest one is used
+        self.__raw = np.zeros((self.__steps_ahead, features))
+        self.__raw_pos = 0
+        self.__last = None
+        self.__count = 0
+        self.__features = features
+        self.scorer = scorer
+        self.last_score = None
+        # forecasts of the next rows; a single-horizon model forecasts steps_ahead rows ahead
+        self.__pending = deque(maxlen=1 if self.__multi_horizon else self.__steps_ahead)
+
+    def reset(self):
+        self.__window.fill(0)
+        self.__pos = 0
+        self.__raw.fill(0)
+        self.__raw_pos = 0
+        self.__last = None
+        self.__count = 0
+        self.__pending.clear()
+        self.last_score = None
+
+    def is_ready(self):
+        return self.__count >= self.__length
+
+    def prime(self, df):
+        """Feeds historical rows; only the last one is followed by a forward pass"""
+        if isinstance(df, pd.DataFrame):
+            df = df.values
+        forecast = None
+        for i, row in enumerate(df):
+            forecast = self.update(row, forecast=(i == len(df) - 1))
+        return forecast
+
+    def update(self, row, forecast=True):
+        """Appends a new raw row and returns the forecast (None until sequence_len rows are buffered)
+
+        Parameters
+        ----------
+        row : array-like
+            Raw feature values in the order of the model's columns
+        forecast : bool
+            Run the forward pass; set to False while priming the buffer
+
+        Returns
+        -------
+        numpy.ndarray
+            The same forecast as the last row of mods_model.predict over the rows seen so far;
+            (steps_ahead, features) for multi-horizon models
+        """
+        row = np.asarray(row, dtype=np.float64)
+        if self.scorer is None:
+            return self.__update(row, forecast)
+
+        expected = self.__pending[0] if len(self.__pending) == self.__pending.maxlen else None
+        self.last_score = None if expected is None else self.scorer.update(row, expected)
+        pred = self.__update(row, forecast)
+        if pred is None:
+            self.__pending.append(None)
+        else:
+            self.__pending.append(pred[0] if self.__multi_horizon else pred)
+        return pred
+
+    def __update(self, row, forecast):
+        if self.__interpolate and self.__last is not None:
+            # trailing missing values are interpolated by the last valid value
+            missing = np.isnan(row)
+            if missing.any():
+                row = np.where(missing, self.__last, row)
+
+        if self.__delta:
+            if self.__last is None:
+                self.__last = row
+                self.__push_raw(row)
+                return None
+            value = row - self.__last
+        else:
+            value = row
+        self.__last = row
+        self.__push_raw(row)
+
+        # normalize the same way as MinMaxScaler.transform
+        value = value * self.__scale
+        value += self.__min
+        self.__window[self.__pos] = value
+        self.__window[self.__pos + self.__length] = value
+        self.__pos = (self.__pos + 1) % self.__length
+        self.__count += 1
+
+        if not forecast or not self.is_ready():
+            return None
+
+        window = self.__window[self.__pos:self.__pos + self.__length]
+        pred = self.model.model.predict(window[np.newaxis], batch_size=1)
+        if self.__multi_horizon:
+            pred = pred.reshape((-1, self.__features))
+        # inverse normalization the same way as MinMaxScaler.inverse_transform
+        pred -= self.__min
+        pred /= self.__scale
+        if self.__multi_horizon:
+            # see mods_model.inverse_transform
+            return self.__last + np.cumsum(pred, axis=0) if self.__delta else pred
+        if self.__delta:
+            # the oldest of the last steps_ahead raw rows; see mods_model.inverse_transform
+            return self.__raw[self.__raw_pos] + pred[0]
+        return pred[0]
+
+    def __push_raw(self, row):
+        self.__raw[self.__raw_pos] = row
+        self.__raw_pos = (self.__raw_pos + 1) % self.__steps_ahead
@@ -42,6 +42,8 @@ def main():
     kwargs['full_paths'] = str(True)
     if 'time_ranges_excluded' in kwargs.keys() and isinstance(kwargs['time_ranges_excluded'], str):
         kwargs['time_ranges_excluded'] = kwargs['time_ranges_excluded'].split(';')
+    if 'model_names' in kwargs.keys() and isinstance(kwargs['model_names'], str):
+        kwargs['model_names'] = kwargs['model_names'].split(';')
     if 'model_file' in kwargs.keys():
         kwargs['model_name'] = kwargs['model_file']
     ret = api.predict(**kwargs)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Replication of the model files to the remote storage (app_models_remote)
+
+The copies (replicas) are queued in a sqlite database in app_cache and run
+by worker threads of the api process, so a training returns as soon as its
+model is saved locally:
+
+    queued -> copying -> done
+       ^         |
+       \\--------+-> failed
+
+A replica is streamed in blocks to a temporary file next to the target,
+read back and verified by sha256 before it is renamed to the target, so a
+partial or corrupted copy never appears in the remote storage. A failed
+copy is retried with an exponential backoff. Identical content is not
+copied twice: the copy is skipped if the target already has the same
+sha256, and a file identical to a replica already made in the same
+directory is hard-linked to it where the storage supports it.
+
+    replicator = get_replicator()
+    replica = replicator.submit(model_file, cfg.app_models_remote)
+    replicator.status(replica['id'])
+    replica = replicator.wait(replica['id'])
+
+The replicas may be listed from the command line too:
+
+    python mods/models/replication.py list
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import mods.config as cfg
+
+QUEUED = 'queued'
+COPYING = 'copying'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = [DONE, FAILED]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replicas (
+    id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    state TEXT NOT NULL,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    next_try REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    pid INTEGER,
+    size INTEGER,
+    sha256 TEXT,
+    deduplicated TEXT,
+    error TEXT
+)
+"""
+
+
+def file_sha256(file, chunk_size=None):
+    m = hashlib.sha256()
+    with open(file, mode='rb') as f:
+        for block in iter(lambda: f.read(chunk_size or cfg.replication_chunk_size), b''):
+            m.update(block)
+    return m.hexdigest()
+
+
+def copy_verified(source, target, chunk_size=None):
+    """
+    Streams the source to the target and verifies the copy by sha256 before
+    it replaces the target; returns (size, sha256) of the copy
+    """
+    chunk_size = chunk_size or cfg.replication_chunk_size
+    part = '%s.%s.part' % (target, uuid.uuid4().hex[:8])
+    stat = os.stat(source)
+    m = hashlib.sha256()
+    try:
+        with open(source, mode='rb') as src, open(part, mode='wb') as dst:
+            for block in iter(lambda: src.read(chunk_size), b''):
+                m.update(block)
+                dst.write(block)
+            dst.flush()
+            os.fsync(dst.fileno())
+        if (os.stat(source).st_mtime_ns, os.stat(source).st_size) != (stat.st_mtime_ns, stat.st_size):
+            raise IOError('%s changed while being copied' % source)
+        if file_sha256(part, chunk_size) != m.hexdigest():
+            raise IOError('sha256 of the copy %s does not match %s' % (part, source))
+        os.replace(part, target)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return stat.st_size, m.hexdigest()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ReplicaStore:
+    """
+    Persistent state of the replicas; a connection is opened for each
+    operation, so the store may be used by several threads and processes
+    """
+
+    def __init__(self, db_file=None):
+        self.db_file = db_file or os.path.join(cfg.ensure_dir(cfg.app_cache), cfg.replication_db)
+        with closing(self.__connect()) as db:
+            db.execute(SCHEMA)
+
+    def __connect(self):
+        # autocommit; the transaction of @claim is explicit
+        db = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def add(self, source, target):
+        """Queues a replica; a replica of the source to the target already queued is returned instead"""
+        with closing(self.__connect()) as db:
+            row = db.execute('SELECT id FROM replicas WHERE source = ? AND target = ? AND state = ?',
+                             (source, target, QUEUED)).fetchone()
+            if row is not None:
+                return row['id']
+            replica_id = uuid.uuid4().hex
+            now = time.time()
+            db.execute(
+                'INSERT INTO replicas (id, source, target, state, submitted, next_try) VALUES (?, ?, ?, ?, ?, ?)',
+                (replica_id, source, target, QUEUED, now, now)
+            )
+        return replica_id
+
+    def get(self, replica_id):
+        with closing(self.__connect()) as db:
+            row = db.execute('SELECT * FROM replicas WHERE id = ?', (replica_id,)).fetchone()
+            return dict(row) if row is not None else None
+
+    def list(self, state=None, limit=100):
+        """The latest replicas first"""
+        with closing(self.__connect()) as db:
+            if state is None:
+                rows = db.execute('SELECT * FROM replicas ORDER BY submitted DESC LIMIT ?', (limit,))
+            else:
+                rows = db.execute('SELECT * FROM replicas WHERE state = ? ORDER BY submitted DESC LIMIT ?',
+                                  (state, limit))
+            return [dict(row) for row in rows.fetchall()]
+
+    def update(self, replica_id, **values):
+        sql = 'UPDATE replicas SET %s WHERE id = ?' % ', '.join('%s = ?' % column for column in values)
+        with closing(self.__connect()) as db:
+            db.execute(sql, list(values.values()) + [replica_id])
+
+    def claim(self):
+        """Marks the oldest replica due to be copied as copying and returns it; None if there is none"""
+        with closing(self.__connect()) as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT * FROM replicas WHERE state = ? AND next_try <= ? ORDER BY submitted LIMIT 1',
+                                 (QUEUED, time.time())).fetchone()
+                if row is not None:
+                    db.execute('UPDATE replicas SET state = ?, started = ?, pid = ? WHERE id = ?',
+                               (COPYING, time.time(), os.getpid(), row['id']))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        replica = dict(row)
+        replica['state'] = COPYING
+        return replica
+
+    def find_copy(self, sha256, size, directory):
+        """Target of a replica of the content already made in the directory; None if there is none"""
+        with closing(self.__connect()) as db:
+            rows = db.execute('SELECT target FROM replicas WHERE state = ? AND sha256 = ? AND size = ?'
+                              ' ORDER BY finished DESC', (DONE, sha256, size)).fetchall()
+        for row in rows:
+            if os.path.dirname(row['target']) == directory:
+                return row['target']
+        return None
+
+    def recover(self):
+        """Queues again the replicas left copying by the exited processes; returns their number"""
+        with closing(self.__connect()) as db:
+            rows = db.execute('SELECT id, pid FROM replicas WHERE state = ?', (COPYING,)).fetchall()
+            interrupted = [row['id'] for row in rows if not row['pid'] or not pid_alive(row['pid'])]
+            for replica_id in interrupted:
+                db.execute('UPDATE replicas SET state = ?, next_try = ? WHERE id = ? AND state = ?',
+                           (QUEUED, time.time(), replica_id, COPYING))
+        return len(interrupted)
+
+
+class Replicator:
+    """
+    Worker threads copying the queued replicas of a store; they are started
+    by the first @submit or @start. A replicator with no workers only queues
+    the replicas for the replicator of the api process (e.g., in the workers
+    of the asynchronous trainings)
+    """
+
+    def __init__(
+            self,
+            store=None,
+            workers=None,
+            retries=cfg.replication_retries,
+            backoff=cfg.replication_backoff,
+            backoff_max=cfg.replication_backoff_max,
+            poll_interval=cfg.replication_poll_interval
+    ):
+        self.store = store or ReplicaStore()
+        self.workers = cfg.replication_workers if workers is None else workers
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__stopped = False
+        self.__threads = []
+
+    def start(self):
+        with self.__lock:
+            if self.__threads or not self.workers:
+                return
+            recovered = self.store.recover()
+            if recovered:
+                logging.info('[WARNING] %d interrupted replicas queued again' % recovered)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.__run, name='replicator-%d' % i, daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+
+    def submit(self, file, remote_dir):
+        """Queues a copy of the file into the remote directory; returns the replica"""
+        source = os.path.abspath(file)
+        target = os.path.join(os.path.abspath(remote_dir), os.path.basename(file))
+        replica_id = self.store.add(source, target)
+        logging.info('replica %s queued: %s -> %s' % (replica_id, source, target))
+        self.start()
+        self.__wakeup.set()
+        return self.store.get(replica_id)
+
+    def status(self, replica_id):
+        return self.store.get(replica_id)
+
+    def list(self, state=None, limit=100):
+        return self.store.list(state, limit)
+
+    def wait(self, replica_id, timeout=None):
+        """Waits until the replica is done or failed; returns the replica (its state is not final on timeout)"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            replica = self.store.get(replica_id)
+            if replica is None or replica['state'] in FINISHED:
+                return replica
+            if deadline is not None and time.time() >= deadline:
+                return replica
+            time.sleep(min(self.poll_interval, 0.1))
+
+    def shutdown(self):
+        """Stops the workers after their current copies"""
+        with self.__lock:
+            self.__stopped = True
+            threads, self.__threads = self.__threads, []
+        self.__wakeup.set()
+        for thread in threads:
+            thread.join()
+
+    def __run(self):
+        while True:
+            with self.__lock:
+                if self.__stopped:
+                    return
+            try:
+                replica = self.store.claim()
+            except sqlite3.Error:
+                logging.exception('replicator')
+                replica = None
+            if replica is None:
+                self.__wakeup.wait(self.poll_interval)
+                self.__wakeup.clear()
+                continue
+            self.__replicate(replica)
+
+    def __replicate(self, replica):
+        source, target = replica['source'], replica['target']
+        attempts = replica['attempts'] + 1
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            size = os.path.getsize(source)
+            sha256 = file_sha256(source)
+            deduplicated = None
+            if os.path.isfile(target) and os.path.getsize(target) == size and file_sha256(target) == sha256:
+                # e.g., a model saved again unchanged
+                deduplicated = target
+            else:
+                copy = self.store.find_copy(sha256, size, os.path.dirname(target))
+                if copy is not None and self.__link(copy, target, sha256):
+                    deduplicated = copy
+                else:
+                    size, sha256 = copy_verified(source, target)
+        except Exception as e:
+            error = '%s: %s' % (type(e).__name__, e)
+            if attempts < self.retries:
+                delay = min(self.backoff * 2 ** (attempts - 1), self.backoff_max)
+                logging.info('[WARNING] replica %s: attempt %d failed, retrying in %.1fs: %s' % (
+                    replica['id'], attempts, delay, error))
+                self.store.update(replica['id'], state=QUEUED, attempts=attempts, next_try=time.time() + delay,
+                                  error=error)
+            else:
+                logging.info('[WARNING] replica %s failed after %d attempts: %s' % (replica['id'], attempts, error))
+                self.store.update(replica['id'], state=FAILED, attempts=attempts, finished=time.time(), error=error)
+            return
+        self.store.update(replica['id'], state=DONE, attempts=attempts, finished=time.time(), size=size,
+                          sha256=sha256, deduplicated=deduplicated, error=None)
+        logging.info('replica %s done: %s -> %s (%d B, sha256 %s%s)' % (
+            replica['id'], source, target, size, sha256,
+            ', deduplicated by %s' % deduplicated if deduplicated else ''))
+
+    @staticmethod
+    def __link(copy, target, sha256):
+        """Hard-links the target to an identical copy; False if the copy changed or links are not supported"""
+        part = '%s.%s.part' % (target, uuid.uuid4().hex[:8])
+        try:
+            os.link(copy, part)
+            if file_sha256(part) != sha256:
+                os.remove(part)
+                return False
+            os.replace(part, target)
+            return True
+        except OSError:
+            if os.path.exists(part):
+                os.remove(part)
+            return False
+
+
+_replicator = None
+_replicator_lock = threading.Lock()
+
+
+def get_replicator():
+    """The replicator of this process"""
+    global _replicator
+    with _replicator_lock:
+        if _replicator is None:
+            _replicator = Replicator()
+        return _replicator
+
+
+def main():
+    replicator = Replicator(ReplicaStore(args.db), workers=0)
+    if args.command == 'list':
+        for replica in replicator.list(args.state, args.limit):
+            print('%s\t%s\t%s\t%s' % (replica['id'], replica['state'], replica['attempts'], replica['target']))
+    elif args.command == 'status':
+        print(json.dumps(replicator.status(args.replica_id), indent=2))
+    elif args.command == 'wait':
+        print(json.dumps(replicator.wait(args.replica_id, args.timeout), indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replication of the models to the remote storage')
+    parser.add_argument('command', choices=['list', 'status', 'wait'])
+    parser.add_argument('replica_id', nargs='?')
+    parser.add_argument('--db', default=None, help='replication database; %s in app_cache by default'
+                                                    % cfg.replication_db)
+    parser.add_argument('--state', default=None)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=None)
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Cache of the prediction results
+
+A result is stored under a key made of the digest of the model file, the
+fingerprint of the data segments (see utils.datapool_fingerprint) and the
+predict arguments affecting the result; the batch size and the response
+format are not part of the key. A changed model or data segment thus
+yields a new key and the outdated results are never returned again; they
+are evicted as the least recently used ones, or when they are older than
+the ttl:
+
+    cache = get_cache()
+    key = cache_key(file_digest(model_file), fingerprint, time_range, ...)
+    result = cache.get(key)
+    if result is None:
+        result = ...
+        cache.put(key, result, size=predictions.nbytes)
+
+@author: stefan dlugolinsky
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import mods.config as cfg
+
+
+class ResultCache:
+    """Thread-safe LRU cache of at most max_entries results of max_bytes in total, expiring after ttl seconds"""
+
+    def __init__(self, max_entries=cfg.result_cache_entries, max_bytes=cfg.result_cache_max_bytes,
+                 ttl=cfg.result_cache_ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()  # key -> (time stored, size, value)
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        """Returns (value, age in seconds) or None"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                self.__remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[2], time.time() - entry[0]
+
+    def put(self, key, value, size=0):
+        if size > self.max_bytes:
+            return
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            self.__entries[key] = (time.time(), size, value)
+            self.__bytes += size
+            while len(self.__entries) > self.max_entries or self.__bytes > self.max_bytes:
+                self.__remove(next(iter(self.__entries)))
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def __remove(self, key):
+        _, size, _ = self.__entries.pop(key)
+        self.__bytes -= size
+
+
+def cache_key(*parts):
+    m = hashlib.sha256()
+    m.update(json.dumps(parts, default=str).encode('utf-8'))
+    return m.hexdigest()
+
+
+# file -> ((mtime, size), sha256); a file is hashed again only if it changes
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(file):
+    """sha256 of the content of the file"""
+    stat = os.stat(file)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        cached = _digests.get(file)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    m = hashlib.sha256()
+    with open(file, mode='rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            m.update(block)
+    with _digests_lock:
+        _digests[file] = (version, m.hexdigest())
+    return m.hexdigest()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The result cache of this process"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Out-of-core training data
+
+The chunks of the train data (see mods.utils.datapool_iter) are transformed
+one by one and appended to a spool file; the scaler is fitted by partial_fit
+in the same pass. The last raw row of a chunk is carried to the next one, so
+the delta of the first row of a chunk is the same as if the data were not
+split. With the interpolation, the trailing rows of a chunk with missing
+values are held back until the next chunk (or the end of the data) arrives,
+so the gaps over the chunk boundaries are interpolated as in the whole data.
+The spool is then mapped to memory and the windows are read from it, i.e.,
+they span the chunk boundaries as the windows of the whole data.
+
+    spool = Spool(model)
+    for chunk in chunks:
+        spool.append(chunk)
+    data = spool.open()
+    ...
+    spool.close()
+
+@author: stefan dlugolinsky
+"""
+
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import mods.config as cfg
+
+
+class Spool:
+
+    def __init__(self, model, dir=None):
+        """
+        Parameters
+        ----------
+        model : mods.models.mods_model.mods_model
+            Model with the transformation settings and the scaler to be fitted
+        dir : str
+            Directory of the spool file; cfg.app_cache by default
+        """
+        self.model = model
+        self.dtype = np.float32 if cfg.memory_lean else np.float64
+        self.rows = 0
+        self.columns = None
+        # the last raw rows; the model keeps them as the sample data
+        self.tail = None
+        self.__carry = None
+        self.__held = None
+        self.__data = None
+        fd, self.file = tempfile.mkstemp(prefix='spool-', suffix='.bin', dir=cfg.ensure_dir(dir or cfg.app_cache))
+        self.__fp = os.fdopen(fd, 'wb')
+
+    def append(self, df):
+        df = df.replace('None', 0)
+        if self.columns is None:
+            self.columns = list(df.columns)
+        elif list(df.columns) != self.columns:
+            raise Exception('chunk columns %s differ from %s' % (list(df.columns), self.columns))
+
+        if self.model.get_interpolate():
+            # the rows after the last complete row wait for the values of the next chunk
+            if self.__held is not None:
+                df = pd.concat([self.__held, df])
+            complete = np.flatnonzero(df.notna().all(axis=1).values)
+            end = complete[-1] + 1 if len(complete) > 0 else 0
+            self.__held = df.iloc[end:]
+            if end == 0:
+                return
+            df = self.__interpolate(df.iloc[:end])
+        self.__spool(df)
+
+    def __interpolate(self, df):
+        # the previous row lets the interpolation continue over the chunk boundary
+        if self.__carry is not None:
+            return pd.concat([self.__carry, df]).interpolate().iloc[1:]
+        return df.interpolate()
+
+    def __spool(self, df):
+        tail = df if self.tail is None else pd.concat([self.tail, df])
+        self.tail = tail.tail(self.model.get_history_len(cfg.warmup_windows))
+
+        if self.model.is_delta():
+            # the delta of the first row needs the last row of the previous chunk
+            trans = df if self.__carry is None else pd.concat([self.__carry, df])
+            trans = self.model.transform(trans)
+        else:
+            trans = self.model.transform(df)
+        self.__carry = df.tail(1)
+
+        trans = np.asarray(trans, dtype=self.dtype)
+        if len(trans) == 0:
+            return
+        self.model.get_scaler().partial_fit(trans)
+        self.__fp.write(np.ascontiguousarray(trans).tobytes())
+        self.rows += len(trans)
+        logging.info('spooled %d rows (%d in total): %s' % (len(trans), self.rows, self.file))
+
+    def open(self):
+        """Returns the spooled rows as a read-only memory mapped array"""
+        if self.__held is not None and len(self.__held) > 0:
+            # the last rows of the data; their missing values are filled as in the whole data
+            self.__spool(self.__interpolate(self.__held))
+            self.__held = None
+        self.__fp.close()
+        if self.rows == 0:
+            raise Exception('no train data')
+        self.__data = np.memmap(self.file, dtype=self.dtype, mode='r', shape=(self.rows, len(self.columns)))
+        return self.__data
+
+    def close(self):
+        if not self.__fp.closed:
+            self.__fp.close()
+        self.__data = None
+        if os.path.isfile(self.file):
+            os.remove(self.file)
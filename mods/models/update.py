@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Fine-tunes existing models on the days arrived after their train time range
+
+Intended for nightly runs instead of training the models from scratch; e.g.,
+
+    python mods/models/update.py --model_file models/_default_/model.zip
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import json
+import logging
+import time
+
+import mods.models.api_v2 as api
+from mods.models.api_v2 import UpdateArgsSchema
+
+
+def main():
+    kwargs = vars(args)
+    model_files = kwargs.pop('model_file')
+    kwargs['full_paths'] = str(True)
+    for model_file in model_files:
+        start = time.time()
+        kwargs['model_name'] = model_file
+        try:
+            message = api.update(**kwargs)
+            print(json.dumps(message, default=str))
+        except Exception as e:
+            logging.info('model %s not updated: %s' % (model_file, e))
+        print("Elapsed time:  ", time.time() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Update parameters')
+    parser.add_argument('--model_file', nargs='+', required=True, help='MODS model zip(s)')
+    for field_name, field in UpdateArgsSchema().fields.items():
+        if field_name.lower() == 'model_name':
+            continue
+        parser.add_argument('--%s' % field_name, default=field.missing, required=field.required)
+    args = parser.parse_args()
+    main()
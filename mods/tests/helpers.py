@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Fixtures of the tests and the benchmarks
+
+@author: Stefan Dlugolinsky
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+import mods.config as cfg
+import mods.models.mods_model as MODS
+from mods.models.numpy_model import NumpyModel
+
+# data pool of three days (2019-06-01 - 2019-06-03) and a query of its columns
+FIXTURES = os.path.join(cfg.BASE_DIR, 'mods', 'tests', 'inputs', 'features')
+FIXTURES_QUERY = 'conn|in_count_uid~conn_in|out_count_uid~conn_out;' + \
+                 'dns|in_distinct_query~dns_in_distinct;' + \
+                 'ssh|in~ssh_in' + \
+                 '#window_start,window_end'
+
+
+def random_model(rnd, data=None, features=3, sequence_len=6, delta=True, horizons=1, units=5):
+    """
+    LSTM model of random weights run by the numpy engine; its scaler is fitted
+    on the transformed data (random rows of the features if not given)
+    """
+    if data is None:
+        data = rnd.rand(100, features) * 100
+    features = data.shape[1]
+    model = MODS.mods_model('test')
+    model.set_multivariate(features)
+    model.set_sequence_len(sequence_len)
+    model.set_model_delta(delta)
+    model.set_interpolate(False)
+    model.set_steps_ahead(horizons)
+    model.set_multi_horizon(horizons > 1)
+    model.set_batch_size(64)
+    model.set_scaler(MinMaxScaler(feature_range=(0, 1)).fit(model.transform(data.astype(np.float64))))
+    model.model = NumpyModel(
+        [
+            {'class_name': 'LSTM', 'config': {
+                'units': units, 'activation': 'tanh', 'recurrent_activation': 'sigmoid', 'use_bias': True
+            }},
+            {'class_name': 'Dense', 'config': {'activation': 'sigmoid', 'use_bias': True}}
+        ],
+        [
+            [
+                rnd.randn(features, 4 * units).astype('float32'),
+                rnd.randn(units, 4 * units).astype('float32'),
+                rnd.randn(4 * units).astype('float32')
+            ],
+            [
+                rnd.randn(units, features * horizons).astype('float32'),
+                rnd.randn(features * horizons).astype('float32')
+            ]
+        ]
+    )
+    return model
+
+
+def reference_predict(model, df):
+    """
+    The predict pipeline before it was rewritten to NumPy (pandas interpolate/diff,
+    scikit-learn scaling, np.append padding, DataFrame inverse transform)
+    """
+    if model.get_interpolate():
+        df = df.interpolate()
+    trans = model.transform(df)
+    norm = model.normalize(trans, model.get_scaler(), fit=False)
+    dummy = [np.nan] * model.get_multivariate()
+    for i in range(model.get_steps_ahead()):
+        norm = np.append(norm, [dummy], axis=0)
+    windows, _ = model.get_windows_targets(norm, model.get_steps_ahead())
+    pred = model.model.predict(windows, batch_size=model.get_batch_size())
+    if model.is_multi_horizon():
+        num = len(pred)
+        pred = model.inverse_normalize(pred.reshape((-1, model.get_multivariate())))
+        pred_denorm = pred.reshape((num, model.get_steps_ahead(), model.get_multivariate()))
+        return model.inverse_transform(df, pred_denorm)
+    pred_denorm = model.inverse_normalize(pred)
+    pred_invtrans = model.inverse_transform(df, pred_denorm)
+    if isinstance(pred_invtrans, pd.DataFrame):
+        pred_invtrans = pred_invtrans.values
+    return pred_invtrans
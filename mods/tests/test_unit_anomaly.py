@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the residual anomaly scoring
+
+@author: Stefan Dlugolinsky
+"""
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from mods.anomaly import ResidualScorer, score_predictions
+from mods.models.online import OnlinePredictor
+from mods.tests.helpers import random_model
+
+
+class TestResidualScorer(unittest.TestCase):
+    def test_batch_equals_streaming(self):
+        """
+        Test that the batches and the single windows are scored the same and the spikes are detected
+        """
+        rnd = np.random.RandomState(0)
+        actual = rnd.randn(500, 3)
+        predicted = np.zeros((500, 3))
+        actual[[300, 420], [1, 2]] = 20
+        actual[350] = np.nan
+
+        batch = ResidualScorer(3, alpha=0.05, threshold=6, warmup=50)
+        result = batch.update(actual[:200], predicted[:200])
+        scores = [result['scores']]
+        result = batch.update(actual[200:], predicted[200:])
+        scores.append(result['scores'])
+        scores = np.vstack(scores)
+
+        streaming = ResidualScorer(3, alpha=0.05, threshold=6, warmup=50)
+        onsets = []
+        for i in range(500):
+            result = streaming.update(actual[i], predicted[i])
+            np.testing.assert_allclose(result['scores'], scores[i], rtol=1e-9)
+            onsets.append(result['onsets'])
+
+        self.assertTrue(np.isnan(scores[:50]).all())
+        self.assertTrue(np.isnan(scores[350]).all())
+        self.assertEqual([tuple(i) for i in np.argwhere(onsets)], [(300, 1), (420, 2)])
+
+    def test_constant_residual(self):
+        """
+        Test that a change of a so far constant residual is scored finitely and is anomalous
+        """
+        actual = np.full((40, 2), 5.0)
+        actual[30, 0] = 6.0
+        result = ResidualScorer(2, warmup=10, min_std=1e-3).update(actual, np.zeros((40, 2)))
+        self.assertTrue(np.isfinite(result['scores'][10:]).all())
+        self.assertEqual(result['scores'][30, 0], 1000.0)
+        self.assertEqual(result['scores'][29, 0], 0.0)
+        self.assertEqual([tuple(i) for i in np.argwhere(result['onsets'])], [(30, 0)])
+        json.dumps(result['scores'][10:].tolist(), allow_nan=False)
+
+    def test_online_predictor(self):
+        """
+        Test that the streaming predictor scores the rows the same as the predictions of the whole data
+        """
+        rnd = np.random.RandomState(0)
+        for delta in [True, False]:
+            for horizons in [1, 4]:
+                model = random_model(rnd, delta=delta, horizons=horizons)
+                df = pd.DataFrame(rnd.rand(80, 3) * 100, columns=['a', 'b', 'c'])
+                df.iloc[60, 1] += 1000
+                batch = score_predictions(model, df, model.predict(df), ResidualScorer(3, warmup=10))
+
+                predictor = OnlinePredictor(model, scorer=ResidualScorer(3, warmup=10))
+                scores = []
+                for row in df.values:
+                    predictor.update(row)
+                    if predictor.last_score is not None:
+                        scores.append(predictor.last_score['scores'])
+                expected = np.array([[np.nan] * 3 if s is None else s for s in batch['scores'][:len(scores)]])
+                np.testing.assert_allclose(np.array(scores), expected, rtol=1e-9)
+                first = 60 - model.get_sequence_len() - (1 if delta else 0)
+                onsets = {a['window']: a['features'] for a in batch['anomalies']}
+                self.assertIn('b', onsets[first])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the rolling-origin backtesting
+
+@author: Stefan Dlugolinsky
+"""
+import unittest
+
+import mods.models.backtest as bt
+from mods.mods_types import TimeRange
+from mods.tests.helpers import FIXTURES, FIXTURES_QUERY
+
+
+class TestBacktest(unittest.TestCase):
+    def test_folds(self):
+        """
+        Test the train and test ranges of the expanding and sliding folds
+        """
+        time_range = TimeRange.from_str('<2019-01-01,2019-01-10>')
+        expanding = [(str(train), str(test)) for train, test in bt.make_folds(time_range, 4, 2, mode='expanding')]
+        self.assertEqual(expanding, [
+            ('<2019-01-01,2019-01-05)', '<2019-01-05,2019-01-07)'),
+            ('<2019-01-01,2019-01-07)', '<2019-01-07,2019-01-09)'),
+            ('<2019-01-01,2019-01-09)', '<2019-01-09,2019-01-11)'),
+        ])
+        sliding = [(str(train), str(test)) for train, test in bt.make_folds(time_range, 4, 2, 3, mode='sliding')]
+        self.assertEqual(sliding, [
+            ('<2019-01-01,2019-01-05)', '<2019-01-05,2019-01-07)'),
+            ('<2019-01-04,2019-01-08)', '<2019-01-08,2019-01-10)'),
+        ])
+
+    def test_rows_of_loaded_days(self):
+        """
+        Test that the days are loaded once and the rows of the fold ranges are found
+        """
+        time_range = TimeRange.from_str('<2019-06-01,2019-06-03>')
+        df, days, offsets = bt.load_days(FIXTURES_QUERY, time_range, 'w01h-s10m', base_dir=FIXTURES)
+        self.assertEqual(len(days), 3)
+        self.assertEqual(offsets[-1], len(df))
+        train, test = bt.make_folds(time_range, 2, 1)[0]
+        self.assertEqual(bt.rows_of(train, days, offsets), (0, offsets[2]))
+        self.assertEqual(bt.rows_of(test, days, offsets), (offsets[2], len(df)))
+
+    def test_summarize(self):
+        """
+        Test the means of the scalar and per-column fold metrics
+        """
+        results = [
+            {'metrics': {'mse': 1.0, 'mods_rmse': [1.0, 'nan']}, 'times': {'train': 2.0}},
+            {'metrics': {'mse': 3.0, 'mods_rmse': [3.0, 4.0]}, 'times': {'train': 4.0}},
+        ]
+        mean, std = bt.summarize(results)
+        self.assertEqual(mean['mse'], 2.0)
+        self.assertEqual(mean['mods_rmse'], [2.0, 4.0])
+        self.assertEqual(mean['time_train'], 3.0)
+        self.assertEqual(std['mse'], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the micro-batching of concurrent predictions
+
+@author: Stefan Dlugolinsky
+"""
+import threading
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from mods.models.batcher import PredictBatcher
+from mods.tests.helpers import random_model
+
+
+class TestPredictBatcher(unittest.TestCase):
+    def test_concurrent_predictions(self):
+        """
+        Test that the concurrent predictions are batched and each gets its own forecasts
+        """
+        rnd = np.random.RandomState(0)
+        model = random_model(rnd, delta=True, horizons=1)
+        frames = [pd.DataFrame(rnd.rand(rnd.randint(8, 40), 3) * 100) for _ in range(64)]
+        expected = [model.predict(df) for df in frames]
+
+        model.batcher = PredictBatcher(model.model, max_delay=0.05, max_batch=1000, engine='numpy')
+        results = [None] * len(frames)
+        barrier = threading.Barrier(8)
+
+        def client(i):
+            barrier.wait()
+            for j in range(i, len(frames), 8):
+                results[j] = model.predict(frames[j])
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for result, pred in zip(results, expected):
+            np.testing.assert_allclose(result, pred, rtol=1e-6)
+        self.assertEqual(model.batcher.requests, len(frames))
+        self.assertLess(model.batcher.batches, len(frames))
+
+        # a prediction of max_batch windows is not queued
+        df = pd.DataFrame(rnd.rand(30, 3) * 100)
+        batcher, model.batcher = model.batcher, None
+        pred = model.predict(df)
+        model.batcher = batcher
+        batcher.max_batch = 10
+        np.testing.assert_allclose(model.predict(df), pred, rtol=1e-6)
+        self.assertEqual(batcher.requests, len(frames))
+
+
+if __name__ == '__main__':
+    unittest.main()
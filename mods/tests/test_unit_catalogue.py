@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the model catalogue
+
+@author: Stefan Dlugolinsky
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+import mods.config as cfg
+import mods.models.api_v2 as api
+from mods.models.catalogue import Catalogue, get_catalogue
+
+
+def write_model(file, window_slide, smape, r2, model_type='LSTM'):
+    """A model zip with config.json and metrics.json only; the catalogue must not read anything else"""
+    config = {
+        'data_select_query': 'conn|in_count_uid~in',
+        'window_slide': window_slide,
+        'model_type': model_type,
+        'sequence_len': 12,
+        'steps_ahead': 1,
+        'multi_horizon': False
+    }
+    metrics = {'mods_smape': smape, 'mods_r2': r2, 'loss': 0.1}
+    with zipfile.ZipFile(file, mode='w') as zip:
+        zip.writestr('config.json', json.dumps(config))
+        zip.writestr('metrics.json', json.dumps(metrics))
+
+
+class TestCatalogue(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.models = os.path.join(self.dir, 'models')
+        os.makedirs(self.models)
+        write_model(os.path.join(self.models, 'a.zip'), 'w01h-s10m', [10.0, 'NaN'], [0.5, 0.7])
+        write_model(os.path.join(self.models, 'b.zip'), 'w01h-s10m', [8.0, 10.0], [0.9, 0.9])
+        write_model(os.path.join(self.models, 'c.zip'), 'w10m-s10m', [1.0], [0.1], model_type='GRU')
+        self.catalogue = Catalogue(self.models, os.path.join(self.dir, 'catalogue.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_query(self):
+        """
+        Test the ranking of the models by their metrics without loading them
+        """
+        self.assertEqual(self.catalogue.refresh(), {'added': 3, 'updated': 0, 'removed': 0, 'models': 3})
+        self.assertEqual(self.catalogue.names(), ['a.zip', 'b.zip', 'c.zip'])
+        self.assertEqual(self.catalogue.best('SMAPE', window_slide='w01h-s10m')['name'], 'b.zip')
+        self.assertEqual(self.catalogue.best('smape')['name'], 'c.zip')
+        self.assertEqual([m['name'] for m in self.catalogue.query(metric='r2')], ['b.zip', 'a.zip', 'c.zip'])
+        self.assertEqual([m['name'] for m in self.catalogue.query(model_type='GRU')], ['c.zip'])
+        self.assertIsNone(self.catalogue.best('smape', window_slide='w01d-s01h'))
+
+        model = self.catalogue.get('a')
+        self.assertEqual(model['config']['sequence_len'], 12)
+        self.assertEqual(model['metrics']['mods_smape'], [10.0, 'NaN'])
+        self.assertIs(model['multi_horizon'], False)
+        with self.assertRaises(ValueError):
+            self.catalogue.query(units=12)
+
+    def test_refresh(self):
+        """
+        Test that a refresh reads the changed zips only and drops the removed ones
+        """
+        self.catalogue.refresh()
+        with mock.patch('mods.models.catalogue.read_model_info') as read:
+            self.assertEqual(self.catalogue.refresh(), {'added': 0, 'updated': 0, 'removed': 0, 'models': 3})
+            read.assert_not_called()
+
+        write_model(os.path.join(self.models, 'a.zip'), 'w01h-s10m', [1.0, 2.0, 3.0], [0.5])
+        os.remove(os.path.join(self.models, 'c.zip'))
+        with open(os.path.join(self.models, 'broken.zip'), mode='wb') as f:
+            f.write(b'not a zip')
+        self.assertEqual(self.catalogue.refresh(), {'added': 1, 'updated': 1, 'removed': 1, 'models': 3})
+        self.assertEqual(self.catalogue.best('smape')['name'], 'a.zip')
+        self.assertIsNotNone(self.catalogue.get('broken.zip')['error'])
+        self.assertIsNone(self.catalogue.get('c.zip'))
+
+    def test_api(self):
+        """
+        Test the metadata and the model search of the api
+        """
+        cache = os.path.join(self.dir, 'cache')
+        with mock.patch.object(cfg, 'app_models', self.models), \
+                mock.patch.object(cfg, 'app_cache', cache):
+            # the metadata do not build the catalogue
+            self.assertEqual(sorted(api.list_models()), ['a.zip', 'b.zip', 'c.zip'])
+            self.assertFalse(os.path.exists(cache))
+            self.assertEqual(api.find_models(metric='smape', limit=1, window_slide='w01h-s10m')[0]['name'], 'b.zip')
+            self.assertIs(get_catalogue(), get_catalogue(self.models))
+            with mock.patch('mods.models.catalogue.read_model_info') as read:
+                self.assertEqual(api.list_models(), ['a.zip', 'b.zip', 'c.zip'])
+                read.assert_not_called()
+            # an unusable catalogue falls back to the listing of the directory
+            with mock.patch.object(Catalogue, 'refresh', side_effect=PermissionError('read-only')):
+                self.assertEqual(sorted(api.list_models()), ['a.zip', 'b.zip', 'c.zip'])
+
+
+if __name__ == '__main__':
+    unittest.main()
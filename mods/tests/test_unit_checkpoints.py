@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the training checkpoints
+
+@author: Stefan Dlugolinsky
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import mods.config as cfg
+from mods.models.checkpoints import AsyncModelCheckpoint, config_hash, get_checkpoint_dir, list_checkpoints, \
+    load_latest_checkpoint, remove_checkpoints
+
+
+def tiny_model():
+    from keras.layers import Dense, LSTM
+    from keras.models import Sequential
+
+    rnd = np.random.RandomState(0)
+    model = Sequential([LSTM(4, input_shape=(6, 3)), Dense(3)])
+    model.compile(loss='mean_squared_error', optimizer='adam')
+    # the optimizer state is created by the first update
+    model.train_on_batch(rnd.rand(8, 6, 3), rnd.rand(8, 3))
+    return model
+
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.patch = mock.patch.object(cfg, 'app_checkpoints', self.dir)
+        self.patch.start()
+        self.config = {'model': {'sequence_len': 6, 'model_type': 'LSTM', 'epochs': 10, 'epochs_patience': 3}}
+        self.checkpoint_dir = get_checkpoint_dir('model.zip', self.config)
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.dir)
+
+    def checkpoint(self, model, epochs, keep=cfg.checkpoints_keep):
+        callback = AsyncModelCheckpoint(self.checkpoint_dir, keep=keep)
+        callback.set_model(model)
+        callback.on_train_begin()
+        for epoch in epochs:
+            callback.on_epoch_end(epoch)
+        callback.on_train_end()
+
+    def test_config_hash(self):
+        """
+        Test that more epochs or patience resume the same training and another model configuration does not
+        """
+        more_epochs = {'model': dict(self.config['model'], epochs=20, epochs_patience=5)}
+        self.assertEqual(config_hash(more_epochs), config_hash(self.config))
+        self.assertEqual(get_checkpoint_dir('model', more_epochs), self.checkpoint_dir)
+        self.assertEqual(os.path.dirname(self.checkpoint_dir), self.dir)
+
+        other_model = {'model': dict(self.config['model'], sequence_len=12)}
+        self.assertNotEqual(config_hash(other_model), config_hash(self.config))
+
+    def test_keep(self):
+        """
+        Test that only the last checkpoints are kept and no partial files are left
+        """
+        self.checkpoint(tiny_model(), range(5), keep=2)
+        self.assertEqual([epoch for epoch, _ in list_checkpoints(self.checkpoint_dir)], [4, 5])
+        self.assertEqual(sorted(os.listdir(self.checkpoint_dir)), ['epoch-0004.hdf5', 'epoch-0005.hdf5'])
+
+    def test_resume(self):
+        """
+        Test that the training resumes from the latest valid checkpoint and that a corrupt one is skipped
+        """
+        model = tiny_model()
+        self.checkpoint(model, range(2))
+        # e.g., the disk got full while writing the checkpoint of the third epoch
+        with open(os.path.join(self.checkpoint_dir, 'epoch-0003.hdf5'), mode='wb') as f:
+            f.write(b'corrupt')
+
+        epoch, loaded = load_latest_checkpoint(self.checkpoint_dir)
+        self.assertEqual(epoch, 2)
+        for w, w_loaded in zip(model.get_weights(), loaded.get_weights()):
+            np.testing.assert_array_equal(w, w_loaded)
+
+        remove_checkpoints(self.checkpoint_dir)
+        self.assertFalse(os.path.exists(self.checkpoint_dir))
+        self.assertEqual(load_latest_checkpoint(self.checkpoint_dir), (0, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
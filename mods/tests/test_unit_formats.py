@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the predict response formats
+
+@author: Stefan Dlugolinsky
+"""
+import importlib.util
+import json
+import unittest
+
+import numpy as np
+
+import mods.formats as formats
+from mods.models.api_v2 import format_predictions
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+class TestFormats(unittest.TestCase):
+    def roundtrip(self, response_format):
+        rnd = np.random.RandomState(0)
+        for shape in [(50, 3), (50, 4, 3)]:
+            predictions = rnd.rand(*shape) * 100
+            payload = json.loads(json.dumps(formats.encode(predictions, response_format, ['a', 'b', 'c'])))
+            np.testing.assert_array_equal(formats.decode(payload), predictions)
+
+    def test_roundtrip(self):
+        """
+        Test that the predictions are restored exactly from the payload of each format
+        """
+        for response_format in ['json', 'columnar', 'npy']:
+            self.roundtrip(response_format)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_roundtrip_arrow(self):
+        self.roundtrip('arrow')
+
+    def test_pages(self):
+        """
+        Test that the pages of the predictions and their anomaly scores cover the windows
+        """
+        predictions = np.arange(25.).reshape((25, 1))
+        pages = []
+        for page in [1, 2, 3]:
+            message = {'anomaly': {'scores': list(range(25)), 'score': list(range(25)),
+                                   'anomalies': [{'window': 3}, {'window': 12}]}}
+            format_predictions(message, predictions, ['a'], {
+                'page': page, 'page_size': 10, 'response_format': 'npy'
+            })
+            self.assertEqual(message['page']['pages'], 3)
+            restored = formats.decode(message['predictions'])
+            self.assertEqual(message['anomaly']['score'], restored[:, 0].tolist())
+            pages.append(restored)
+        np.testing.assert_array_equal(np.vstack(pages), predictions)
+        with self.assertRaises(ValueError):
+            formats.paginate(predictions, 4, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
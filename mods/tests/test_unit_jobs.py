@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the asynchronous jobs
+
+@author: Stefan Dlugolinsky
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import mods.models.jobs as jobs
+
+
+def count(n, sleep=0.0):
+    """Job reporting its progress"""
+    for i in range(n):
+        jobs.report(step=i + 1, steps=n, threads=os.environ.get('OMP_NUM_THREADS'))
+        time.sleep(sleep)
+    return {'sum': sum(range(n))}
+
+
+def fail():
+    raise ValueError('no data')
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = jobs.JobStore(os.path.join(self.dir.name, 'jobs.sqlite'))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_queue(self):
+        """
+        Test that the jobs are run one by one, report their progress and results and can be cancelled
+        """
+        queue = jobs.JobQueue(self.store, workers=1, tf_threads=2, nice=0, poll_interval=0.1)
+        first = queue.submit('mods.tests.test_unit_jobs:count', n=3)
+        failing = queue.submit('mods.tests.test_unit_jobs:fail')
+        long = queue.submit('mods.tests.test_unit_jobs:count', n=1000, sleep=0.1)
+        queued = queue.submit('mods.tests.test_unit_jobs:count', n=3)
+        self.assertEqual(queue.cancel(queued['id'])['state'], jobs.CANCELLED)
+
+        job = queue.wait(first['id'], timeout=60)
+        self.assertEqual(job['state'], jobs.DONE)
+        self.assertEqual(job['result'], {'sum': 3})
+        self.assertEqual((job['progress']['step'], job['progress']['threads']), (3, '2'))
+
+        job = queue.wait(failing['id'], timeout=60)
+        self.assertEqual(job['state'], jobs.FAILED)
+        self.assertEqual(job['error'], 'ValueError: no data')
+
+        while queue.status(long['id'])['progress'] is None:
+            time.sleep(0.1)
+        self.assertEqual(queue.cancel(long['id'])['state'], jobs.CANCELLED)
+        job = queue.wait(long['id'], timeout=10)
+        self.assertEqual(job['state'], jobs.CANCELLED)
+        self.assertIsNone(job['result'])
+        self.assertIsNone(queue.status(queued['id'])['started'])
+        queue.shutdown()
+
+    def test_recover(self):
+        """
+        Test that the jobs of the exited workers are failed and the jobs of the live ones and the queued ones are kept
+        """
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        ids = [self.store.add('mods.tests.test_unit_jobs:count', {'n': 1}) for _ in range(5)]
+        interrupted, live, starting, stale, queued = ids
+        for job_id, pid in [(interrupted, exited.pid), (live, os.getpid()), (starting, None), (stale, None)]:
+            self.assertEqual(self.store.claim()['id'], job_id)
+            self.store.update(job_id, pid=pid)
+        # claimed by a dispatcher that exited before it started the worker
+        self.store.update(stale, started=time.time() - 2 * jobs.START_TIMEOUT)
+
+        self.assertEqual(self.store.recover(), 2)
+        self.assertEqual([self.store.get(job_id)['state'] for job_id in ids],
+                         [jobs.FAILED, jobs.RUNNING, jobs.RUNNING, jobs.FAILED, jobs.QUEUED])
+        # e.g., the worker of another api process finishes its job
+        self.assertTrue(self.store.update(live, states=[jobs.RUNNING], state=jobs.DONE, finished=time.time()))
+        self.assertEqual(self.store.get(live)['state'], jobs.DONE)
+
+if __name__ == '__main__':
+    unittest.main()
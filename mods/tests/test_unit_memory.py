@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the memory lean mode
+
+@author: Stefan Dlugolinsky
+"""
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import mods.config as cfg
+import mods.utils as utl
+from mods.mods_types import TimeRange
+from mods.tests.helpers import FIXTURES, FIXTURES_QUERY, random_model
+
+
+def read_fixtures():
+    df, _ = utl.datapool_read(FIXTURES_QUERY, TimeRange.from_str('<2019-06-01,2019-06-04)'), 'w01h-s10m', [],
+                              FIXTURES, caching=False)
+    return utl.fix_missing_num_values(df)
+
+
+class TestMemoryLean(unittest.TestCase):
+    def test_downcast(self):
+        """
+        Test that the integers are downcasted losslessly and the floats to float32
+        """
+        df = pd.DataFrame({
+            'window_start': ['2019-06-01 00:00', '2019-06-01 00:10', '2019-06-01 00:20'],
+            'small': [0, 1, 127],
+            'negative': [-129, 0, 1],
+            'large': [0, 70000, 2 ** 40],
+            'float': [0.1, 1e10, np.nan]
+        })
+        original = df.copy()
+        df = utl.downcast(df, exclude=['window_start'])
+
+        self.assertEqual(df['small'].dtype, np.int8)
+        self.assertEqual(df['negative'].dtype, np.int16)
+        self.assertEqual(df['large'].dtype, np.int64)
+        for col in ['small', 'negative', 'large']:
+            np.testing.assert_array_equal(df[col].values, original[col].values)
+        self.assertEqual(df['float'].dtype, np.float32)
+        np.testing.assert_allclose(df['float'].values, original['float'].values, rtol=1e-7)
+        pd.testing.assert_series_equal(df['window_start'], original['window_start'])
+
+    def test_lean_model_input(self):
+        """
+        Test that the lean mode keeps the model input in float32 and close to the float64 one
+        """
+        model = random_model(np.random.RandomState(0), read_fixtures())
+        inputs = {}
+        for lean in [False, True]:
+            with mock.patch.object(cfg, 'memory_lean', lean):
+                df = read_fixtures()
+                norm = model.normalize(model.transform(df), model.get_scaler(), fit=False)
+                windows, _ = model.get_windows_targets(norm, 1)
+                _, trans = model.prepare(df)
+            inputs[lean] = windows
+            dtype = np.float32 if lean else np.float64
+            if lean:
+                self.assertEqual(set(df.dtypes), {np.dtype(np.float32)})
+            self.assertEqual(windows.dtype, dtype)
+            self.assertEqual(trans.dtype, dtype)
+        np.testing.assert_allclose(inputs[True], inputs[False], atol=1e-5)
+
+    def test_log_memory(self):
+        """
+        Test that the memory usage of a stage is collected into the report
+        """
+        report = utl.log_memory('load', {})
+        current, peak = report['load']['rss_mb'], report['load']['peak_rss_mb']
+        self.assertGreater(peak, 0)
+        if current is not None:
+            self.assertGreater(current, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
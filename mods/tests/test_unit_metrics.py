@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the streaming evaluation metrics
+
+@author: Stefan Dlugolinsky
+"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import mods.metrics as metrics
+import mods.models.api_v2 as api
+import mods.utils as utl
+from mods.tests.helpers import random_model
+
+
+class TestAccumulator(unittest.TestCase):
+    def test_same_as_utils(self):
+        """
+        Test that the merged accumulators of the chunks give the same metrics as the functions over all the data
+        """
+        rnd = np.random.RandomState(0)
+        y_true = rnd.rand(1000, 3) * 100 + 1000
+        y_pred = y_true + rnd.randn(1000, 3)
+
+        acc = metrics.Accumulator()
+        for beg in range(0, 500, 77):
+            acc.update(y_true[beg:min(beg + 77, 500)], y_pred[beg:min(beg + 77, 500)])
+        other = metrics.Accumulator().update(y_true[500:], y_pred[500:])
+        result = acc.merge(other).result()
+
+        self.assertEqual(len(acc), 1000)
+        np.testing.assert_allclose(result['mods_rmse'], utl.rmse(y_true, y_pred), rtol=1e-10)
+        np.testing.assert_allclose(result['mods_r2'], utl.r2(y_true, y_pred), rtol=1e-10)
+        np.testing.assert_allclose(result['mods_cosine'], utl.cosine(y_true, y_pred), rtol=1e-10)
+        np.testing.assert_allclose(result['mods_smape'], utl.smape(y_true, y_pred), rtol=1e-10)
+
+    def test_same_as_sklearn(self):
+        """
+        Test that r2 and rmse are the same as the scikit-learn scores the metrics were computed by before
+        """
+        from sklearn.metrics import mean_squared_error, r2_score
+
+        rnd = np.random.RandomState(0)
+        y_true = rnd.rand(300, 3) * 100
+        y_pred = y_true + rnd.randn(300, 3) * 10
+        # a constant column; r2 of a perfect and an imperfect fit
+        y_true[:, 2] = 5.0
+        y_pred[:150, 2] = 5.0
+        for y in [y_pred, np.concatenate([y_pred[:, :2], y_true[:, 2:]], axis=1)]:
+            result = metrics.Accumulator().update(y_true[:150], y[:150]).merge(
+                metrics.Accumulator().update(y_true[150:], y[150:])).result()
+            np.testing.assert_allclose(result['mods_r2'], r2_score(y_true, y, multioutput='raw_values'), rtol=1e-10)
+            np.testing.assert_allclose(result['mods_rmse'],
+                                       np.sqrt(mean_squared_error(y_true, y, multioutput='raw_values')), rtol=1e-10)
+            np.testing.assert_allclose(utl.r2(y_true, y), r2_score(y_true, y, multioutput='raw_values'), rtol=1e-10)
+
+    def test_evaluate_chunks(self):
+        """
+        Test that the evaluation of the data in chunks is the same as the evaluation of the whole data
+        """
+        rnd = np.random.RandomState(0)
+        for delta in [True, False]:
+            for horizons in [1, 4]:
+                model = random_model(rnd, delta=delta, horizons=horizons)
+                df = pd.DataFrame(rnd.rand(120, 3) * 100, columns=['a', 'b', 'c'])
+                expected = api.evaluate(model, df, model.predict(df))
+                acc = metrics.evaluate_chunks(model, [df.iloc[beg:beg + 13] for beg in range(0, len(df), 13)])
+                result = acc.result()
+                self.assertEqual(len(acc), len(metrics.aligned(model, df, model.predict(df))[0]))
+                for name in ['mods_rmse', 'mods_r2', 'mods_cosine', 'mods_smape', 'mse', 'mae']:
+                    np.testing.assert_allclose(result[name], expected[name], rtol=1e-9, err_msg=name)
+                self.assertEqual(horizons > 1, 'horizons' in result)
+
+
+if __name__ == '__main__':
+    unittest.main()
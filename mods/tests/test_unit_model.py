@@ -16,6 +16,7 @@ import os
 from mods import config as cfg
 from mods import utils as utl
 from mods.models.api_v2 import TrainArgsSchema
+from mods.mods_types import TimeRange
 
 debug = True
 
@@ -70,6 +71,13 @@ class TestModelMethods(unittest.TestCase):
         )
         self.assertEqual(len(df_train), 144)
 
+    def test_tail_time_range(self):
+        time_range = TimeRange.from_str('<2019-05-01,2019-06-01)')
+        # 13 rows of w01h-s10m fit into the last day
+        self.assertEqual(str(utl.tail_time_range(time_range, 13, 'w01h-s10m')), '<2019-05-31,2019-06-01)')
+        # more than the whole range
+        self.assertEqual(utl.tail_time_range(time_range, 10000, 'w01h-s10m'), time_range)
+
     def test_api_train(self):
         cfg.app_models_remote = None  # disable remote storage
         cfg.data_pool_caching = False  # disable caching
@@ -79,6 +87,22 @@ class TestModelMethods(unittest.TestCase):
         print(msg)
         self.assertGreater(msg['evaluation']['training_time'],
                            0)  # if model was trained, there should be some training time in evaluation
+        model = mods_model.load_model(msg['model_name'], msg['dir_models'])  # load the model back from the zip
+        self.assertEqual(model.get_scaler().scale_.shape, (4,))  # scaler is restored without pickle
+        self.assertEqual(model.get_train_time_range().to_str(), '<2019-06-01,2019-06-03)')
+
+        # the next day is the test day, the model is not fine-tuned on it
+        model_name = msg['model_name']
+        msg = mods_model.update(
+            model_name=os.path.join(msg['dir_models'], msg['model_name']),
+            update_until='2019-06-04',
+            num_epochs=1,
+            full_paths=True
+        )
+        print(msg)
+        self.assertEqual(msg['update_time_range'], '<2019-06-03,2019-06-04)')
+        self.assertTrue(msg['update_test_time_range_excluded'])
+        self.assertEqual(msg['model_name'], model_name)
 
 
 # test_model_variables()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the pure NumPy inference engine
+
+@author: Stefan Dlugolinsky
+"""
+import importlib.util
+import unittest
+
+import numpy as np
+
+from mods.models.numpy_model import NumpyModel, export_keras_model
+
+HAS_KERAS = importlib.util.find_spec('keras') is not None
+
+
+class TestNumpyModel(unittest.TestCase):
+    def setUp(self):
+        self.rnd = np.random.RandomState(0)
+        self.x = self.rnd.rand(32, 12, 4).astype('float32')
+
+    def test_dense_flatten(self):
+        """
+        Test forward pass of Dense and Flatten layers against direct computation
+        """
+        kernel = self.rnd.randn(4, 3).astype('float32')
+        bias = self.rnd.randn(3).astype('float32')
+        model = NumpyModel(
+            [
+                {'class_name': 'Dense', 'config': {'activation': 'relu', 'use_bias': True}},
+                {'class_name': 'Flatten', 'config': {}}
+            ],
+            [[kernel, bias], []]
+        )
+        expected = np.maximum(np.dot(self.x, kernel) + bias, 0).reshape((32, -1))
+        np.testing.assert_allclose(model.predict(self.x), expected, rtol=1e-6)
+
+    def test_serialization(self):
+        """
+        Test that the model survives the npz round trip
+        """
+        model = NumpyModel(
+            [{'class_name': 'LSTM', 'config': {
+                'units': 5, 'activation': 'tanh', 'recurrent_activation': 'sigmoid', 'use_bias': True
+            }}],
+            [[
+                self.rnd.randn(4, 20).astype('float32'),
+                self.rnd.randn(5, 20).astype('float32'),
+                self.rnd.randn(20).astype('float32')
+            ]]
+        )
+        loaded = NumpyModel.from_bytes(model.to_bytes())
+        self.assertEqual(loaded.layers, model.layers)
+        np.testing.assert_array_equal(loaded.predict(self.x), model.predict(self.x))
+
+    @unittest.skipUnless(HAS_KERAS, 'keras is not installed')
+    def test_keras_equivalence(self):
+        """
+        Test that the numpy engine matches keras for the supported model types
+        """
+        from keras.layers import Bidirectional, Conv1D, Dense, Flatten, GRU, Input, LSTM, MaxPooling1D
+        from keras.models import Model
+
+        builders = {
+            'MLP': lambda x: Flatten()(Dense(4, activation='relu')(x)),
+            'Conv1D': lambda x: Flatten()(MaxPooling1D(pool_size=2)(Conv1D(64, 2, activation='relu')(x))),
+            'GRU': lambda x: GRU(12)(x),
+            'LSTM': lambda x: LSTM(12)(x),
+            'bidirectLSTM': lambda x: Bidirectional(LSTM(12))(x),
+        }
+        for model_type, build in builders.items():
+            x = Input(shape=(12, 4))
+            keras_model = Model(inputs=x, outputs=Dense(4, activation='sigmoid')(build(x)))
+            numpy_model = NumpyModel.from_bytes(export_keras_model(keras_model).to_bytes())
+            np.testing.assert_allclose(
+                numpy_model.predict(self.x),
+                keras_model.predict(self.x),
+                atol=1e-5,
+                err_msg=model_type
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the incremental (streaming) predictor
+
+@author: Stefan Dlugolinsky
+"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from mods.models.online import OnlinePredictor
+from mods.tests.helpers import random_model, reference_predict
+
+
+class TestOnlinePredictor(unittest.TestCase):
+    def test_matches_batch_predict(self):
+        """
+        Test that forecasts of the streaming predictor equal the batch predictions
+        """
+        rnd = np.random.RandomState(0)
+        for delta in [True, False]:
+            model = random_model(rnd, delta=delta)
+            df = pd.DataFrame(rnd.rand(30, 3) * 100, columns=['a', 'b', 'c'])
+            expected = model.predict(df)
+
+            predictor = OnlinePredictor(model)
+            forecasts = [predictor.update(row) for row in df.values]
+            forecasts = np.array([f for f in forecasts if f is not None])
+            # the last batch prediction is the forecast of the next (unseen) row
+            np.testing.assert_allclose(forecasts, expected[-len(forecasts):], rtol=1e-6)
+
+    def test_multi_horizon(self):
+        """
+        Test the multi-horizon forecasts of the streaming predictor and their alignment with the targets
+        """
+        rnd = np.random.RandomState(0)
+        for delta in [True, False]:
+            model = random_model(rnd, delta=delta, horizons=4)
+            df = pd.DataFrame(rnd.rand(30, 3) * 100, columns=['a', 'b', 'c'])
+            expected = model.predict(df)
+            self.assertEqual(expected.shape, (30 - model.get_history_len() + 1, 4, 3))
+
+            predictor = OnlinePredictor(model)
+            forecasts = [predictor.update(row) for row in df.values]
+            forecasts = np.array([f for f in forecasts if f is not None])
+            np.testing.assert_allclose(forecasts, expected, rtol=1e-6)
+
+            # training targets are the same future rows as the evaluation targets
+            norm = model.normalize(model.transform(df), model.get_scaler(), fit=False)
+            _, targets = model.get_windows_targets(norm, 4)
+            targets = model.get_scaler().inverse_transform(targets.reshape((-1, 3))).reshape(targets.shape)
+            if delta:
+                targets = np.cumsum(targets, axis=1) + df.values[6:6 + len(targets), np.newaxis]
+            horizon_targets = model.get_horizon_targets(df)
+            np.testing.assert_allclose(targets, horizon_targets[:len(targets)], rtol=1e-6)
+            self.assertTrue(np.isnan(horizon_targets[len(targets):]).any(axis=(1, 2)).all())
+
+
+class TestPredict(unittest.TestCase):
+    def test_matches_pandas_path(self):
+        """
+        Test that the numpy predict path returns the same values as the former pandas path
+        """
+        rnd = np.random.RandomState(0)
+        for delta in [True, False]:
+            for horizons in [1, 4]:
+                model = random_model(rnd, delta=delta, horizons=horizons)
+                model.set_interpolate(True)
+                df = pd.DataFrame(rnd.rand(30, 3) * 100, columns=['a', 'b', 'c'])
+                df.iloc[[0, 7, 8, 20], [0, 2]] = np.nan
+                np.testing.assert_array_equal(model.predict(df), reference_predict(model, df))
+
+    def test_evaluate_from_predictions(self):
+        """
+        Test that the keras metrics computed from the real predictions equal the losses of the normalized targets
+        """
+        import mods.models.api_v2 as api
+
+        rnd = np.random.RandomState(0)
+        for delta in [True, False]:
+            for horizons in [1, 4]:
+                model = random_model(rnd, delta=delta, horizons=horizons)
+                df = pd.DataFrame(rnd.rand(40, 3) * 100, columns=['a', 'b', 'c'])
+                scaler = model.get_scaler()
+                data_min = scaler.data_min_.copy()
+                metrics = api.evaluate(model, df, model.predict(df))
+
+                norm = model.normalize(model.transform(df.values), scaler, fit=False)
+                windows, targets = model.get_windows_targets(norm, horizons)
+                err = model.model.predict(windows) - np.asarray(targets).reshape((len(targets), -1))
+                self.assertAlmostEqual(metrics['mse'], np.mean(err ** 2), places=6)
+                self.assertAlmostEqual(metrics['mae'], np.mean(np.abs(err)), places=6)
+                self.assertEqual(len(metrics['mods_rmse']), 3)
+                np.testing.assert_array_equal(scaler.data_min_, data_min)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the predictions by many models over one shared data load
+
+@author: Stefan Dlugolinsky
+"""
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import mods.config as cfg
+import mods.models.api_v2 as api
+import mods.models.mods_model as MODS
+import mods.utils as utl
+from mods.mods_types import TimeRange
+from mods.tests.helpers import FIXTURES, FIXTURES_QUERY, random_model
+
+CONN_QUERY = 'conn|in_count_uid~conn_in|out_count_uid~conn_out#window_start,window_end'
+TIME_RANGE = '<2019-06-01,2019-06-04)'
+
+
+def read_fixtures(query):
+    df, _ = utl.datapool_read(query, TimeRange.from_str(TIME_RANGE), 'w01h-s10m', [], FIXTURES, caching=False)
+    return utl.fix_missing_num_values(df)
+
+
+class TestPredictModels(unittest.TestCase):
+    def setUp(self):
+        self.models = {}
+        # a and b share the data select query, c reads other columns
+        for seed, (name, query) in enumerate([('a', FIXTURES_QUERY), ('b', FIXTURES_QUERY), ('c', CONN_QUERY)]):
+            model = random_model(np.random.RandomState(seed), read_fixtures(query))
+            model.set_data_select_query(query)
+            model.set_window_slide('w01h-s10m')
+            self.models[name] = model
+
+    def predict(self, **kwargs):
+        def get_model(model_name, models_dir=None, engine=None):
+            return self.models[model_name]
+
+        with mock.patch.object(api, 'get_model', side_effect=get_model), \
+                mock.patch.object(cfg, 'app_data_features', FIXTURES), \
+                mock.patch.object(cfg, 'data_pool_caching', False):
+            return api.predict(time_range=TIME_RANGE, batch_size=32, inference_engine='numpy', use_cache=False,
+                               **kwargs)
+
+    def test_shared_data(self):
+        """
+        Test that the models of the same query read and prepare the data once and predict the same as one by one
+        """
+        prepare = MODS.mods_model.prepare
+        with mock.patch.object(utl, 'datapool_read', wraps=utl.datapool_read) as read, \
+                mock.patch.object(MODS.mods_model, 'prepare', autospec=True, side_effect=prepare) as prepared:
+            message = self.predict(model_names=['a', 'b', 'c', 'missing'])
+
+        self.assertEqual(message['data_groups'], 2)
+        self.assertEqual(sorted(call[0][0] for call in read.call_args_list), sorted([CONN_QUERY, FIXTURES_QUERY]))
+        self.assertEqual(prepared.call_count, 2)
+
+        results = message['models']
+        self.assertEqual([result['model_name'] for result in results], ['a', 'b', 'c', 'missing'])
+        self.assertIn('error', results[3])
+        for name, result in zip(['a', 'b', 'c'], results):
+            self.assertNotIn('error', result)
+            expected = self.predict(model_name=name)
+            np.testing.assert_array_equal(np.array(result['predictions']), np.array(expected['predictions']))
+            self.assertEqual(result['evaluation'], expected['evaluation'])
+        self.assertEqual(len(results[0]['predictions'][0]), 4)
+        self.assertEqual(len(results[2]['predictions'][0]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
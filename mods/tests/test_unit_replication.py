@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the replication of the models to the remote storage
+
+@author: Stefan Dlugolinsky
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import mods.config as cfg
+import mods.models.api_v2 as api
+import mods.models.replication as replication
+from mods.models.replication import DONE, FAILED, ReplicaStore, Replicator
+
+
+class TestReplication(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.local = os.path.join(self.dir, 'models')
+        self.remote = os.path.join(self.dir, 'remote', 'models')
+        os.makedirs(self.local)
+        self.replicator = Replicator(ReplicaStore(os.path.join(self.dir, 'replication.sqlite')), workers=1,
+                                     retries=3, backoff=0.01, poll_interval=0.01)
+
+    def tearDown(self):
+        self.replicator.shutdown()
+        shutil.rmtree(self.dir)
+
+    def model(self, name, content):
+        file = os.path.join(self.local, name)
+        with open(file, mode='wb') as f:
+            f.write(content)
+        return file
+
+    def replicate(self, file):
+        return self.replicator.wait(self.replicator.submit(file, self.remote)['id'], timeout=10)
+
+    def test_copy(self):
+        """
+        Test the verified copy and the deduplication of identical content
+        """
+        content = os.urandom(100000)
+        replica = self.replicate(self.model('a.zip', content))
+        self.assertEqual(replica['state'], DONE)
+        self.assertEqual(replica['sha256'], hashlib.sha256(content).hexdigest())
+        with open(os.path.join(self.remote, 'a.zip'), mode='rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(os.listdir(self.remote), ['a.zip'])
+
+        with mock.patch.object(replication, 'copy_verified') as copy:
+            self.assertEqual(self.replicate(self.model('a.zip', content))['deduplicated'], replica['target'])
+            self.assertEqual(self.replicate(self.model('b.zip', content))['deduplicated'], replica['target'])
+            copy.assert_not_called()
+        self.assertTrue(os.path.samefile(os.path.join(self.remote, 'a.zip'), os.path.join(self.remote, 'b.zip')))
+
+        replica = self.replicate(self.model('a.zip', content + b'v2'))
+        self.assertIsNone(replica['deduplicated'])
+        with open(os.path.join(self.remote, 'a.zip'), mode='rb') as f:
+            self.assertEqual(f.read(), content + b'v2')
+
+    def test_retry(self):
+        """
+        Test that a failed copy is retried with a backoff and fails after the retries
+        """
+        copy = replication.copy_verified
+        attempts = []
+
+        def flaky(source, target):
+            attempts.append(target)
+            if len(attempts) == 1:
+                raise OSError('remote unavailable')
+            return copy(source, target)
+
+        with mock.patch.object(replication, 'copy_verified', side_effect=flaky):
+            replica = self.replicate(self.model('a.zip', b'model'))
+        self.assertEqual((replica['state'], replica['attempts']), (DONE, 2))
+
+        replica = self.replicate(os.path.join(self.local, 'missing.zip'))
+        self.assertEqual((replica['state'], replica['attempts']), (FAILED, 3))
+        self.assertIn('FileNotFoundError', replica['error'])
+
+    def test_api(self):
+        """
+        Test the awaited replication of a saved model and the skipped replication into the local models
+        """
+        file = self.model('a.zip', b'model')
+        with mock.patch.object(cfg, 'app_models', self.local), \
+                mock.patch.object(cfg, 'app_models_remote', self.remote), \
+                mock.patch.object(replication, 'get_replicator', return_value=self.replicator), \
+                mock.patch.object(cfg, 'replication_async', False):
+            replica = api.copy_model_remote(file)
+            self.assertEqual(replica['state'], DONE)
+            self.assertEqual(api.get_replication(replica['id'])['target'], os.path.join(self.remote, 'a.zip'))
+            self.assertEqual(len(api.list_replications(DONE)), 1)
+            with mock.patch.object(cfg, 'app_models_remote', self.local):
+                self.assertIsNone(api.copy_model_remote(file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the prediction result cache
+
+@author: Stefan Dlugolinsky
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest import mock
+
+import numpy as np
+
+import mods.config as cfg
+import mods.models.api_v2 as api
+import mods.utils as utl
+from mods.models.result_cache import ResultCache, get_cache
+from mods.mods_types import TimeRange
+from mods.tests.helpers import FIXTURES, FIXTURES_QUERY, random_model
+
+
+def rewrite_member(zip_file_name, member, suffix):
+    """Appends a line to a member of the zip file"""
+    with zipfile.ZipFile(zip_file_name) as zip_file:
+        members = {name: zip_file.read(name) for name in zip_file.namelist()}
+    members[member] += suffix
+    with zipfile.ZipFile(zip_file_name, mode='w') as zip_file:
+        for name, data in members.items():
+            zip_file.writestr(name, data)
+
+
+class TestResultCache(unittest.TestCase):
+    def test_eviction(self):
+        """
+        Test the eviction of the least recently used, too large and expired results
+        """
+        cache = ResultCache(max_entries=2, max_bytes=100, ttl=3600)
+        cache.put('a', 1, size=10)
+        cache.put('b', 2, size=10)
+        self.assertEqual(cache.get('a')[0], 1)
+        cache.put('c', 3, size=10)
+        self.assertIsNone(cache.get('b'))
+        cache.put('d', 4, size=95)
+        self.assertEqual((len(cache), cache.get('c')), (1, None))
+        cache.put('e', 5, size=101)
+        self.assertIsNone(cache.get('e'))
+
+        cache.ttl = 0.01
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+
+class TestPredictCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.features = os.path.join(self.dir, 'features')
+        shutil.copytree(FIXTURES, self.features)
+        self.patches = [
+            mock.patch.object(cfg, 'app_data_features', self.features),
+            mock.patch.object(cfg, 'app_data_pool_cache', os.path.join(self.dir, 'cache', 'features'))
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.dir)
+
+    def test_fingerprint(self):
+        """
+        Test that the fingerprint changes with the content of a selected data segment only
+        """
+        ws = 'w01h-s10m'
+        days = TimeRange.from_str('<2019-06-01,2019-06-02>')
+        fingerprints = [utl.datapool_fingerprint(FIXTURES_QUERY, days, ws, [], self.features)]
+        rewrite_member(os.path.join(self.features, '2019-06-03.zip'), 'conn/2019/06/03/w01h-s10m.tsv', b'')
+        fingerprints.append(utl.datapool_fingerprint(FIXTURES_QUERY, days, ws, [], self.features))
+        rewrite_member(os.path.join(self.features, '2019-06-02.zip'), 'conn/2019/06/02/w01h-s10m.tsv', b'\n')
+        fingerprints.append(utl.datapool_fingerprint(FIXTURES_QUERY, days, ws, [], self.features))
+        self.assertEqual(fingerprints[0], fingerprints[1])
+        self.assertNotEqual(fingerprints[1], fingerprints[2])
+
+    def test_predict(self):
+        """
+        Test that a repeated prediction is cached regardless of the batch size and is invalidated by a change
+        of the model or the data
+        """
+        time_range = '<2019-06-01,2019-06-04)'
+        df, _ = utl.datapool_read(FIXTURES_QUERY, TimeRange.from_str(time_range), 'w01h-s10m', [], self.features,
+                                  caching=False)
+        model = random_model(np.random.RandomState(0), utl.fix_missing_num_values(df), delta=True, horizons=1)
+        model.set_data_select_query(FIXTURES_QUERY)
+        model.set_window_slide('w01h-s10m')
+        model_file = os.path.join(self.dir, 'model.zip')
+        with open(model_file, mode='wb') as f:
+            f.write(b'model')
+        get_cache().clear()
+
+        def predict(batch_size, **kwargs):
+            with mock.patch.object(api, 'get_model', return_value=model):
+                return api.predict(model_name=model_file, full_paths=True, time_range=time_range,
+                                   batch_size=batch_size, inference_engine='numpy', **kwargs)
+
+        first = predict(16)
+        self.assertFalse(first['result_cache']['hit'])
+        second = predict(64)
+        self.assertTrue(second['result_cache']['hit'])
+        self.assertEqual(second['batch_size'], 64)
+        np.testing.assert_array_equal(second['predictions'], first['predictions'])
+        self.assertEqual(second['evaluation'], first['evaluation'])
+        page = predict(64, page=2, page_size=100, response_format='npy')
+        self.assertTrue(page['result_cache']['hit'])
+        self.assertFalse(predict(64, use_cache=False).get('result_cache'))
+
+        rewrite_member(os.path.join(self.features, '2019-06-02.zip'), 'conn/2019/06/02/w01h-s10m.tsv', b'\n')
+        self.assertFalse(predict(64)['result_cache']['hit'])
+        self.assertTrue(predict(64)['result_cache']['hit'])
+        with open(model_file, mode='wb') as f:
+            f.write(b'model v2')
+        self.assertFalse(predict(64)['result_cache']['hit'])
+
+
+if __name__ == '__main__':
+    unittest.main()
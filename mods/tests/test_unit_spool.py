@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the out-of-core training data
+
+@author: Stefan Dlugolinsky
+"""
+import importlib.util
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+import mods.models.mods_model as MODS
+from mods.models.spool import Spool
+
+HAS_KERAS = importlib.util.find_spec('keras') is not None
+
+
+def model(delta):
+    m = MODS.mods_model('spool_test')
+    m.set_sequence_len(6)
+    m.set_model_delta(delta)
+    m.set_interpolate(True)
+    m.set_steps_ahead(1)
+    return m
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.df = pd.DataFrame(rnd.randint(0, 1000, size=(50, 3)), columns=['a', 'b', 'c'])
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def spool(self, m, df=None):
+        df = self.df if df is None else df
+        spool = Spool(m, dir=self.dir.name)
+        for beg, end in [(0, 7), (7, 8), (8, 31), (31, 50)]:
+            spool.append(df.iloc[beg:end])
+        return spool
+
+    def test_chunks_match_whole_data(self):
+        """
+        Test that the spooled chunks equal the transformation of the whole data and the scaler is fitted the same
+        """
+        # missing values: leading, over the boundaries of the chunks (one of them a single row) and trailing
+        nan = self.df.astype(np.float64)
+        nan.iloc[0, 2] = np.nan
+        nan.iloc[5:10, 0] = np.nan
+        nan.iloc[29:33, 1] = np.nan
+        nan.iloc[47:, 2] = np.nan
+        for df in [self.df, nan]:
+            for delta in [True, False]:
+                m = model(delta)
+                spool = self.spool(m, df)
+                interpolated = df.interpolate()
+                trans = m.transform(interpolated)
+                scaler = MinMaxScaler(feature_range=(0, 1)).fit(trans)
+                np.testing.assert_allclose(spool.open(), trans.values, rtol=1e-12)
+                np.testing.assert_allclose(m.get_scaler().data_min_, scaler.data_min_, rtol=1e-12)
+                np.testing.assert_allclose(m.get_scaler().data_max_, scaler.data_max_, rtol=1e-12)
+                pd.testing.assert_frame_equal(spool.tail, interpolated.tail(m.get_history_len(16)))
+                spool.close()
+
+    @unittest.skipUnless(HAS_KERAS, 'keras is not installed')
+    def test_generator_batches(self):
+        """
+        Test that the batches of the spooled data are the same as the batches of the normalized whole data
+        """
+        from mods.models.generators import WindowGenerator
+
+        m = model(True)
+        spool = self.spool(m)
+        windows, targets = m.get_windows_targets(spool.open(), 1)
+        spooled = WindowGenerator(windows, targets, batch_size=8, scaler=m.get_scaler())
+
+        norm = MinMaxScaler(feature_range=(0, 1)).fit_transform(m.transform(self.df))
+        windows, targets = m.get_windows_targets(norm, 1)
+        whole = WindowGenerator(windows, targets, batch_size=8)
+
+        self.assertEqual(len(spooled), len(whole))
+        for i in range(len(whole)):
+            np.testing.assert_allclose(spooled[i][0], whole[i][0], atol=1e-12)
+            np.testing.assert_allclose(spooled[i][1], whole[i][1], atol=1e-12)
+        spool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the debug tracing
+
+@author: Stefan Dlugolinsky
+"""
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import mods.tracing as tracing
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_snapshots(self):
+        """
+        Test that the snapshots are sampled, limited in rows and copied before the caller modifies its buffers
+        """
+        tracer = tracing.Tracer(dir=self.dir.name, every=2, max_rows=3)
+        df = pd.DataFrame(np.arange(12.).reshape((4, 3)), columns=['a', 'b', 'c'])
+        buffer = np.arange(10.)
+        self.assertTrue(tracer.trace('model.zip', 'original', df))
+        self.assertFalse(tracer.trace('model.zip', 'original', df))
+        self.assertTrue(tracer.trace('model.zip', 'buffer', buffer))
+        buffer[:] = -1
+        tracer.flush()
+
+        dir = tracing.snapshot_dir('model.zip', self.dir.name)
+        entries = tracing.read_manifest(dir)
+        self.assertEqual([e['stage'] for e in entries], ['original', 'buffer'])
+        self.assertEqual(entries[0]['columns'], ['a', 'b', 'c'])
+        self.assertEqual(entries[0]['rows'], 4)
+        np.testing.assert_array_equal(tracing.load(dir, entries[0]), df.values[:3])
+        np.testing.assert_array_equal(tracing.load(dir, entries[1]), np.arange(3.))
+
+    def test_max_bytes(self):
+        """
+        Test that tracing stops when the limit of written bytes is reached
+        """
+        tracer = tracing.Tracer(dir=self.dir.name, max_bytes=100)
+        self.assertTrue(tracer.trace('model', 'x', np.zeros((20, 1))))
+        tracer.flush()
+        self.assertFalse(tracer.trace('model', 'x', np.zeros((20, 1))))
+        self.assertEqual(len(tracing.read_manifest(tracing.snapshot_dir('model', self.dir.name))), 1)
+
+    def test_runs(self):
+        """
+        Test that a later run (another tracer) of the same directory keeps the snapshots of the earlier ones
+        """
+        first = tracing.Tracer(dir=self.dir.name)
+        self.assertTrue(first.trace('model', 'x', np.zeros((5, 2))))
+        self.assertTrue(first.trace('model', 'y', np.ones(4)))
+        first.flush()
+        second = tracing.Tracer(dir=self.dir.name)
+        self.assertTrue(second.trace('model', 'x', np.full((3, 2), 2.)))
+        second.flush()
+        # both tracers write to the directory at the same time
+        self.assertTrue(first.trace('model', 'y', np.full(2, 3.)))
+        first.flush()
+
+        dir = tracing.snapshot_dir('model', self.dir.name)
+        entries = tracing.read_manifest(dir)
+        self.assertEqual([e['seq'] for e in entries], [1, 2, 3, 4])
+        self.assertEqual(len(set(e['file'] for e in entries)), 4)
+        for entry, expected in zip(entries, [np.zeros((5, 2)), np.ones(4), np.full((3, 2), 2.), np.full(2, 3.)]):
+            self.assertEqual(entry['shape'], list(expected.shape))
+            np.testing.assert_array_equal(tracing.load(dir, entry), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the incremental update of the models on the newly arrived days
+
+@author: Stefan Dlugolinsky
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import mods.config as cfg
+import mods.models.api_v2 as api
+import mods.models.mods_model as MODS
+import mods.utils as utl
+from mods.mods_types import TimeRange
+from mods.tests.helpers import FIXTURES, FIXTURES_QUERY, random_model
+
+
+class TestUpdate(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        df, _ = utl.datapool_read(FIXTURES_QUERY, TimeRange.from_str('<2019-06-01,2019-06-02)'), 'w01h-s10m', [],
+                                  FIXTURES, caching=False)
+        df = utl.fix_missing_num_values(df)
+        model = random_model(np.random.RandomState(0), df)
+        model.set_data_select_query(FIXTURES_QUERY)
+        model.set_window_slide('w01h-s10m')
+        model.set_train_time_range(TimeRange.from_str('<2019-06-01,2019-06-02)'))
+        model.set_test_time_range(TimeRange.from_str('<2019-06-02,2019-06-03)'))
+        model.set_train_time_ranges_excluded([])
+        model.set_test_time_ranges_excluded([])
+        model.set_sample_data(df.tail(model.get_history_len(cfg.warmup_windows)))
+        with mock.patch.object(utl, 'keras_model_to_bytes', return_value=b''):
+            self.model_file = model.save(os.path.join(self.dir, 'model.zip'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def update(self, update_until):
+        """
+        api.update with the numpy model in place of the keras one; the fine-tuning itself is not part of the test
+        """
+        load = MODS.mods_model.load
+        fine_tuned = []
+
+        def fine_tune(model, df_new, **kwargs):
+            fine_tuned.append(df_new)
+            return 1.0
+
+        with mock.patch.object(MODS.mods_model, 'load',
+                               lambda model, file, engine=None, warmup=True: load(model, file, 'numpy', warmup)), \
+                mock.patch.object(MODS.mods_model, 'fine_tune', fine_tune), \
+                mock.patch.object(utl, 'keras_model_to_bytes', return_value=b''), \
+                mock.patch.object(cfg, 'app_data_features', FIXTURES), \
+                mock.patch.object(cfg, 'data_pool_caching', False), \
+                mock.patch.object(cfg, 'app_models_remote', None):
+            message = api.update(model_name=self.model_file, update_until=update_until, full_paths=True)
+        return message, fine_tuned
+
+    def test_update(self):
+        """
+        Test that the model is fine-tuned on the new days out of its test time range and evaluated on it
+        """
+        message, fine_tuned = self.update('2019-06-04')
+        self.assertEqual(message['update_time_range'], '<2019-06-02,2019-06-04)')
+        self.assertIs(message['update_test_time_range_excluded'], True)
+        self.assertEqual(message['test_time_range'], '<2019-06-02,2019-06-03)')
+
+        # the test day is not in the fine-tuning data
+        self.assertEqual(len(fine_tuned), 1)
+        df, _ = utl.datapool_read(FIXTURES_QUERY, TimeRange.from_str('<2019-06-03,2019-06-04)'), 'w01h-s10m', [],
+                                  FIXTURES, caching=False)
+        pd.testing.assert_frame_equal(fine_tuned[0], utl.fix_missing_num_values(df))
+        self.assertEqual(message['update_rows'], len(df))
+
+        with zipfile.ZipFile(os.path.join(message['dir_models'], message['model_name'])) as zip:
+            config = json.loads(zip.read('config.json').decode('utf-8'))['model']
+            metrics = json.loads(zip.read('metrics.json').decode('utf-8'))
+        self.assertEqual(config['train_time_range'], '<2019-06-01,2019-06-04)')
+        self.assertEqual(config['train_time_ranges_excluded'], ['<2019-06-02,2019-06-03)'])
+        self.assertIs(metrics['update_test_time_range_excluded'], True)
+        self.assertEqual(metrics['update_time'], 1.0)
+        self.assertEqual(len(metrics['mods_smape']), len(df.columns))
+
+    def test_test_time_range_only(self):
+        """
+        Test that the model is not updated when all the new days are in its test time range
+        """
+        message, fine_tuned = self.update('2019-06-03')
+        self.assertEqual(fine_tuned, [])
+        self.assertEqual(message['model_name'], 'model.zip')
+        self.assertIs(message['update_test_time_range_excluded'], True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the predictions from uploaded and inline data
+
+@author: Stefan Dlugolinsky
+"""
+import collections
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import mods.config as cfg
+import mods.models.api_v2 as api
+import mods.utils as utl
+from mods.mods_types import TimeRange
+from mods.tests.helpers import FIXTURES, FIXTURES_QUERY, random_model
+
+# the attribute of deepaas uploaded files used by api_v2.read_data
+UploadedFile = collections.namedtuple('UploadedFile', ['filename'])
+
+
+class TestUpload(unittest.TestCase):
+    def setUp(self):
+        self.time_range = '<2019-06-01,2019-06-04)'
+        df, _ = utl.datapool_read(FIXTURES_QUERY, TimeRange.from_str(self.time_range), 'w01h-s10m', [], FIXTURES,
+                                  caching=False)
+        self.df = utl.fix_missing_num_values(df)
+        self.model = random_model(np.random.RandomState(0), self.df, delta=True, horizons=1)
+        self.model.set_data_select_query(FIXTURES_QUERY)
+        self.model.set_window_slide('w01h-s10m')
+        # columns in another order, an extra column and a missing value
+        upload = self.df[self.df.columns[::-1]].copy()
+        upload['extra'] = 'x'
+        upload.iloc[5, 0] = np.nan
+        self.tsv = upload.to_csv(sep='\t', index=False)
+
+    def predict(self, **kwargs):
+        with mock.patch.object(api, 'get_model', return_value=self.model), \
+                mock.patch.object(cfg, 'app_data_features', FIXTURES):
+            return api.predict(model_name='model.zip', batch_size=32, inference_engine='numpy', use_cache=False,
+                               **kwargs)
+
+    def test_inline(self):
+        """
+        Test that the uploaded and inline rows are predicted the same as the rows of the data pool
+        """
+        df = self.df.copy()
+        df.iloc[5, -1] = np.nan
+        expected = self.model.predict(utl.fix_missing_num_values(df))
+
+        batch_size = self.model.get_batch_size()
+        result = self.predict(data_inline=self.tsv)
+        np.testing.assert_allclose(np.array(result['predictions']), expected)
+        self.assertEqual(result['data_rows'], len(self.df))
+        # the batch size of the request does not change the shared model
+        self.assertEqual((result['batch_size'], self.model.get_batch_size()), (32, batch_size))
+        self.assertIsNone(result['cached_df'])
+
+        result = self.predict(data_inline=self.tsv.replace('\t', ',').encode('utf-8'), data_sep=',')
+        np.testing.assert_allclose(np.array(result['predictions']), expected)
+
+        with tempfile.TemporaryDirectory() as dir:
+            file = os.path.join(dir, 'upload.tsv')
+            with open(file, mode='w') as f:
+                f.write(self.tsv)
+            result = self.predict(data=UploadedFile(file), forecast_only=True, forecasts=3)
+        np.testing.assert_allclose(np.array(result['predictions']), expected[-3:])
+
+    def test_missing_column(self):
+        """
+        Test that the rows without a column of the data select query are rejected
+        """
+        with self.assertRaisesRegex(ValueError, 'dns_in_distinct'):
+            self.predict(data_inline=self.df.drop(columns=['dns_in_distinct']).to_csv(sep='\t', index=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2017 - 2019 Karlsruhe Institute of Technology - Steinbuch Centre for Computing
+# This code is distributed under the MIT License
+# Please, see the LICENSE file
+#
+"""
+Tests of the warm-up of the models from their stored sample data
+
+@author: Stefan Dlugolinsky
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import mods.config as cfg
+import mods.models.api_v2 as api
+import mods.models.mods_model as MODS
+import mods.models.replication as replication
+import mods.utils as utl
+from mods.mods_types import TimeRange
+from mods.tests.helpers import FIXTURES, FIXTURES_QUERY, random_model
+
+
+class TestWarmup(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        df, _ = utl.datapool_read(FIXTURES_QUERY, TimeRange.from_str('<2019-06-01,2019-06-04)'), 'w01h-s10m', [],
+                                  FIXTURES, caching=False)
+        self.df = utl.fix_missing_num_values(df)
+
+    def tearDown(self):
+        with api._models_lock:
+            for key in [key for key in api._models if key[0].startswith(self.dir)]:
+                del api._models[key]
+        shutil.rmtree(self.dir)
+
+    def save(self, name, seed):
+        model = random_model(np.random.RandomState(seed), self.df)
+        model.set_sample_data(self.df.tail(model.get_history_len(cfg.warmup_windows)))
+        # the keras network is not part of the test; the numpy model is stored next to it
+        with mock.patch.object(utl, 'keras_model_to_bytes', return_value=b''):
+            model.save(os.path.join(self.dir, name))
+        return model
+
+    def test_save_load(self):
+        """
+        Test that the sample data survive the save and load and that the loaded model is warmed up by them
+        """
+        model = self.save('a.zip', 0)
+        loaded = MODS.mods_model('a')
+        loaded.load(os.path.join(self.dir, 'a.zip'), engine='numpy')
+
+        self.assertEqual(list(loaded.sample_data.columns), [str(c) for c in model.sample_data.columns])
+        np.testing.assert_array_equal(loaded.sample_data.values, model.sample_data.values.astype(np.float32))
+        self.assertIsNotNone(loaded.warmup_time)
+        np.testing.assert_allclose(loaded.predict(loaded.sample_data), model.predict(loaded.sample_data),
+                                   rtol=1e-5, atol=1e-5)
+
+        loaded = MODS.mods_model('a')
+        loaded.load(os.path.join(self.dir, 'a.zip'), engine='numpy', warmup=False)
+        self.assertIsNone(loaded.warmup_time)
+
+    def test_warm(self):
+        """
+        Test that warm() loads and warms up every listed model and skips the broken ones
+        """
+        self.save('a.zip', 0)
+        self.save('b.zip', 1)
+        with open(os.path.join(self.dir, 'broken.zip'), mode='wb') as f:
+            f.write(b'not a zip')
+        get_model = api.get_model
+
+        with mock.patch.object(cfg, 'list_models', return_value=['a.zip', 'b.zip', 'broken.zip']), \
+                mock.patch.object(api, 'get_model', side_effect=lambda name: get_model(name, self.dir, 'numpy')), \
+                mock.patch.object(replication, 'get_replicator'), \
+                mock.patch.object(cfg, 'app_data_features', FIXTURES), \
+                mock.patch.object(cfg, 'warm_models', True), \
+                mock.patch.object(cfg, 'predict_batching', False):
+            api.warm()
+
+        for name in ['a.zip', 'b.zip']:
+            _, model = api._models[(os.path.join(self.dir, name), 'numpy')]
+            self.assertIsNotNone(model.warmup_time)
+            # served from the warmed up models
+            self.assertIs(get_model(name, self.dir, 'numpy'), model)
+        self.assertNotIn((os.path.join(self.dir, 'broken.zip'), 'numpy'), api._models)
+
+
+if __name__ == '__main__':
+    unittest.main()
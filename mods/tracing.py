@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Debug tracing of the pipeline stages
+
+An array (or dataframe) of a stage is copied, at most cfg.trace_max_rows
+rows of it, and queued; a background thread writes it as a binary .npy
+snapshot and appends a line describing it to manifest.jsonl in the same
+directory:
+
+    app_trace/<model>/<seq>-<stage>.npy
+
+The sequence numbers of a directory continue from its manifest, so the
+snapshots of the earlier runs (or of other processes) are kept.
+The caller is never blocked by the writing: when the queue is full the
+snapshot is dropped and counted. Tracing stops when cfg.trace_max_bytes
+are written. Use mods.visualization.trace_viewer to browse the snapshots.
+
+@author: stefan dlugolinsky
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import mods.config as cfg
+
+MANIFEST = 'manifest.jsonl'
+
+
+def snapshot_dir(model_name, dir=None):
+    name = model_name[:-4] if model_name.lower().endswith('.zip') else model_name
+    return os.path.join(dir or cfg.app_trace, os.path.basename(name))
+
+
+class Tracer:
+
+    def __init__(self, dir=None, every=None, max_rows=None, max_bytes=None, queue_size=None):
+        self.dir = dir
+        self.every = every or cfg.trace_every
+        self.max_rows = max_rows or cfg.trace_max_rows
+        self.max_bytes = max_bytes or cfg.trace_max_bytes
+        self.bytes = 0
+        self.dropped = 0
+        # last sequence number and manifest size of each snapshot directory
+        self.__seq = {}
+        self.__calls = {}
+        self.__lock = threading.Lock()
+        self.__queue = queue.Queue(maxsize=queue_size or cfg.trace_queue_size)
+        self.__thread = None
+
+    def trace(self, model_name, stage, data):
+        """
+        Queues a snapshot of data; returns False if the snapshot was not taken
+        """
+        with self.__lock:
+            calls = self.__calls.get((model_name, stage), 0)
+            self.__calls[(model_name, stage)] = calls + 1
+            if calls % self.every != 0 or self.bytes >= self.max_bytes:
+                return False
+
+        columns = None
+        if isinstance(data, pd.DataFrame):
+            columns = [str(c) for c in data.columns]
+        rows = len(data) if np.ndim(data) > 0 else 1
+        # a copy, the caller may go on modifying its buffers in place
+        array = np.array(data[:self.max_rows] if np.ndim(data) > 0 else data)
+        if array.dtype == object:
+            array = array.astype(str)
+
+        meta = {
+            'seq': None,        # assigned when written
+            'stage': stage,
+            'time': time.time(),
+            'shape': list(array.shape),
+            'rows': rows,
+            'dtype': str(array.dtype),
+            'columns': columns
+        }
+
+        self.__start()
+        try:
+            self.__queue.put_nowait((snapshot_dir(model_name, self.dir), meta, array))
+        except queue.Full:
+            with self.__lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """Waits until the queued snapshots are written"""
+        if self.__thread is not None:
+            self.__queue.join()
+
+    def __start(self):
+        if self.__thread is None:
+            with self.__lock:
+                if self.__thread is None:
+                    self.__thread = threading.Thread(target=self.__write, name='mods-tracer', daemon=True)
+                    self.__thread.start()
+
+    def __write(self):
+        while True:
+            dir, meta, array = self.__queue.get()
+            try:
+                if self.bytes < self.max_bytes:
+                    cfg.ensure_dir(dir)
+                    self.__save(dir, meta, array)
+                    with self.__lock:
+                        self.bytes += array.nbytes
+                        if self.bytes >= self.max_bytes:
+                            logging.info('tracing stopped, %d bytes written' % self.bytes)
+            except Exception as e:
+                logging.error('failed to write trace %s: %s' % (meta['stage'], e))
+            finally:
+                self.__queue.task_done()
+
+    def __save(self, dir, meta, array):
+        with open(os.path.join(dir, MANIFEST), mode='a') as manifest:
+            # the tracers of other processes wait, so they do not take the same sequence number
+            fcntl.flock(manifest, fcntl.LOCK_EX)
+            seq, size = self.__seq.get(dir, (0, -1))
+            if os.fstat(manifest.fileno()).st_size != size:
+                # the manifest was written by another tracer
+                seq = max([e['seq'] for e in read_manifest(dir)], default=0)
+            meta['seq'] = seq + 1
+            meta['file'] = '%06d-%s.npy' % (meta['seq'], meta['stage'].replace(os.sep, '_'))
+            np.save(os.path.join(dir, meta['file']), array, allow_pickle=False)
+            manifest.write(json.dumps(meta) + '\n')
+            manifest.flush()
+            self.__seq[dir] = (meta['seq'], os.fstat(manifest.fileno()).st_size)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer()
+                atexit.register(_tracer.flush)
+    return _tracer
+
+
+def trace(model_name, stage, data):
+    return get_tracer().trace(model_name, stage, data)
+
+
+def read_manifest(dir):
+    """Returns the snapshot descriptions of a trace directory in the order they were written"""
+    entries = []
+    file = os.path.join(dir, MANIFEST)
+    if os.path.isfile(file):
+        with open(file) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    return entries
+
+
+def load(dir, entry):
+    return np.load(os.path.join(dir, entry['file']), allow_pickle=False)
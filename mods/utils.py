@@ -26,19 +26,19 @@ import io
 import logging
 import os
 import re
+import resource
+import threading
 import zipfile
-from math import sqrt
 
 import numpy as np
 import pandas as pd
 import pytz
 from dateutil.relativedelta import *
-from numpy import dot
 from numpy.linalg import norm
-from sklearn.metrics import mean_squared_error
-from sklearn.metrics import r2_score
 
 import mods.config as cfg
+import mods.tracing as tracing
+from mods.metrics import Accumulator, scores
 from mods.mods_types import TimeRange
 
 
@@ -97,60 +97,42 @@ def read_data(filename):
 
 # @giang: RMSE for numpy array
 def rmse(a, b):
-    score = []
-    for i in range(a.shape[1]):
-        score.append(sqrt(mean_squared_error(a[:, i], b[:, i])))
-    return score
+    return scores(np.sqrt(np.mean(np.square(np.subtract(a, b)), axis=0)))
 
 
 # @giang: cosine similarity for two numpy arrays, <-1.0, 1.0>
 def cosine(a, b):
-    score = []
-    for i in range(a.shape[1]):
-        cos_sim = dot(a[:, i], b[:, i]) / (norm(a[:, i]) * norm(b[:, i]))
-        score.append(cos_sim)
-    return score
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return scores(np.sum(a * b, axis=0) / (norm(a, axis=0) * norm(b, axis=0)))
 
 
 # @giang: R^2 (coefficient of determination) regression score, <-1.0, 1.0>, not a symmetric function
+# the same as sklearn.metrics.r2_score of each column: 1.0 for a perfect fit of a constant, 0.0 otherwise
 def r2(a, b):
-    score = []
-    for i in range(a.shape[1]):
-        score.append(r2_score(a[:, i], b[:, i]))
-    return score
+    ss_res = np.sum(np.square(np.subtract(a, b)), axis=0)
+    ss_tot = np.sum(np.square(a - np.mean(a, axis=0)), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = 1 - ss_res / ss_tot
+    score[ss_tot == 0] = np.where(ss_res[ss_tot == 0] == 0, 1.0, 0.0)
+    return scores(score)
 
 
 # @giang/@stevo: MAPE = np.mean(np.abs((A-F)/A)) * 100
 def mape(y_true, y_pred):
     assert isinstance(y_true, np.ndarray), 'numpy array expected for y_true in mape'
     assert isinstance(y_pred, np.ndarray), 'numpy array expected for y_pred in mape'
-    score = []
-    for i in range(y_true.shape[1]):
-        try:
-            s = np.mean(np.abs((y_true[:, i] - y_pred[:, i]) / y_true[:, i])) * 100
-            if np.isnan(s):
-                s = str(s)
-            score.append(s)
-        except ZeroDivisionError:
-            score.append(str(np.nan))
-    return score
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.mean(np.abs((y_true - y_pred) / y_true), axis=0) * 100
+    return scores(score, nan_as_str=True)
 
 
 # @giang/@stevo: SMAPE = 100/len(A) * np.sum(2 * np.abs(F-A) / (np.abs(A) + np.abs(F))), symmetric function
 def smape(y_true, y_pred):
     assert isinstance(y_true, np.ndarray), 'numpy array expected for y_true in smape'
     assert isinstance(y_pred, np.ndarray), 'numpy array expected for y_pred in smape'
-    score = []
-    for i in range(y_true.shape[1]):
-        try:
-            s = 100 / len(y_true[:, i]) * \
-                np.sum(2 * np.abs(y_pred[:, i] - y_true[:, i]) / (np.abs(y_true[:, i]) + np.abs(y_pred[:, i])))
-            if np.isnan(s):
-                s = str(s)
-            score.append(s)
-        except ZeroDivisionError:
-            score.append(str(np.nan))
-    return score
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = 100 / len(y_true) * np.sum(2 * np.abs(y_pred - y_true) / (np.abs(y_true) + np.abs(y_pred)), axis=0)
+    return scores(score, nan_as_str=True)
 
 
 ##### @stevo @stevo @stevo#####
@@ -167,57 +149,54 @@ def parse_int_or_str(val):
 
 # @stevo
 def compute_metrics(y_true, y_pred, model):
+    """
+    y_true and y_pred are aligned real values, (samples, features) or, for
+    multi-horizon models, (samples, horizons, features); the metrics are
+    computed from the predictions in one pass (see mods.metrics.Accumulator),
+    the model is not run again and its scaler is not changed
+    """
     result = {}
 
     if len(y_true) > 1 and len(y_true) == len(y_pred):
 
-        eval_result = model.eval(y_true)
-
         if isinstance(y_true, pd.DataFrame):
             y_true = y_true.values
 
         if isinstance(y_pred, pd.DataFrame):
             y_pred = y_pred.values
 
-        # err_mape = mape(y_true, y_pred)
-        err_smape = smape(y_true, y_pred)
-        err_r2 = r2(y_true, y_pred)
-        err_rmse = rmse(y_true, y_pred)
-        err_cosine = cosine(y_true, y_pred)
+        result = Accumulator(model).update(y_true, y_pred).result()
 
-        # result['mods_mape'] = err_mape
-        result['mods_smape'] = err_smape
-        result['mods_r2'] = err_r2
-        result['mods_rmse'] = err_rmse
-        result['mods_cosine'] = err_cosine
+    return result
 
-        i = 0
-        for metric in model.model.metrics_names:
-            result[metric] = eval_result[i]
-            i += 1
 
-    return result
+# serializes keras model into an in-memory HDF5 file image
+def keras_model_to_bytes(model):
+    import h5py
+    buffer = io.BytesIO()
+    with h5py.File(buffer, mode='w') as h5file:
+        model.save(h5file)
+    return buffer.getvalue()
+
+
+# inverse method to keras_model_to_bytes
+def keras_model_from_bytes(data, custom_objects=None):
+    import h5py
+    import keras
+    with h5py.File(io.BytesIO(data), mode='r') as h5file:
+        return keras.models.load_model(h5file, custom_objects=custom_objects)
 
 
 # @stevo tsv representation of a dataframe
 def df2tsv(df):
     if isinstance(df, pd.DataFrame):
         df = df.values
-    ret = ''
-    for row in df:
-        for col in row:
-            ret += str(col) + '\t'
-        ret += '\n'
-    return ret
+    return ''.join('\t'.join(map(str, row)) + '\t\n' for row in df)
 
 
 # @stevo tsv representation of a tsg
 def tsg2tsv(tsg):
-    ret = ''
-    for i in range(len(tsg)):
-        x, y = tsg[i]
-        ret += '%s => %s\n' % (x, y)
-    return ret
+    return ''.join('%s => %s\n' % tsg[i] for i in range(len(tsg)))
 
 
 # @stevo saves dataframe to a file
@@ -229,7 +208,6 @@ def save_df(df, model_name, file):
         os.mkdir(dir)
     with open(os.path.join(dir, file), mode='w') as f:
         f.write(df2tsv(df))
-        f.close()
 
 
 # @stevo prints dataframe within a range of rows
@@ -237,12 +215,12 @@ def print_df(df, name, min=0, max=9):
     print('%s:\n%s' % (name, df2tsv(df[min:max])))
 
 
-# @stevo prints dataframe to stdout and/or saves it to a file <<model>>/<<name>>.tsv
+# @stevo prints dataframe to stdout and/or traces it as a binary snapshot <<app_trace>>/<<model>>/<<seq>>-<<name>>.npy
 def dbg_df(df, model_name, df_name, print=False, save=False):
     if print:
         print_df(df, df_name)
     if save:
-        save_df(df, model_name, df_name + '.tsv')
+        tracing.trace(model_name, df_name, df)
 
 
 # @stevo prints TimeSeriesGenerator to stdout
@@ -426,36 +404,17 @@ def exclude(d, ranges):
             return True
 
 
-# @stevo features reading from zip files
-def datapool_read(
-        data_specs_str,                 # protocol/column/merge specification
-        time_range,                     # (beg datetime.datetime, end datetime.datetime)
-        ws,                             # window/slide specification; e.g., w01h-s10m
-        excluded=[],                    # list of dates and ranges that will be omitted
-        base_dir=cfg.app_data,          # base dir with data
-        caching=cfg.data_pool_caching   # caching flag
-):
-    protocols, merge_on_col = parse_data_specs(data_specs_str)
+# true if the time ranges share a point in time
+def overlaps(a: TimeRange, b: TimeRange):
+    if a.beg == b.end:
+        return a.is_lclosed() and b.is_rclosed()
+    if b.beg == a.end:
+        return b.is_lclosed() and a.is_rclosed()
+    return a.beg < b.end and b.beg < a.end
 
-    # read dataset from cache
-    cache_dir = None
-    cache_key = None
-    cache_file = None
-    if caching:
-        cache_dir = os.path.dirname(cfg.app_data_pool_cache)
-        cache_key = data_cache_key(protocols, merge_on_col, ws, time_range, excluded)
-        cache_file = os.path.join(cache_dir, cache_key)
-        if os.path.isfile(cache_file):
-            df = pd.read_csv(
-                cache_file,
-                header=0,
-                sep='\t',
-                skiprows=0,
-                skipfooter=0,
-                engine='python',
-            )
-            return df, cache_file
 
+# original column names to be loaded for each protocol and the columns kept in the final dataset
+def datapool_columns(protocols, merge_on_col):
     # original column names for each protocol
     cols_orig = {}
     # column names after renaming for each protocol
@@ -473,75 +432,129 @@ def datapool_read(
         # columns to be loaded: columns specified for the file as well as columns, that will be used for joins
         # TODO: check duplicate columns?
         cols_orig[protocol].extend(merge_on_col)
+    return cols_orig, keep_cols
 
-    # regex matching directory of a day
-    REGEX_DIR_DAY = re.compile(r'^(?P<protocol>[^/]+)/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/(?P<features>w.+?-s.+?)\.tsv')
 
-    df_main = None
-    # collecting df for each protocol
-    df_protocol = {}
+# regex matching directory of a day
+REGEX_DIR_DAY = re.compile(r'^(?P<protocol>[^/]+)/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/(?P<features>w.+?-s.+?)\.tsv')
+
+
+# members of a zip file as (name, crc, size); the listing is kept until the zip file changes
+_zip_members = {}
+_zip_members_lock = threading.Lock()
+
+
+def zip_members(zip_file_name):
+    stat = os.stat(zip_file_name)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _zip_members_lock:
+        cached = _zip_members.get(zip_file_name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    logging.info('reading zip: %s' % zip_file_name)
+    with zipfile.ZipFile(zip_file_name) as zip_file:
+        members = [(info.filename, info.CRC, info.file_size) for info in zip_file.infolist()]
+    with _zip_members_lock:
+        _zip_members[zip_file_name] = (version, members)
+    return members
+
+
+# lists (protocol, day, zip file, member) of the data files matching the filters without reading them;
+# with fingerprints, (crc, size) of the member is appended
+def datapool_index(cols_orig, ws, time_range, excluded=[], base_dir=cfg.app_data, fingerprints=False):
+    index = []
     for root, directories, filenames in os.walk(base_dir):
         for f in filenames:
             if not f.lower().endswith('.zip'):
                 # skip files that don't end with .zip
                 continue
             zip_file_name = os.path.join(root, f)
-            # read zip
-            logging.info('reading zip: %s' % zip_file_name)
-            with zipfile.ZipFile(zip_file_name) as zip_file:
-                for member in zip_file.namelist():
-                    rematch = REGEX_DIR_DAY.match(member)
-                    if not rematch:
-                        # *.tsv filter
-                        continue
-                    datapool = str(rematch.group('features'))
-                    if datapool != ws:
-                        # window/slide filter
-                        continue
-                    protocol = str(rematch.group('protocol'))
-                    if protocol not in cols_orig.keys():
-                        # protocol filter
-                        continue
-                    year = int(rematch.group('year'))
-                    month = int(rematch.group('month'))
-                    day = int(rematch.group('day'))
-
-                    # exclusion filter
-                    dpt = datetime.datetime(year, month, day, tzinfo=pytz.UTC)
-
-                    data_file = member
-                    if exclude(dpt, excluded) or not is_within_range(dpt, time_range):
-                        logging.info('skipping: %s' % data_file)
-                        continue
-
-                    # load one of the data files
-                    logging.info('loading: %s' % data_file)
-                    fp = zip_file.open(data_file)
-                    df = pd.read_csv(
-                        io.TextIOWrapper(fp),
-                        usecols=cols_orig[protocol],
-                        header=0,
-                        sep='\t',
-                        skiprows=0,
-                        skipfooter=0,
-                        engine='python',
-                    )
-                    fp.close()
-
-                    if cfg.fill_missing_rows_in_timeseries:
-                        # fill missing rows for the loaded day
-                        range_beg = '%d-%02d-%02d' % (year, month, day)
-                        range_end = str(expand_to_datetime(year, month, day) + relativedelta(days=+1))
-                        df = fill_missing_rows(
-                            df,
-                            range_beg=range_beg,
-                            range_end=range_end
-                        )
-
-                    if protocol not in df_protocol.keys():
-                        df_protocol[protocol] = df
-                    else:
-                        df_protocol[protocol] = df_protocol[protocol].append(df)
+            for member, crc, size in zip_members(zip_file_name):
+                rematch = REGEX_DIR_DAY.match(member)
+                if not rematch:
+                    # *.tsv filter
+                    continue
+                datapool = str(rematch.group('features'))
+                if datapool != ws:
+                    # window/slide filter
+                    continue
+                protocol = str(rematch.group('protocol'))
+                if protocol not in cols_orig.keys():
+                    # protocol filter
+                    continue
+                year = int(rematch.group('year'))
+                month = int(rematch.group('month'))
+                day = int(rematch.group('day'))
+
+                # exclusion filter
+                dpt = datetime.datetime(year, month, day, tzinfo=pytz.UTC)
+
+                if exclude(dpt, excluded) or not is_within_range(dpt, time_range):
+                    logging.info('skipping: %s' % member)
+                    continue
+
+                if fingerprints:
+                    index.append((protocol, dpt, zip_file_name, member, (crc, size)))
+                else:
+                    index.append((protocol, dpt, zip_file_name, member))
+    return index
+
+
+# fingerprint of the data segments (days of the protocols) selected by the query and filters;
+# it is computed from the listings of the zip files and changes with the content of any of the segments
+def datapool_fingerprint(
+        data_specs_str,
+        time_range,
+        ws,
+        excluded=[],
+        base_dir=cfg.app_data
+):
+    protocols, merge_on_col = parse_data_specs(data_specs_str)
+    cols_orig, _ = datapool_columns(protocols, merge_on_col)
+    segments = sorted(
+        (protocol, str(dpt), member, crc_size)
+        for protocol, dpt, _, member, crc_size in datapool_index(cols_orig, ws, time_range, excluded, base_dir,
+                                                                  fingerprints=True)
+    )
+    m = hashlib.sha1()
+    m.update(repr(segments).encode('utf-8'))
+    return m.hexdigest()
+
+
+# reads the data file of one day and protocol
+def datapool_read_day(zip_file_name, data_file, usecols, merge_on_col, dpt):
+    logging.info('loading: %s' % data_file)
+    with zipfile.ZipFile(zip_file_name) as zip_file:
+        fp = zip_file.open(data_file)
+        df = pd.read_csv(
+            io.TextIOWrapper(fp),
+            usecols=usecols,
+            header=0,
+            sep='\t',
+            skiprows=0,
+            skipfooter=0,
+            engine='python',
+        )
+        fp.close()
+
+    if cfg.memory_lean:
+        df = downcast(df, exclude=merge_on_col)
+
+    if cfg.fill_missing_rows_in_timeseries:
+        # fill missing rows for the loaded day
+        range_beg = '%d-%02d-%02d' % (dpt.year, dpt.month, dpt.day)
+        range_end = str(expand_to_datetime(dpt.year, dpt.month, dpt.day) + relativedelta(days=+1))
+        df = fill_missing_rows(
+            df,
+            range_beg=range_beg,
+            range_end=range_end
+        )
+    return df
+
+
+# renames, converts, sorts and merges the data of the protocols
+def datapool_merge(df_protocol, protocols, merge_on_col, keep_cols):
+    df_protocol = {protocol: pd.concat(dfs) for protocol, dfs in df_protocol.items()}
 
     for ds in protocols:
         protocol = ds['protocol']
@@ -558,6 +571,7 @@ def datapool_read(
             elif col.lower().endswith('_gb'):
                 df_protocol[protocol][col] = df_protocol[protocol][col].div(1073741824).astype(int)
 
+    df_main = None
     for protocol in df_protocol.keys():
         dbg_df(df_protocol[protocol], 'debug', 'df_%s' % protocol, print=False, save=cfg.MODS_DEBUG_MODE)
         # sort series in case they were loaded in random order (depends on zip file naming and file system sorting)
@@ -572,14 +586,92 @@ def datapool_read(
     # select only specified columns
     df_main = df_main[keep_cols]
     dbg_df(df_main, 'debug', 'df_main', print=False, save=cfg.MODS_DEBUG_MODE)
+    return df_main
+
+
+# features reading from zip files in chunks of days; the chunks follow in time order,
+# so a training can stream them instead of holding the whole time range in memory
+def datapool_iter(
+        data_specs_str,                 # protocol/column/merge specification
+        time_range,                     # (beg datetime.datetime, end datetime.datetime)
+        ws,                             # window/slide specification; e.g., w01h-s10m
+        excluded=[],                    # list of dates and ranges that will be omitted
+        base_dir=cfg.app_data,          # base dir with data
+        chunk_days=cfg.chunk_days,      # number of days in a chunk
+        with_days=False                 # yields (days of the chunk, chunk)
+):
+    protocols, merge_on_col = parse_data_specs(data_specs_str)
+    cols_orig, keep_cols = datapool_columns(protocols, merge_on_col)
+
+    days = {}
+    for protocol, dpt, zip_file_name, member in datapool_index(cols_orig, ws, time_range, excluded, base_dir):
+        days.setdefault(dpt, []).append((protocol, zip_file_name, member))
+
+    days = sorted(days.items())
+    for i in range(0, len(days), chunk_days):
+        df_protocol = {}
+        for dpt, files in days[i:i + chunk_days]:
+            for protocol, zip_file_name, member in files:
+                df = datapool_read_day(zip_file_name, member, cols_orig[protocol], merge_on_col, dpt)
+                df_protocol.setdefault(protocol, []).append(df)
+        if len(df_protocol) < len(protocols):
+            logging.info('[WARNING] skipping days %s: data of some protocols are missing' % [
+                str(dpt.date()) for dpt, _ in days[i:i + chunk_days]])
+            continue
+        df = datapool_merge(df_protocol, protocols, merge_on_col, keep_cols)
+        yield ([dpt for dpt, _ in days[i:i + chunk_days]], df) if with_days else df
+
+
+# @stevo features reading from zip files
+def datapool_read(
+        data_specs_str,                 # protocol/column/merge specification
+        time_range,                     # (beg datetime.datetime, end datetime.datetime)
+        ws,                             # window/slide specification; e.g., w01h-s10m
+        excluded=[],                    # list of dates and ranges that will be omitted
+        base_dir=cfg.app_data,          # base dir with data
+        caching=cfg.data_pool_caching   # caching flag
+):
+    protocols, merge_on_col = parse_data_specs(data_specs_str)
+
+    # read dataset from cache
+    cache_dir = None
+    cache_key = None
+    cache_file = None
+    if caching:
+        cache_dir = os.path.dirname(cfg.app_data_pool_cache)
+        # the cached data are not used after their segments change
+        fingerprint = datapool_fingerprint(data_specs_str, time_range, ws, excluded, base_dir)
+        cache_key = data_cache_key(protocols, merge_on_col, ws, time_range, excluded, fingerprint)
+        cache_file = os.path.join(cache_dir, cache_key)
+        if os.path.isfile(cache_file):
+            df = pd.read_csv(
+                cache_file,
+                header=0,
+                sep='\t',
+                skiprows=0,
+                skipfooter=0,
+                engine='python',
+            )
+            if cfg.memory_lean:
+                df = downcast(df)
+            return df, cache_file
+
+    cols_orig, keep_cols = datapool_columns(protocols, merge_on_col)
+
+    # collecting df for each protocol
+    df_protocol = {}
+    for protocol, dpt, zip_file_name, member in datapool_index(cols_orig, ws, time_range, excluded, base_dir):
+        df = datapool_read_day(zip_file_name, member, cols_orig[protocol], merge_on_col, dpt)
+        df_protocol.setdefault(protocol, []).append(df)
+
+    df_main = datapool_merge(df_protocol, protocols, merge_on_col, keep_cols)
 
     # save dataset to cache
     if caching:
         assert cache_dir is not None
         assert cache_key is not None
         assert cache_file is not None
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir, exist_ok=False)
+        cfg.ensure_dir(cache_dir)
         df_main.to_csv(
             cache_file,
             index=None,
@@ -609,7 +701,7 @@ def compare_protocol_spec(p):
 
 
 # @stevo - computes hash key for caching
-def data_cache_key(protocols, merge_on_col, ws, time_range, excluded):
+def data_cache_key(protocols, merge_on_col, ws, time_range, excluded, fingerprint=''):
     protocols = sorted(protocols, key=compare_protocol_spec)
     merge_on_col = sorted(merge_on_col)
     key_str = str(
@@ -620,13 +712,61 @@ def data_cache_key(protocols, merge_on_col, ws, time_range, excluded):
         + ';' \
         + str(datetime2str(time_range)) \
         + ';' \
-        + str(datetime2str(excluded))
+        + str(datetime2str(excluded)) \
+        + ';' \
+        + fingerprint
     ).lower()
     m = hashlib.md5()
     m.update(key_str.encode('utf-8'))
     return m.hexdigest()
 
 
+# window/slide specification; e.g., w01h-s10m
+REGEX_WINDOW_SLIDE = re.compile(r'^\s*w(?P<window>\d+)(?P<window_unit>[smhd])-s(?P<slide>\d+)(?P<slide_unit>[smhd])\s*$')
+TIME_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+def parse_window_slide(ws):
+    """Parses window/slide specification into (window duration, slide duration) datetime.timedelta pair"""
+    m = REGEX_WINDOW_SLIDE.match(ws)
+    if not m:
+        raise ValueError('invalid window/slide specification: %s' % ws)
+    window = datetime.timedelta(**{TIME_UNITS[m.group('window_unit')]: int(m.group('window'))})
+    slide = datetime.timedelta(**{TIME_UNITS[m.group('slide_unit')]: int(m.group('slide'))})
+    return window, slide
+
+
+def tail_time_range(time_range: TimeRange, rows, ws):
+    """Narrows the time range to the days containing the last #rows rows of the window/slide datapool"""
+    _, slide = parse_window_slide(ws)
+    end = time_range.end
+    if time_range.is_rclosed():
+        # the whole last day is read
+        end += datetime.timedelta(days=1)
+    beg = end - rows * slide
+    # datapool is organized by days
+    beg = beg.replace(hour=0, minute=0, second=0, microsecond=0)
+    if beg <= time_range.beg:
+        return time_range
+    return TimeRange(beg, time_range.end, True, time_range.is_rclosed())
+
+
+# linear interpolation of NaNs in the columns of a 2D array in place; the same as
+# pandas.DataFrame.interpolate(): leading NaNs are kept, trailing NaNs get the last valid value
+def interpolate_nan(values):
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    for col in np.flatnonzero(missing.any(axis=0)):
+        valid = np.flatnonzero(~missing[:, col])
+        if len(valid) == 0:
+            continue
+        fill = np.flatnonzero(missing[:, col])
+        fill = fill[fill > valid[0]]
+        values[fill, col] = np.interp(fill, valid, values[valid, col])
+    return values
+
+
 # @stevo
 def fix_missing_num_values(df, cols=None):
     if cols:
@@ -642,9 +782,44 @@ def fix_missing_num_values(df, cols=None):
         df.replace([np.inf, -np.inf], np.nan, inplace=True)
         df.replace(['NaN', np.nan], 0, inplace=True)
         df.interpolate(inplace=True)
+    if cfg.memory_lean:
+        # float32 keeps the data small through the delta, scaling and windowing
+        df = df.astype(np.float32)
     return df
 
 
+# downcasts numeric columns: integers to the smallest lossless integer type, floats to float32
+def downcast(df, exclude=[]):
+    for col in df.columns:
+        if col in exclude:
+            continue
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+# current and peak resident set size of the process in MB
+def memory_usage():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024     # kB on linux
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * resource.getpagesize() / 1048576
+    except OSError:
+        current = None
+    return current, peak
+
+
+# logs memory usage after a pipeline stage; optionally collects it into the report dict
+def log_memory(stage, report=None):
+    current, peak = memory_usage()
+    logging.info('memory after %s: rss=%s MB, peak rss=%.1f MB' % (stage, current, peak))
+    if report is not None:
+        report[stage] = {'rss_mb': current, 'peak_rss_mb': peak}
+    return report
+
+
 # @stevo
 def estimate_window_spec(df):
     tmpdf = df[['window_start', 'window_end']]
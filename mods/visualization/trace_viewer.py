@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Viewer of the debug traces (see mods.tracing)
+
+    python -m mods.visualization.trace_viewer                       # traced models
+    python -m mods.visualization.trace_viewer model                 # snapshots of a model
+    python -m mods.visualization.trace_viewer model --show 12 --rows 20
+    python -m mods.visualization.trace_viewer model --stage prediction --tsv prediction.tsv
+    python -m mods.visualization.trace_viewer model --show 12 --plot prediction.png
+
+@author: stefan dlugolinsky
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+import mods.config as cfg
+import mods.tracing as tracing
+
+
+def list_models(dir):
+    if not os.path.isdir(dir):
+        return []
+    return sorted(d for d in os.listdir(dir) if os.path.isfile(os.path.join(dir, d, tracing.MANIFEST)))
+
+
+def select(entries, show=None, stage=None):
+    if show is not None:
+        return [e for e in entries if e['seq'] == show]
+    if stage is not None:
+        return [e for e in entries if e['stage'] == stage]
+    return entries
+
+
+def as_2d(array):
+    return array.reshape((len(array), -1)) if array.ndim > 1 else array.reshape((-1, 1))
+
+
+def print_snapshot(entry, array, rows):
+    print('#%d %s shape=%s dtype=%s rows=%d' % (
+        entry['seq'], entry['stage'], tuple(array.shape), array.dtype, entry['rows']))
+    values = as_2d(array)
+    columns = entry.get('columns') or [str(i) for i in range(values.shape[1])]
+    if np.issubdtype(values.dtype, np.number):
+        print('%-24s %14s %14s %14s %8s' % ('column', 'min', 'max', 'mean', 'nan'))
+        with np.errstate(all='ignore'):
+            for i, column in enumerate(columns):
+                col = values[:, i].astype(np.float64)
+                nan = int(np.isnan(col).sum())
+                if nan == len(col):
+                    print('%-24s %14s %14s %14s %8d' % (column, '-', '-', '-', nan))
+                else:
+                    print('%-24s %14.6g %14.6g %14.6g %8d' % (
+                        column, np.nanmin(col), np.nanmax(col), np.nanmean(col), nan))
+    print('\t'.join(columns))
+    for row in values[:rows]:
+        print('\t'.join(map(str, row)))
+
+
+def plot_snapshot(entry, array, file):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    values = as_2d(array)
+    columns = entry.get('columns') or [str(i) for i in range(values.shape[1])]
+    fig, ax = plt.subplots(figsize=(12, 4))
+    for i, column in enumerate(columns):
+        ax.plot(values[:, i], label=column, linewidth=0.8)
+    ax.set_title('#%d %s' % (entry['seq'], entry['stage']))
+    ax.legend(loc='upper left', fontsize='small')
+    fig.savefig(file, bbox_inches='tight')
+    plt.close(fig)
+
+
+def main():
+    if not args.model:
+        for model in list_models(args.dir):
+            print('%s (%d snapshots)' % (model, len(tracing.read_manifest(os.path.join(args.dir, model)))))
+        return
+
+    dir = tracing.snapshot_dir(args.model, args.dir)
+    entries = select(tracing.read_manifest(dir), args.show, args.stage)
+    if args.show is None and args.stage is None:
+        for e in entries:
+            print('#%-6d %-28s shape=%-18s rows=%-8d %s' % (
+                e['seq'], e['stage'], tuple(e['shape']), e['rows'], e['dtype']))
+        return
+
+    for e in entries:
+        array = tracing.load(dir, e)
+        print_snapshot(e, array, args.rows)
+        if args.tsv:
+            with open(args.tsv, mode='a') as f:
+                np.savetxt(f, as_2d(array), delimiter='\t', fmt='%s')
+        if args.plot:
+            plot_snapshot(e, array, args.plot)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Debug trace viewer')
+    parser.add_argument('model', nargs='?', default=None, help='traced model; lists the traced models if omitted')
+    parser.add_argument('--dir', default=cfg.app_trace)
+    parser.add_argument('--show', type=int, default=None, help='sequence number of a snapshot')
+    parser.add_argument('--stage', default=None, help='all the snapshots of a stage')
+    parser.add_argument('--rows', type=int, default=10, help='rows printed')
+    parser.add_argument('--tsv', default=None, help='appends the selected snapshots to a tsv file')
+    parser.add_argument('--plot', default=None, help='plots the selected snapshot to an image file')
+    args = parser.parse_args()
+    main()